@@ -5,6 +5,29 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import os
+from functools import partial
+from datastore.bitmaps import build_bitmap_index
+from datastore.cache import load_cached_csv, open_archive, read_csv
+from datastore.columns import projection, projection_key, usecols_matcher
+from datastore.costs import DEFAULT_UNIT_PRICE, apply_cost_model, cost_step
+from datastore.crossfilter import (
+    CNQ_COMPONENTS, cross_filter_measure, cross_filter_plan, describe_cross_filter,
+    empty_cross_filter, event_values, pick_values
+)
+from datastore.cube import build_cube, cube_cells, measure_mean
+from datastore.dates import register_date_index, sort_by_date
+from datastore.facets import FACETS, facet_counts, facet_options
+from datastore.metrics import ANALYTICS_METRICS, available_metrics, row_metrics, total_metrics
+from datastore.rollups import PERIOD_COLUMN, period_labels, time_rollups
+from datastore.rowmodel import ROW_BLOCK_SIZE, row_page, rows_token
+from datastore.selections import SelectionCache, selection_key
+from datastore.star import FACT, append_star, join_labels, split_star
+from datastore.schema import add_alias_views, compact_dtypes, fill_missing, memory_report, print_memory_report
+
+# Copy-on-write lets alias columns share their source buffers instead of
+# copying them (this is the default from pandas 3 on). Enabled once here, for
+# the whole app, rather than by the modules it imports
+pd.set_option('mode.copy_on_write', True)
 
 # Set page configuration
 st.set_page_config(
@@ -90,13 +113,188 @@ if 'show_warning' not in st.session_state:
 if 'rework_factor' not in st.session_state:
     st.session_state.rework_factor = 3
 
-# Data loading function
-@st.cache_data(ttl=600)
-def load_data(version=1):  # Add version parameter to force cache reset
-    """Load and preprocess the dataset from res.csv"""
-    # Force clear the cache
-    load_data.clear()
-    print("Cache cleared! Loading data with new CNQ calculation...")
+# Cross-filter picked on the dashboard charts (top 10 bars, CNQ component)
+if 'chart_cross_filter' not in st.session_state:
+    st.session_state.chart_cross_filter = empty_cross_filter()
+
+# Standardize column names for consistency based on the actual CSV columns
+COLUMN_MAPPING = {
+    'IDChaineMontage': 'Chaine',
+    'IDchainemontage': 'Chaine',  # Case sensitive match
+    'IDChaineMontage1': 'Chaine',
+    'IDChaineMontage2': 'Chaine',
+    'IDOperation': 'Operation',
+    'IDoperation': 'Operation',  # Case sensitive match
+    'IDOperation1': 'Operation',
+    'Operation': 'OperationName',
+    'IDControleur': 'Controleur',
+    'IDcontroleur': 'Controleur',  # Case sensitive match as mentioned by user
+    'Qtte': 'Quantite',
+    'Quantite': 'Quantite',
+    'Quantite2': 'Quantite2',
+    'QtteLct': 'QtteLct',
+    'QtteLct2': 'QtteLct2',
+    'QtteSondee': 'QtteSondee',
+    'NbrReclamations': 'NbrReclamations',
+    'DATE': 'DATE',
+    'DeuxiemeChoix': 'DeuxiemeChoix',
+    'Note': 'Note',
+    'ValeurOF': 'ValeurOF',
+    'Libelle': 'Libelle'
+}
+
+# Default parameters of the cost of non-quality (the rework factor is set in the filters)
+CNQ_COST_PARAMETERS = {
+    'rework_factor': 3,  # Rework time multiplier
+    'rework_cost': 50,  # Default cost per rework
+    'scrap_cost': 100,  # Default cost per scrapped item
+    'penalty_cost': 75,  # Default cost per penalty point
+    'unit_price': DEFAULT_UNIT_PRICE,  # Assumed price per unit
+    'max_percentage': 100  # Cap of the CNQ percentage
+}
+
+# CNQ = (Qté with defect × Rework cost per unit) + (Cut quantity × Scrap cost per unit) + (Sum of penalties per defect)
+def _unit_rework_cost(data, params):
+    # Unit time × hourly rate when known, fallback to old calculation
+    if 'temps' in data.columns and 'tauxhoraire' in data.columns:
+        return data['temps'] * data['tauxhoraire'] * params['rework_factor']
+    return params['rework_cost'] if 'NbrReclamations' in data.columns else 0
+
+def _rework(data, params):
+    if 'NbrReclamations' in data.columns:
+        return data['NbrReclamations'].fillna(0) * data['CoutRetoucheUnitaire']
+    return 0
+
+def _unit_scrap_cost(data, params):
+    # Use price as scrap cost per unit, fallback to old calculation
+    if 'prix' in data.columns:
+        return data['prix']
+    return params['scrap_cost'] if 'DeuxiemeChoix' in data.columns else 0
+
+def _scrap(data, params):
+    if 'DeuxiemeChoix' in data.columns:
+        return data['DeuxiemeChoix'].fillna(0) * data['CoutRebutUnitaire']
+    return 0
+
+def _penalty(data, params):
+    # Use direct penalty amount, fallback to penalty points
+    if 'MontantPenalite' in data.columns:
+        return data['MontantPenalite'].fillna(0)
+    if 'Note' in data.columns:
+        return data['Note'].fillna(0) * params['penalty_cost']
+    return 0
+
+def _total_cnq(data, params):
+    return data['Retouche'] + data['Rebut'] + data['Penalite']
+
+def _cnq_percentage(data, params):
+    if 'ValeurOF' in data.columns and data['ValeurOF'].sum() > 0:
+        # Use ValeurOF as the base for percentage calculation
+        percentage = (data['CNQ'] / data['ValeurOF'].replace(0, np.nan)) * 100
+    elif 'Quantite' in data.columns:
+        # Fallback to using quantity with assumed unit price
+        total_value = data['Quantite'].fillna(0) * params['unit_price']
+        percentage = (data['CNQ'] / total_value.replace(0, np.nan)) * 100
+    else:
+        return 0
+    # Cap the CNQ percentage at a reasonable maximum, rows without a base count as 0%
+    return percentage.clip(upper=params['max_percentage']).fillna(0)
+
+# Cost of non-quality components, recomputed from the loaded columns whenever a parameter changes
+CNQ_COST_MODEL = [
+    cost_step('CoutRetoucheUnitaire', _unit_rework_cost, parameters=['rework_factor', 'rework_cost']),
+    cost_step('Retouche', _rework, inputs=['CoutRetoucheUnitaire']),
+    cost_step('CoutRebutUnitaire', _unit_scrap_cost, parameters=['scrap_cost']),
+    cost_step('Rebut', _scrap, inputs=['CoutRebutUnitaire']),
+    cost_step('Penalite', _penalty, parameters=['penalty_cost']),
+    cost_step('CNQ', _total_cnq, inputs=['Retouche', 'Rebut', 'Penalite']),
+    cost_step('CNQ_Percentage', _cnq_percentage, parameters=['unit_price', 'max_percentage'], inputs=['CNQ'])
+]
+
+# Parse the CSV export into typed tables (this is what the columnar snapshot stores).
+# Appended records go through the same function, on their own.
+def parse_quality_csv(csv_path, columns=None, **read_kwargs):
+    """Read res.csv (only the given columns if any), type it and split it into fact and dimension tables"""
+    data = read_csv(csv_path, usecols=usecols_matcher(columns), **read_kwargs)
+    before = data.memory_usage(deep=True, index=False)
+    
+    # Convert date columns to datetime
+    if 'DATE' in data.columns:
+        data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
+    elif 'date' in data.columns:
+        data['DATE'] = pd.to_datetime(data['date'], errors='coerce')
+    
+    # Extract month and year for easy filtering
+    if 'DATE' in data.columns:
+        data['Month'] = data['DATE'].dt.month
+        data['Year'] = data['DATE'].dt.year
+    
+    data = compact_dtypes(data)
+    print_memory_report(memory_report(before, data))
+    
+    # Records repeated on every row move to deduplicated dimension tables
+    return split_star(data)
+
+def prepare_data(tables, columns=None):
+    """Join the cached tables of res.csv into the frame of the views, priced and indexed for the filters"""
+    # Join only the dimension columns this view uses, rows in date order
+    data = sort_by_date(join_labels(tables[FACT], tables, columns))
+    
+    # Standardize column names for consistency (aliases share the source columns)
+    add_alias_views(data, COLUMN_MAPPING)
+    
+    # Fill NaN values with 0 (IDs and labels are categorical and keep theirs)
+    fill_missing(data)
+    
+    # Get operation name if available
+    if 'Operation' in data.columns and 'Libelle' in data.columns:
+        data['OperationName'] = data['Libelle']
+    elif 'Operation' in data.columns and 'libelle' in data.columns:
+        data['OperationName'] = data['libelle']
+    elif 'operation' in data.columns:
+        data['Operation'] = data['operation']
+        data['OperationName'] = data['operation']
+    
+    # Cost columns are priced here, not parsed: a new rework factor only reprices them
+    data = apply_cost_model(data, CNQ_COST_MODEL, CNQ_COST_PARAMETERS)
+    
+    # Index the dates and filter values of the cached frame (repriced copies share its rows)
+    register_date_index(data)
+    build_bitmap_index(data)
+    return data
+
+def load_archive(columns=None):
+    """
+    Open res.csv's snapshot by year/month, restricted to a column projection if given
+
+    apply_date_filter reads only the months overlapping its range from the
+    archive, prepared like load_data's frame, instead of the whole history.
+
+    Args:
+        columns: Column projection, as for load_data
+
+    Returns:
+        DateArchive, or None when res.csv is missing
+    """
+    csv_path = "attached_assets/res.csv"
+    if not os.path.exists(csv_path):
+        csv_path = "res.csv"
+    if not os.path.exists(csv_path):
+        return None
+    
+    variant = f"app-{projection_key(columns)}"
+    archive = open_archive(csv_path, variant)
+    if archive is None:
+        # Write (or bring up to date) the snapshot first
+        load_cached_csv(csv_path, parse=partial(parse_quality_csv, columns=columns), variant=variant, append=append_star, partition_by='DATE')
+        archive = open_archive(csv_path, variant)
+    return archive.prepared(partial(prepare_data, columns=columns)) if archive is not None else None
+
+# Data loading function (one shared frame per process: cache_data would pickle
+# a copy on every rerun and lose the alias views)
+@st.cache_resource(ttl=600)
+def load_data(columns=None):
+    """Load and preprocess the dataset from res.csv, restricted to a column projection if given"""
     try:
         # First try the attached_assets path
         csv_path = "attached_assets/res.csv"
@@ -106,148 +304,18 @@ def load_data(version=1):  # Add version parameter to force cache reset
         
         if os.path.exists(csv_path):
             try:
-                print("Loading CSV file with new CNQ calculation (v2)...")
-                # Load with proper encoding detection
-                try:
-                    data = pd.read_csv(csv_path, encoding='utf-8')
-                except UnicodeDecodeError:
-                    data = pd.read_csv(csv_path, encoding='latin1')
-                    
-                # Ensure data types are correct
-                # Convert date columns to datetime
-                if 'DATE' in data.columns:
-                    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
-                elif 'date' in data.columns:
-                    data['DATE'] = pd.to_datetime(data['date'], errors='coerce')
-                
-                # Extract month and year for easy filtering
-                if 'DATE' in data.columns:
-                    data['Month'] = data['DATE'].dt.month
-                    data['Year'] = data['DATE'].dt.year
-                    
-                # Standardize column names for consistency based on the actual CSV columns
-                column_mapping = {
-                    'IDChaineMontage': 'Chaine',
-                    'IDchainemontage': 'Chaine',  # Case sensitive match
-                    'IDChaineMontage1': 'Chaine',
-                    'IDChaineMontage2': 'Chaine',
-                    'IDOperation': 'Operation',
-                    'IDoperation': 'Operation',  # Case sensitive match
-                    'IDOperation1': 'Operation',
-                    'Operation': 'OperationName',
-                    'IDControleur': 'Controleur',
-                    'IDcontroleur': 'Controleur',  # Case sensitive match as mentioned by user
-                    'Qtte': 'Quantite',
-                    'Quantite': 'Quantite',
-                    'Quantite2': 'Quantite2',
-                    'QtteLct': 'QtteLct',
-                    'QtteLct2': 'QtteLct2',
-                    'QtteSondee': 'QtteSondee',
-                    'NbrReclamations': 'NbrReclamations',
-                    'DATE': 'DATE',
-                    'DeuxiemeChoix': 'DeuxiemeChoix',
-                    'Note': 'Note',
-                    'ValeurOF': 'ValeurOF',
-                    'Libelle': 'Libelle'
-                }
-                
-                # Apply column mapping where columns exist
-                for old_col, new_col in column_mapping.items():
-                    if old_col in data.columns:
-                        data[new_col] = data[old_col]
-                
-                # Calculate CNQ components based on the NEW formula
-                # CNQ = (Qté with defect × Rework cost per unit) + (Cut quantity × Scrap cost per unit) + (Sum of penalties per defect)
-                
-                # Get rework factor from session state
-                rework_factor = st.session_state.rework_factor
-                
-                # 1. Rework cost calculation
-                # Check for temps (unit time) and tauxhoraire (hourly rate) columns
-                if 'temps' in data.columns and 'tauxhoraire' in data.columns:
-                    # Calculate unit rework cost
-                    data['CoutRetoucheUnitaire'] = data['temps'] * data['tauxhoraire'] * rework_factor
-                    
-                    # Calculate total rework cost if we have defect quantity
-                    if 'NbrReclamations' in data.columns:
-                        data['Retouche'] = data['NbrReclamations'].fillna(0) * data['CoutRetoucheUnitaire']
-                    else:
-                        data['Retouche'] = 0
-                else:
-                    # Fallback to old calculation
-                    if 'NbrReclamations' in data.columns:
-                        rework_cost = 50  # Default cost per rework
-                        data['CoutRetoucheUnitaire'] = rework_cost
-                        data['Retouche'] = data['NbrReclamations'].fillna(0) * rework_cost
-                    else:
-                        data['CoutRetoucheUnitaire'] = 0
-                        data['Retouche'] = 0
-                
-                # 2. Scrap cost calculation
-                # Check for prix (price) column
-                if 'prix' in data.columns:
-                    # Use price as scrap cost per unit
-                    data['CoutRebutUnitaire'] = data['prix']
-                    
-                    # Calculate total scrap cost if we have second choice quantity
-                    if 'DeuxiemeChoix' in data.columns:
-                        data['Rebut'] = data['DeuxiemeChoix'].fillna(0) * data['CoutRebutUnitaire']
-                    else:
-                        data['Rebut'] = 0
-                else:
-                    # Fallback to old calculation
-                    if 'DeuxiemeChoix' in data.columns:
-                        scrap_cost = 100  # Default cost per scrapped item
-                        data['CoutRebutUnitaire'] = scrap_cost
-                        data['Rebut'] = data['DeuxiemeChoix'].fillna(0) * scrap_cost
-                    else:
-                        data['CoutRebutUnitaire'] = 0
-                        data['Rebut'] = 0
-                
-                # 3. Penalty calculation
-                # Check for new penalty columns
-                if 'MontantPenalite' in data.columns:
-                    # Use direct penalty amount
-                    data['Penalite'] = data['MontantPenalite'].fillna(0)
-                else:
-                    # Fallback to old calculation
-                    if 'Note' in data.columns:
-                        penalty_cost = 75  # Default cost per penalty point
-                        data['Penalite'] = data['Note'].fillna(0) * penalty_cost
-                    else:
-                        data['Penalite'] = 0
-                
-                # Calculate total CNQ
-                data['CNQ'] = data['Retouche'] + data['Rebut'] + data['Penalite']
-                
-                # Calculate CNQ percentage - with reasonable limits
-                if 'ValeurOF' in data.columns and data['ValeurOF'].sum() > 0:
-                    # Use ValeurOF as the base for percentage calculation
-                    data['CNQ_Percentage'] = (data['CNQ'] / data['ValeurOF'].replace(0, np.nan)) * 100
-                elif 'Quantite' in data.columns:
-                    # Fallback to using quantity with assumed unit price
-                    unit_price = 100  # Assumed price per unit
-                    data['Quantite'] = data['Quantite'].fillna(0)
-                    total_value = data['Quantite'] * unit_price
-                    data['CNQ_Percentage'] = (data['CNQ'] / total_value.replace(0, np.nan)) * 100
-                else:
-                    data['CNQ_Percentage'] = 0
-
-                # Cap the CNQ percentage at a reasonable maximum (e.g., 100%)
-                data['CNQ_Percentage'] = data['CNQ_Percentage'].clip(upper=100)
-                
-                # Fill NaN values with 0
-                data = data.fillna(0)
-                
-                # Get operation name if available
-                if 'Operation' in data.columns and 'Libelle' in data.columns:
-                    data['OperationName'] = data['Libelle']
-                elif 'Operation' in data.columns and 'libelle' in data.columns:
-                    data['OperationName'] = data['libelle']
-                elif 'operation' in data.columns:
-                    data['Operation'] = data['operation']
-                    data['OperationName'] = data['operation']
-                
+                # Served from the Parquet snapshot (one file per month), only new records are parsed when the CSV grew
+                tables = load_cached_csv(
+                    csv_path,
+                    parse=partial(parse_quality_csv, columns=columns),
+                    variant=f"app-{projection_key(columns)}",
+                    append=append_star,
+                    partition_by='DATE'
+                )
+                data = prepare_data(tables, columns)
+                # Sums by day and dimensions, answering the dashboards' aggregates without the rows
+                # (after a reload, only the days with new or corrected records are summed again)
+                build_cube(data, source=f"{csv_path}:app-{projection_key(columns)}")
                 return data
                 
             except Exception as e:
@@ -261,7 +329,6 @@ def load_data(version=1):  # Add version parameter to force cache reset
         st.error(f"Unexpected error in load_data: {str(e)}")
         return create_sample_data()
 
-# Update the create_sample_data function to use the rework factor from session state
 def create_sample_data():
     """Create sample data for testing when CSV cannot be loaded"""
     st.warning("Using sample data with NEW CNQ calculation formula")
@@ -291,38 +358,32 @@ def create_sample_data():
     data['Year'] = data['DATE'].dt.year
     
     # Calculate CNQ components using NEW formula
-    rework_factor = st.session_state.rework_factor
-    
-    # 1. Rework cost calculation
-    data['CoutRetoucheUnitaire'] = data['temps'] * data['tauxhoraire'] * rework_factor
-    data['Retouche'] = data['NbrReclamations'] * data['CoutRetoucheUnitaire']
-    
-    # 2. Scrap cost calculation
-    data['CoutRebutUnitaire'] = data['prix']
-    data['Rebut'] = data['DeuxiemeChoix'] * data['CoutRebutUnitaire']
-    
-    # 3. Penalty calculation
-    data['Penalite'] = data['MontantPenalite']
-    
-    # Calculate total CNQ
-    data['CNQ'] = data['Retouche'] + data['Rebut'] + data['Penalite']
-    
-    # Calculate CNQ percentage with reasonable limits
-    unit_price = 100  # Assumed price per unit
-    total_value = data['Quantite'] * unit_price
-    data['CNQ_Percentage'] = (data['CNQ'] / total_value.replace(0, np.nan)) * 100
-    data['CNQ_Percentage'] = data['CNQ_Percentage'].clip(upper=100)  # Cap at 100%
-    
-    return data
+    return apply_cost_model(data, CNQ_COST_MODEL, CNQ_COST_PARAMETERS)
 
 # Import utility functions
 from utils import apply_date_filter, apply_categorical_filter, apply_numerical_filter
-from utils import apply_all_filters, calculate_aggregations, create_graph, create_gauge_chart
+from utils import all_filters_plan, apply_all_filters, calculate_aggregations, create_graph, create_gauge_chart
 
 # Function to dismiss warning
 def dismiss_warning():
     st.session_state.show_warning = False
 
+# Functions updating the charts' cross-filter. It is kept in the session rather
+# than read from the charts' selections, which Streamlit resets whenever a
+# chart's figure changes (as cross-filtering does).
+def pick_chart_values(key, dimension):
+    event = st.session_state.get(key) or {}
+    values = event_values(event.get("selection"), "x")
+    st.session_state.chart_cross_filter = pick_values(st.session_state.chart_cross_filter, dimension, values)
+
+def pick_chart_component():
+    component = st.session_state.get("chart_component")
+    st.session_state.chart_cross_filter = dict(st.session_state.chart_cross_filter, measure=CNQ_COMPONENTS.get(component))
+
+def clear_chart_selection():
+    st.session_state.chart_cross_filter = empty_cross_filter()
+    st.session_state.chart_component = None
+
 # Login page
 def login_page():
     # Display the logo at the top of the login page
@@ -457,6 +518,20 @@ def create_header():
             if st.button("✕", key="dismiss_warning"):
                 dismiss_warning()
 
+# Multiselect of a filter dropdown, offering the values reachable under the other filters
+def facet_multiselect(label, facet, counts):
+    """Multiselect of a facet's values, labelled with their rows; its selection survives option changes"""
+    key = f"filter_{facet}"
+    selected = [str(value) for value in st.session_state.get(key) or []]
+    options = facet_options(counts, selected)
+    return st.multiselect(
+        label,
+        options=options,
+        default=selected,
+        format_func=lambda value: f"{value} ({counts.get(value, 0)})",
+        key=key
+    )
+
 # Create filters
 def create_filters(data):
     with st.expander("Filters", expanded=True):
@@ -490,31 +565,28 @@ def create_filters(data):
                 max_value=max_date.date()
             )
         
+        # Values of the dropdowns still reachable under the date range and the
+        # other dropdowns, with their rows (counted from the bitmap index)
+        selections = {facet: st.session_state.get(f"filter_{facet}") or [] for facet in FACETS}
+        facets = facet_counts(data, dict(selections, start_date=start_date, end_date=end_date), all_filters_plan)
+        
         with col2:
             # Chain filter
             st.subheader("Chaîne")
-            if 'idchainemontage' in data.columns:
-                chain_options = sorted(data['idchainemontage'].astype(str).unique().tolist())
-                selected_chains = st.multiselect("Select chains", options=chain_options)
-            elif 'IDchainemontage' in data.columns:
-                chain_options = sorted(data['IDchainemontage'].astype(str).unique().tolist())
-                selected_chains = st.multiselect("Select chains", options=chain_options)
-            elif 'Chaine' in data.columns:
-                chain_options = sorted(data['Chaine'].astype(str).unique().tolist())
-                selected_chains = st.multiselect("Select chains", options=chain_options)
+            if 'chains' in facets:
+                selected_chains = facet_multiselect("Select chains", 'chains', facets['chains'])
             else:
                 st.warning("No chain data available")
                 selected_chains = []
         
         # Additional filters (second row)
-        col3, col4 = st.columns(2)
+        col3, col4, col5 = st.columns(3)
         
         with col3:
             # Operation filter
             st.subheader("Opération")
-            if 'Operation' in data.columns:
-                operation_options = sorted(data['Operation'].astype(str).unique().tolist())
-                selected_operations = st.multiselect("Select operations", options=operation_options)
+            if 'operations' in facets:
+                selected_operations = facet_multiselect("Select operations", 'operations', facets['operations'])
             else:
                 st.warning("No operation data available")
                 selected_operations = []
@@ -522,22 +594,21 @@ def create_filters(data):
         with col4:
             # Controller filter
             st.subheader("Contrôleur")
-            if 'idcontroleur' in data.columns:
-                controller_options = sorted(data['idcontroleur'].astype(str).unique().tolist())
-                selected_controllers = st.multiselect("Select controllers", options=controller_options)
-            elif 'IDcontroleur' in data.columns:
-                controller_options = sorted(data['IDcontroleur'].astype(str).unique().tolist())
-                selected_controllers = st.multiselect("Select controllers", options=controller_options)
-            elif 'IDControleur' in data.columns:
-                controller_options = sorted(data['IDControleur'].astype(str).unique().tolist())
-                selected_controllers = st.multiselect("Select controllers", options=controller_options)
-            elif 'Controleur' in data.columns:
-                controller_options = sorted(data['Controleur'].astype(str).unique().tolist())
-                selected_controllers = st.multiselect("Select controllers", options=controller_options)
+            if 'controllers' in facets:
+                selected_controllers = facet_multiselect("Select controllers", 'controllers', facets['controllers'])
             else:
                 st.warning("No controller data available")
                 selected_controllers = []
         
+        with col5:
+            # Category filter
+            st.subheader("Catégorie")
+            if 'categories' in facets:
+                selected_categories = facet_multiselect("Select categories", 'categories', facets['categories'])
+            else:
+                st.warning("No category data available")
+                selected_categories = []
+        
         # Advanced filters
         st.subheader("Metric Filters")
         adv_col1, adv_col2, adv_col3, adv_col4 = st.columns(4)
@@ -559,10 +630,8 @@ def create_filters(data):
             # Update session state
             if rework_factor != st.session_state.rework_factor:
                 st.session_state.rework_factor = rework_factor
-                # Force data reload when factor changes
-                if st.button("Appliquer le nouveau facteur retouche"):
-                    st.cache_data.clear()
-                    st.rerun()
+                # Reprice the rework costs on the loaded data, nothing is reloaded
+                st.rerun()
     
     # Return filter values
     filters = {
@@ -571,6 +640,7 @@ def create_filters(data):
         "chains": selected_chains,
         "operations": selected_operations,
         "controllers": selected_controllers,
+        "categories": selected_categories,
         "cnq_min": cnq_min if cnq_min > 0 else None,
         "cnq_max": cnq_max if cnq_max > 0 else None,
         "cnq_pct_min": cnq_pct_min if cnq_pct_min > 0 else None,
@@ -591,12 +661,12 @@ def create_metrics(filtered_data):
         cnq_percentage = (filtered_data['CNQ'].sum() / filtered_data['ValeurOF'].sum()) * 100
     elif 'Quantite' in filtered_data.columns and filtered_data['Quantite'].sum() > 0:
         # Fallback to using quantity with assumed unit price
-        unit_price = 100  # Assumed price per unit
+        unit_price = CNQ_COST_PARAMETERS['unit_price']  # Assumed price per unit
         total_value = filtered_data['Quantite'].sum() * unit_price
         cnq_percentage = (filtered_data['CNQ'].sum() / total_value) * 100
     else:
         # Use the pre-calculated percentage if available
-        cnq_percentage = filtered_data['CNQ_Percentage'].mean() if 'CNQ_Percentage' in filtered_data.columns else 0
+        cnq_percentage = measure_mean(filtered_data, 'CNQ_Percentage') if 'CNQ_Percentage' in filtered_data.columns else 0
 
     # Cap the percentage at a reasonable maximum
     cnq_percentage = min(cnq_percentage, 100)
@@ -606,8 +676,8 @@ def create_metrics(filtered_data):
     penalite = filtered_data['Penalite'].sum() if 'Penalite' in filtered_data.columns else 0
     
     # Get average costs per unit
-    cout_retouche_unitaire = filtered_data['CoutRetoucheUnitaire'].mean() if 'CoutRetoucheUnitaire' in filtered_data.columns else 0
-    cout_rebut_unitaire = filtered_data['CoutRebutUnitaire'].mean() if 'CoutRebutUnitaire' in filtered_data.columns else 0
+    cout_retouche_unitaire = measure_mean(filtered_data, 'CoutRetoucheUnitaire') if 'CoutRetoucheUnitaire' in filtered_data.columns else 0
+    cout_rebut_unitaire = measure_mean(filtered_data, 'CoutRebutUnitaire') if 'CoutRebutUnitaire' in filtered_data.columns else 0
     
     # Display calculation summary
     st.markdown("### CNQ Calculation Summary")
@@ -654,8 +724,23 @@ def create_metrics(filtered_data):
         "cout_rebut_unitaire": cout_rebut_unitaire
     }
 
+# Lines of the CNQ components not picked on the pie are only in the legend
+def focus_component_lines(line_fig, measure):
+    if measure != 'CNQ':
+        line_fig.for_each_trace(lambda trace: trace.update(visible='legendonly') if trace.name not in ('CNQ', measure) else None)
+
 # Create main dashboard charts
-def create_dashboard_charts(filtered_data, metrics):
+def create_dashboard_charts(filtered_data, metrics, cross=None, chart_data=None):
+    # Measure the charts focus on (the CNQ component picked on the pie, if any)
+    cross = cross or empty_cross_filter()
+    measure = cross_filter_measure(cross)
+    
+    # Data of a top 10 tab: cross-filtered on every chart but its own
+    def category_data(column):
+        if chart_data is None or column not in cross['dimensions']:
+            return filtered_data
+        return chart_data(column)
+    
     # Create 2x2 grid for charts
     row1_col1, row1_col2 = st.columns(2)
     
@@ -672,9 +757,9 @@ def create_dashboard_charts(filtered_data, metrics):
             max_acceptable_cnq = max(10000, metrics["total_cnq"] * 2)
         
         gauge_fig = create_gauge_chart(
-            value=metrics["total_cnq"],
+            value=metrics["total_cnq"] if measure == 'CNQ' else filtered_data[measure].sum(),
             max_val=max_acceptable_cnq,
-            title="CNQ Cumulé"
+            title=f"{measure} Cumulé"
         )
         st.plotly_chart(gauge_fig, use_container_width=True)
     
@@ -704,6 +789,10 @@ def create_dashboard_charts(filtered_data, metrics):
                 color_discrete_sequence=px.colors.qualitative.Plotly
             )
             
+            # Pull out the picked component
+            if cross['measure']:
+                pie_fig.update_traces(pull=[0.1 if CNQ_COMPONENTS[label] == cross['measure'] else 0 for label in labels])
+            
             # Update layout
             pie_fig.update_layout(
                 paper_bgcolor='rgba(0,0,0,0)',
@@ -712,6 +801,15 @@ def create_dashboard_charts(filtered_data, metrics):
             )
         
         st.plotly_chart(pie_fig, use_container_width=True)
+        
+        # Pie slices emit no selection events: the component is picked here
+        st.segmented_control(
+            "Composante",
+            list(CNQ_COMPONENTS),
+            key="chart_component",
+            on_change=pick_chart_component,
+            label_visibility="collapsed"
+        )
     
     # Line chart for trends
     st.markdown("### Courbe tendance de l'historique CNQ")
@@ -725,18 +823,12 @@ def create_dashboard_charts(filtered_data, metrics):
             with tab:
                 st.warning("Pas de données disponibles pour l'historique")
     else:
+        # Day, week and month series, summed once for the three tabs
+        rollups = time_rollups(filtered_data, ['CNQ', 'Retouche', 'Rebut', 'Penalite'], grains=['day', 'week', 'month'])
+        
         # Day trend
         with time_period_tabs[0]:
-            filtered_data_copy = filtered_data.copy()
-            filtered_data_copy['TimePeriod'] = filtered_data_copy['DATE'].dt.date
-            
-            # Aggregate data by time period
-            trend_data = filtered_data_copy.groupby('TimePeriod').agg({
-                'CNQ': 'sum',
-                'Retouche': 'sum',
-                'Rebut': 'sum',
-                'Penalite': 'sum'
-            }).reset_index()
+            trend_data = rollups['day'].rename(columns={PERIOD_COLUMN: 'TimePeriod'})
             
             # Create line chart
             line_fig = px.line(
@@ -747,15 +839,17 @@ def create_dashboard_charts(filtered_data, metrics):
                 template="plotly_dark"
             )
             
-            # Add moving average for CNQ
+            focus_component_lines(line_fig, measure)
+            
+            # Add moving average for CNQ (or the picked component)
             window_size = 3 if len(trend_data) >= 3 else len(trend_data)
             if window_size > 0:
-                trend_data['CNQ_MA'] = trend_data['CNQ'].rolling(window=window_size, min_periods=1).mean()
+                trend_data['CNQ_MA'] = trend_data[measure].rolling(window=window_size, min_periods=1).mean()
                 line_fig.add_scatter(
                     x=trend_data['TimePeriod'],
                     y=trend_data['CNQ_MA'],
                     mode='lines',
-                    name=f'CNQ (Moyenne mobile sur {window_size})',
+                    name=f'{measure} (Moyenne mobile sur {window_size})',
                     line=dict(color='white', width=2, dash='dot')
                 )
             
@@ -772,18 +866,9 @@ def create_dashboard_charts(filtered_data, metrics):
         
         # Week trend
         with time_period_tabs[1]:
-            filtered_data_copy = filtered_data.copy()
-            # Convert date to week
-            filtered_data_copy['TimePeriod'] = filtered_data_copy['DATE'].dt.isocalendar().week
-            filtered_data_copy['Year_Week'] = filtered_data_copy['DATE'].dt.year.astype(str) + '-W' + filtered_data_copy['TimePeriod'].astype(str)
-            
-            # Aggregate data by time period
-            trend_data = filtered_data_copy.groupby('Year_Week').agg({
-                'CNQ': 'sum',
-                'Retouche': 'sum',
-                'Rebut': 'sum',
-                'Penalite': 'sum'
-            }).reset_index()
+            # ISO weeks, in date order
+            trend_data = rollups['week'].copy()
+            trend_data['Year_Week'] = period_labels(trend_data[PERIOD_COLUMN], 'week')
             
             # Create line chart
             line_fig = px.line(
@@ -794,15 +879,17 @@ def create_dashboard_charts(filtered_data, metrics):
                 template="plotly_dark"
             )
             
-            # Add moving average for CNQ
+            focus_component_lines(line_fig, measure)
+            
+            # Add moving average for CNQ (or the picked component)
             window_size = 3 if len(trend_data) >= 3 else len(trend_data)
             if window_size > 0:
-                trend_data['CNQ_MA'] = trend_data['CNQ'].rolling(window=window_size, min_periods=1).mean()
+                trend_data['CNQ_MA'] = trend_data[measure].rolling(window=window_size, min_periods=1).mean()
                 line_fig.add_scatter(
                     x=trend_data['Year_Week'],
                     y=trend_data['CNQ_MA'],
                     mode='lines',
-                    name=f'CNQ (Moyenne mobile sur {window_size})',
+                    name=f'{measure} (Moyenne mobile sur {window_size})',
                     line=dict(color='white', width=2, dash='dot')
                 )
             
@@ -819,17 +906,8 @@ def create_dashboard_charts(filtered_data, metrics):
         
         # Month trend
         with time_period_tabs[2]:
-            filtered_data_copy = filtered_data.copy()
-            # Convert date to month
-            filtered_data_copy['MonthYear'] = filtered_data_copy['DATE'].dt.strftime('%Y-%m')
-            
-            # Aggregate data by time period
-            trend_data = filtered_data_copy.groupby('MonthYear').agg({
-                'CNQ': 'sum',
-                'Retouche': 'sum',
-                'Rebut': 'sum',
-                'Penalite': 'sum'
-            }).reset_index()
+            trend_data = rollups['month'].copy()
+            trend_data['MonthYear'] = period_labels(trend_data[PERIOD_COLUMN], 'month')
             
             # Create line chart
             line_fig = px.line(
@@ -840,15 +918,17 @@ def create_dashboard_charts(filtered_data, metrics):
                 template="plotly_dark"
             )
             
-            # Add moving average for CNQ
+            focus_component_lines(line_fig, measure)
+            
+            # Add moving average for CNQ (or the picked component)
             window_size = 3 if len(trend_data) >= 3 else len(trend_data)
             if window_size > 0:
-                trend_data['CNQ_MA'] = trend_data['CNQ'].rolling(window=window_size, min_periods=1).mean()
+                trend_data['CNQ_MA'] = trend_data[measure].rolling(window=window_size, min_periods=1).mean()
                 line_fig.add_scatter(
                     x=trend_data['MonthYear'],
                     y=trend_data['CNQ_MA'],
                     mode='lines',
-                    name=f'CNQ (Moyenne mobile sur {window_size})',
+                    name=f'{measure} (Moyenne mobile sur {window_size})',
                     line=dict(color='white', width=2, dash='dot')
                 )
             
@@ -881,22 +961,22 @@ def create_dashboard_charts(filtered_data, metrics):
             
         if chain_col:
             # Group by Chain and calculate metrics
-            top_data = filtered_data.groupby(chain_col).agg({
+            top_data = category_data(chain_col).groupby(chain_col, observed=True).agg({
                 'CNQ': 'sum',
                 'Retouche': 'sum',
                 'Rebut': 'sum',
                 'Penalite': 'sum'
             }).reset_index()
             
-            # Sort by CNQ descending and take top 10
-            top_data = top_data.sort_values('CNQ', ascending=False).head(10)
+            # Sort by CNQ (or the picked component) descending and take top 10
+            top_data = top_data.sort_values(measure, ascending=False).head(10)
             
             # Create horizontal bar chart - SWITCHED X AND Y AXES
             bar_fig = px.bar(
                 top_data,
                 x=chain_col,
                 y=['Retouche', 'Rebut', 'Penalite'],
-                title="Top 10 Chaînes par CNQ",
+                title=f"Top 10 Chaînes par {measure}",
                 template="plotly_dark",
                 orientation='v',
                 barmode='stack'
@@ -910,7 +990,18 @@ def create_dashboard_charts(filtered_data, metrics):
                 height=400
             )
             
-            st.plotly_chart(bar_fig, use_container_width=True)
+            # Picking bars (click or box) cross-filters the other charts; picked bars stand out
+            picked = set(cross['dimensions'].get(chain_col, []))
+            if picked:
+                bar_fig.update_traces(marker_opacity=[1 if str(value) in picked else 0.35 for value in top_data[chain_col]])
+            
+            st.plotly_chart(
+                bar_fig,
+                use_container_width=True,
+                key="top_chain_chart",
+                on_select=lambda: pick_chart_values("top_chain_chart", chain_col),
+                selection_mode=("points", "box")
+            )
         else:
             st.warning("Pas de données disponibles pour Chaîne")
     
@@ -918,22 +1009,22 @@ def create_dashboard_charts(filtered_data, metrics):
     with category_tabs[1]:
         if 'IDOperation' in filtered_data.columns and not filtered_data.empty:
             # Group by Operation and calculate metrics
-            top_data = filtered_data.groupby('IDOperation').agg({
+            top_data = category_data('IDOperation').groupby('IDOperation', observed=True).agg({
                 'CNQ': 'sum',
                 'Retouche': 'sum',
                 'Rebut': 'sum',
                 'Penalite': 'sum'
             }).reset_index()
             
-            # Sort by CNQ descending and take top 10
-            top_data = top_data.sort_values('CNQ', ascending=False).head(10)
+            # Sort by CNQ (or the picked component) descending and take top 10
+            top_data = top_data.sort_values(measure, ascending=False).head(10)
             
             # Create horizontal bar chart - SWITCHED X AND Y AXES
             bar_fig = px.bar(
                 top_data,
                 x='IDOperation',
                 y=['Retouche', 'Rebut', 'Penalite'],
-                title="Top 10 Opérations par CNQ",
+                title=f"Top 10 Opérations par {measure}",
                 template="plotly_dark",
                 orientation='v',
                 barmode='stack'
@@ -947,7 +1038,18 @@ def create_dashboard_charts(filtered_data, metrics):
                 height=400
             )
             
-            st.plotly_chart(bar_fig, use_container_width=True)
+            # Picking bars (click or box) cross-filters the other charts; picked bars stand out
+            picked = set(cross['dimensions'].get('IDOperation', []))
+            if picked:
+                bar_fig.update_traces(marker_opacity=[1 if str(value) in picked else 0.35 for value in top_data['IDOperation']])
+            
+            st.plotly_chart(
+                bar_fig,
+                use_container_width=True,
+                key="top_operation_chart",
+                on_select=lambda: pick_chart_values("top_operation_chart", 'IDOperation'),
+                selection_mode=("points", "box")
+            )
         else:
             st.warning("Pas de données disponibles pour Opération")
     
@@ -965,22 +1067,22 @@ def create_dashboard_charts(filtered_data, metrics):
             
         if controller_col:
             # Group by Controller and calculate metrics
-            top_data = filtered_data.groupby(controller_col).agg({
+            top_data = category_data(controller_col).groupby(controller_col, observed=True).agg({
                 'CNQ': 'sum',
                 'Retouche': 'sum',
                 'Rebut': 'sum',
                 'Penalite': 'sum'
             }).reset_index()
             
-            # Sort by CNQ descending and take top 10
-            top_data = top_data.sort_values('CNQ', ascending=False).head(10)
+            # Sort by CNQ (or the picked component) descending and take top 10
+            top_data = top_data.sort_values(measure, ascending=False).head(10)
             
             # Create horizontal bar chart - SWITCHED X AND Y AXES
             bar_fig = px.bar(
                 top_data,
                 x=controller_col,
                 y=['Retouche', 'Rebut', 'Penalite'],
-                title="Top 10 Contrôleurs par CNQ",
+                title=f"Top 10 Contrôleurs par {measure}",
                 template="plotly_dark",
                 orientation='v',
                 barmode='stack'
@@ -994,10 +1096,44 @@ def create_dashboard_charts(filtered_data, metrics):
                 height=400
             )
             
-            st.plotly_chart(bar_fig, use_container_width=True)
+            # Picking bars (click or box) cross-filters the other charts; picked bars stand out
+            picked = set(cross['dimensions'].get(controller_col, []))
+            if picked:
+                bar_fig.update_traces(marker_opacity=[1 if str(value) in picked else 0.35 for value in top_data[controller_col]])
+            
+            st.plotly_chart(
+                bar_fig,
+                use_container_width=True,
+                key="top_controller_chart",
+                on_select=lambda: pick_chart_values("top_controller_chart", controller_col),
+                selection_mode=("points", "box")
+            )
         else:
             st.warning("Pas de données disponibles pour Contrôleur")
 
+# Sorted, filtered pages of the analytics results (shared by the sessions;
+# the results themselves stay in each session's state)
+@st.cache_resource
+def analytics_rows_cache():
+    """Cache of the orders and pages of the analytics results"""
+    return SelectionCache()
+
+def analytics_rows_request(table, sort_column, descending, filter_column, filter_value):
+    """Sort and filter models of the analytics table, in the grid's request format"""
+    request = {'sortModel': [], 'filterModel': {}}
+    if sort_column:
+        request['sortModel'].append({'colId': sort_column, 'sort': 'desc' if descending else 'asc'})
+    if filter_column and filter_value:
+        if pd.api.types.is_numeric_dtype(table[filter_column]):
+            # Numeric columns: the value is a lower bound
+            try:
+                request['filterModel'][filter_column] = {'filterType': 'number', 'type': 'greaterThanOrEqual', 'filter': float(filter_value)}
+            except ValueError:
+                st.warning(f"{filter_value} n'est pas un nombre")
+        else:
+            request['filterModel'][filter_column] = {'filterType': 'text', 'type': 'contains', 'filter': filter_value}
+    return request
+
 # Create analytics page
 def create_analytics_page(data):
     # Create header
@@ -1018,7 +1154,7 @@ def create_analytics_page(data):
     
     with col1:
         # Available metrics
-        metrics_options = [col for col in ['CNQ', 'CNQ_Percentage', 'Retouche', 'Rebut', 'Penalite'] if col in data.columns]
+        metrics_options = available_metrics(data, ANALYTICS_METRICS)
         selected_metrics = st.multiselect(
             "Métriques",
             options=metrics_options,
@@ -1088,21 +1224,14 @@ def create_analytics_page(data):
     # Apply analytics when button is clicked
     if apply_button:
         if not filtered_data.empty and selected_metrics and selected_group_by:
-            # Calculate aggregations
-            aggregated_data = calculate_aggregations(filtered_data, selected_group_by, selected_metrics)
-            
-            # Sort by the first metric in descending order
+            # Calculate aggregations, the top groups by the first metric (descending) within the limit if specified
             sort_by = selected_metrics[0] if selected_metrics else None
-            if sort_by and sort_by in aggregated_data.columns:
-                aggregated_data = aggregated_data.sort_values(by=sort_by, ascending=False)
-            
-            # Apply limit if specified
-            if limit and limit > 0:
-                aggregated_data = aggregated_data.head(limit)
+            aggregated_data = calculate_aggregations(filtered_data, selected_group_by, selected_metrics, sort_by=sort_by, limit=limit)
             
-            # Store results
+            # Store results, with the query they answer (to cache their pages)
             st.session_state.analytics_results = {
                 "aggregated_data": aggregated_data,
+                "query": [selection_key(all_filters_plan(data, filters)), selected_group_by, selected_metrics, limit],
                 "chart_type": chart_type,
                 "metrics": selected_metrics,
                 "group_by": selected_group_by
@@ -1217,17 +1346,20 @@ def create_analytics_page(data):
             if not aggregated_data.empty:
                 st.markdown("### Statistiques des métriques")
                 
-                # Create summary table
+                # Create summary table: the total over all the filtered rows (ratios
+                # like %CNQ are ratios of the totals), the other statistics over the rows
                 summary_data = []
+                totals = total_metrics(filtered_data, metrics)
+                rows = row_metrics(filtered_data, metrics)
                 
                 for metric in metrics:
-                    if metric in filtered_data.columns:
+                    if metric in totals.index:
                         # Calculate statistics
-                        total = filtered_data[metric].sum()
-                        mean = filtered_data[metric].mean()
-                        median = filtered_data[metric].median()
-                        min_val = filtered_data[metric].min()
-                        max_val = filtered_data[metric].max()
+                        total = totals[metric]
+                        mean = rows[metric].mean()
+                        median = rows[metric].median()
+                        min_val = rows[metric].min()
+                        max_val = rows[metric].max()
                         
                         # Add to summary
                         summary_data.append({
@@ -1241,12 +1373,40 @@ def create_analytics_page(data):
                 
                 # Display summary table
                 st.table(pd.DataFrame(summary_data))
+                st.caption("Total sur l'ensemble des enregistrements filtrés ; moyenne, médiane, min et max par enregistrement")
         
         with table_tab:
             # Show data table
             if not aggregated_data.empty:
+                # Sort and filter options, applied server-side
+                columns = list(aggregated_data.columns)
+                sort_col, order_col, filter_col, value_col = st.columns(4)
+                with sort_col:
+                    sort_column = st.selectbox("Trier par", options=[None] + columns, format_func=lambda x: "Classement" if x is None else x, key="analytics_sort")
+                with order_col:
+                    descending = st.selectbox("Ordre", options=[True, False], format_func=lambda x: "Décroissant" if x else "Croissant", key="analytics_order")
+                with filter_col:
+                    filter_column = st.selectbox("Filtrer", options=[None] + columns, format_func=lambda x: "Aucun filtre" if x is None else x, key="analytics_filter")
+                with value_col:
+                    filter_value = st.text_input("Valeur", key="analytics_filter_value")
+                request = analytics_rows_request(aggregated_data, sort_column, descending, filter_column, filter_value)
+                
+                # Only the page shown is sent to the browser (pages cached per query, sort and filter,
+                # read from the session's result however large it is)
+                cache = analytics_rows_cache()
+                token = rows_token(results["query"])
+                rows, count = row_page(cache, token, dict(request, startRow=0, endRow=ROW_BLOCK_SIZE), aggregated_data)
+                pages = max(1, -(-count // ROW_BLOCK_SIZE))
+                page = 1
+                if pages > 1:
+                    page = st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, value=1, step=1, key="analytics_page")
+                    if page > 1:
+                        rows, _ = row_page(cache, token, dict(request, startRow=(page - 1) * ROW_BLOCK_SIZE, endRow=page * ROW_BLOCK_SIZE), aggregated_data)
+                
                 st.markdown(f"Affichage de {len(aggregated_data)} résultats sur {len(filtered_data)} enregistrements filtrés")
-                st.dataframe(aggregated_data, use_container_width=True)
+                if count < len(aggregated_data):
+                    st.caption(f"{count} résultats après filtrage")
+                st.dataframe(rows, use_container_width=True, hide_index=True)
             else:
                 st.warning("No data available to display")
     else:
@@ -1392,10 +1552,30 @@ def create_reports_page(data):
             # In a real implementation, would use a library like ReportLab to create PDFs
 
 # Import tactical dashboard
-from tactical_dashboard import create_tactical_dashboard
+from tactical_dashboard import create_tactical_dashboard, TACTICAL_COLUMNS
 
 # Import operational dashboard
-from operational_dashboard import create_operational_dashboard
+from operational_dashboard import create_operational_dashboard, OPERATIONAL_COLUMNS
+
+# Columns read by the strategic dashboard (filters, metric cards and charts)
+STRATEGIC_COLUMNS = [
+    'DATE', 'idchainemontage', 'IDchainemontage', 'Chaine', 'IDOperation', 'Operation',
+    'idcontroleur', 'IDcontroleur', 'IDControleur', 'Controleur', 'Categorie', 'Quantite', 'ValeurOF',
+    'CNQ', 'CNQ_Percentage', 'Retouche', 'Rebut', 'Penalite',
+    'CoutRetoucheUnitaire', 'CoutRebutUnitaire'
+]
+
+# Column manifest of the page about to be displayed
+def view_columns():
+    """Return the columns to load for the current page (None loads every column)"""
+    if st.session_state.current_page in ("analytics", "reports"):
+        # Free-form analysis pages let the user pick any column
+        return None
+    if st.session_state.dashboard_type == "tactical":
+        return projection(TACTICAL_COLUMNS)
+    if st.session_state.dashboard_type == "operational":
+        return projection(OPERATIONAL_COLUMNS)
+    return projection(STRATEGIC_COLUMNS)
 
 # Dashboard page
 def dashboard_page(data):
@@ -1414,31 +1594,44 @@ def dashboard_page(data):
         # Create filters
         filters = create_filters(data)
         
-        # Apply filters
-        filtered_data = apply_all_filters(data, filters)
+        # Apply filters and the charts' cross-filter (but the picks of one chart, for that chart):
+        # the charts only need sums and means, answered from the cube's cells when it can
+        cross = st.session_state.chart_cross_filter
+        def chart_data(exclude=None):
+            plan = cross_filter_plan(all_filters_plan(data, filters), cross, exclude)
+            cells = cube_cells(plan)
+            return cells if cells is not None else plan.apply()
+        filtered_data = chart_data()
         
         # Dashboard title and description
         st.markdown("## Dashboard Vue d'ensemble")
         st.markdown("Tableau de bord montrant les KPIs et indicateurs clés de performance qualité")
         
+        # Picks of the charts, applied to the other charts
+        description = describe_cross_filter(cross)
+        if description:
+            status_col, clear_col = st.columns([5, 1])
+            status_col.info(f"Sélection des graphiques: {description}")
+            clear_col.button("Effacer la sélection", on_click=clear_chart_selection)
+        
         # Create metrics
         metrics_values = create_metrics(filtered_data)
         
         # Create dashboard charts
-        create_dashboard_charts(filtered_data, metrics_values)
+        create_dashboard_charts(filtered_data, metrics_values, cross, chart_data)
 
 # Main app
 def main():
-    # Clear all caches on startup
-    st.cache_data.clear()
-    
-    # Load data with version parameter to force cache reset
-    data = load_data(version=10)  # Use a higher version number
-    
     # Show appropriate page based on authentication status and current page
     if not st.session_state.authenticated:
         login_page()
     else:
+        # Load only the columns this page displays
+        data = load_data(columns=view_columns())
+        
+        # Reprice with the session's rework factor (only the rework cost columns are recomputed)
+        data = apply_cost_model(data, CNQ_COST_MODEL, {'rework_factor': st.session_state.rework_factor})
+        
         # Create sidebar for navigation
         create_sidebar()
         
@@ -1,11 +1,43 @@
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, MATCH
+from dash import dcc
 from dash.exceptions import PreventUpdate
 from dash_ag_grid import AgGrid
 import plotly.express as px
 import pandas as pd
 import html
+from datastore.filters import FilterPlan
+from datastore.rowmodel import ROW_BLOCK_SIZE, ROW_TABLE_BYTES, publish_rows, rows_response
+from datastore.selections import selection_cache
 
 def register_analytics_callbacks(app, data):
+    # Results shown by the grids, kept server-side (in a cache of their own,
+    # never evicted by the orders and pages of the selections' cache)
+    cache = selection_cache(app.server)
+    tables = selection_cache(app.server, ROW_TABLE_BYTES, extension='analytics_tables')
+    
+    def analytics_rows(query):
+        """Filtered (and grouped) rows of an analysis query"""
+        start_date, end_date, chains, operations, metrics, groupby = query
+        
+        # Filter data
+        plan = FilterPlan(data).isin('Chaine', chains, as_str=False).isin('Operation', operations, as_str=False)
+        if start_date and end_date:
+            plan.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date))
+        filtered_data = plan.apply()
+        
+        # Group data if groupby is specified
+        if groupby:
+            # Prepare metrics for aggregation
+            agg_dict = {}
+            if metrics:
+                for metric in metrics:
+                    agg_dict[metric] = 'sum'
+            
+            # Group the data
+            return filtered_data.groupby(groupby).agg(agg_dict).reset_index()
+        # Use filtered data as is
+        return filtered_data
+    
     @app.callback(
         [Output('analytics-table', 'children'),
          Output('analytics-summary', 'children'),
@@ -23,47 +55,30 @@ def register_analytics_callbacks(app, data):
             raise PreventUpdate
             
         try:
-            # Filter data
-            filtered_data = data.copy()
-            
-            if start_date and end_date:
-                filtered_data = filtered_data[
-                    (filtered_data['DATE'] >= pd.to_datetime(start_date)) &
-                    (filtered_data['DATE'] <= pd.to_datetime(end_date))
-                ]
-            
-            if chains:
-                filtered_data = filtered_data[filtered_data['Chaine'].isin(chains)]
-            
-            if operations:
-                filtered_data = filtered_data[filtered_data['Operation'].isin(operations)]
-            
-            # Group data if groupby is specified
-            if groupby:
-                # Prepare metrics for aggregation
-                agg_dict = {}
-                if metrics:
-                    for metric in metrics:
-                        agg_dict[metric] = 'sum'
-                
-                # Group the data
-                result_data = filtered_data.groupby(groupby).agg(agg_dict).reset_index()
-            else:
-                # Use filtered data as is
-                result_data = filtered_data
-            
-            # Create table
-            table = AgGrid(
-                rowData=result_data.to_dict('records'),
+            # Filter (and group) data
+            query = [start_date, end_date, chains, operations, metrics, groupby]
+            result_data = analytics_rows(query)
+            
+            # Create table: the grid fetches its visible blocks of rows from
+            # serve_analytics_rows instead of receiving the whole result; the
+            # query is kept with it to compute the result again when evicted
+            token = publish_rows(tables, result_data, query)
+            table = [dcc.Store(id={'type': 'analytics-query', 'query': token}, data=query), AgGrid(
+                id={'type': 'analytics-grid', 'query': token},
                 columnDefs=[{"field": i} for i in result_data.columns],
                 defaultColDef={
                     "resizable": True,
                     "sortable": True,
                     "filter": True
                 },
-                dashGridOptions={"pagination": True},
+                rowModelType="infinite",
+                dashGridOptions={
+                    "pagination": True,
+                    "paginationPageSize": ROW_BLOCK_SIZE,
+                    "cacheBlockSize": ROW_BLOCK_SIZE
+                },
                 className="ag-theme-alpine-dark"
-            )
+            )]
             
             # Create summary
             summary_stats = []
@@ -114,6 +129,24 @@ def register_analytics_callbacks(app, data):
             print(f"Error in analytics callback: {str(e)}")
             return None, html.Div("Error processing data"), {}
     
+    @app.callback(
+        Output({'type': 'analytics-grid', 'query': MATCH}, 'getRowsResponse'),
+        [Input({'type': 'analytics-grid', 'query': MATCH}, 'getRowsRequest')],
+        [State({'type': 'analytics-grid', 'query': MATCH}, 'id'),
+         State({'type': 'analytics-query', 'query': MATCH}, 'data')]
+    )
+    def serve_analytics_rows(request, grid_id, query):
+        # Block of rows the grid asks for, sorted and filtered server-side
+        if request is None:
+            raise PreventUpdate
+        response = rows_response(cache, grid_id['query'], request, tables=tables)
+        if response is None:
+            # Result evicted (or too large to be kept): computed again from its query
+            result_data = analytics_rows(query)
+            publish_rows(tables, result_data, query)
+            response = rows_response(cache, grid_id['query'], request, table=result_data)
+        return response
+    
     @app.callback(
         Output('analytics-export', 'href'),
         [Input('analytics-apply', 'n_clicks')],
@@ -130,19 +163,10 @@ def register_analytics_callbacks(app, data):
             
         try:
             # Filter and process data (similar to above)
-            filtered_data = data.copy()
-            
+            plan = FilterPlan(data).isin('Chaine', chains, as_str=False).isin('Operation', operations, as_str=False)
             if start_date and end_date:
-                filtered_data = filtered_data[
-                    (filtered_data['DATE'] >= pd.to_datetime(start_date)) &
-                    (filtered_data['DATE'] <= pd.to_datetime(end_date))
-                ]
-            
-            if chains:
-                filtered_data = filtered_data[filtered_data['Chaine'].isin(chains)]
-            
-            if operations:
-                filtered_data = filtered_data[filtered_data['Operation'].isin(operations)]
+                plan.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date))
+            filtered_data = plan.apply()
             
             # Export to CSV
             csv_string = filtered_data.to_csv(index=False, encoding='utf-8')
@@ -8,6 +8,7 @@ import numpy as np
 import dash
 from dash import html
 import traceback
+from datastore.filters import FilterPlan
 
 def register_callbacks(app, data):
     """Register callbacks for the main dashboard"""
@@ -37,24 +38,18 @@ def register_callbacks(app, data):
             })
             
             # Start with all data
-            filtered_data = data.copy()
-            print("Initial data shape:", filtered_data.shape)
-            
-            # Apply filters
-            if kwm_values:
-                filtered_data = filtered_data[filtered_data['Chaine'].isin(kwm_values)]
-            
-            if order_values:
-                filtered_data = filtered_data[filtered_data['Operation'].isin(order_values)]
-            
-            if provider_values:
-                filtered_data = filtered_data[filtered_data['Controleur'].isin(provider_values)]
+            print("Initial data shape:", data.shape)
             
+            # Apply filters, evaluated together and selected once
+            plan = (
+                FilterPlan(data)
+                .isin('Chaine', kwm_values, as_str=False)
+                .isin('Operation', order_values, as_str=False)
+                .isin('Controleur', provider_values, as_str=False)
+            )
             if start_date and end_date:
-                filtered_data = filtered_data[
-                    (filtered_data['DATE'] >= pd.to_datetime(start_date)) &
-                    (filtered_data['DATE'] <= pd.to_datetime(end_date))
-                ]
+                plan.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date))
+            filtered_data = plan.apply()
             
             print("Filtered data shape:", filtered_data.shape)
             
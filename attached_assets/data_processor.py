@@ -6,6 +6,7 @@ import time
 from datetime import datetime
 import traceback
 from typing import Dict, List, Union, Tuple, Any, Optional
+from datastore.filters import FilterPlan
 
 class DataProcessor:
     """
@@ -211,54 +212,47 @@ class DataProcessor:
             self.status = "Applying filters..."
             self.progress = 10
             
-            # Start with all data
-            self.filtered_data = self.data.copy()
+            # Collect the filters, evaluated together once they are all known
+            plan = FilterPlan(self.data)
             
             # Track how many rows were filtered out
-            initial_count = len(self.filtered_data)
+            initial_count = len(self.data)
             
-            # Apply date filters
+            # Add date filters
             if 'date_filters' in filters and filters['date_filters']:
                 for date_filter in filters['date_filters']:
                     column = date_filter.get('column')
-                    start_date = date_filter.get('start')
-                    end_date = date_filter.get('end')
                     
                     if column and column in self.date_columns:
-                        if start_date:
-                            start_date = pd.to_datetime(start_date)
-                            self.filtered_data = self.filtered_data[self.filtered_data[column] >= start_date]
-                        
-                        if end_date:
-                            end_date = pd.to_datetime(end_date)
-                            self.filtered_data = self.filtered_data[self.filtered_data[column] <= end_date]
+                        start_date = pd.to_datetime(date_filter['start']) if date_filter.get('start') else None
+                        end_date = pd.to_datetime(date_filter['end']) if date_filter.get('end') else None
+                        plan.date_range(start_date, end_date, column)
             
-            self.progress = 40
+            self.progress = 20
             
-            # Apply categorical filters
+            # Add categorical filters
             if 'categorical_filters' in filters and filters['categorical_filters']:
                 for cat_filter in filters['categorical_filters']:
                     column = cat_filter.get('column')
                     values = cat_filter.get('values')
                     
                     if column and values and column in self.categorical_columns:
-                        self.filtered_data = self.filtered_data[self.filtered_data[column].isin(values)]
+                        plan.isin(column, list(values), as_str=False)
             
-            self.progress = 70
+            self.progress = 30
             
-            # Apply numerical filters
+            # Add numerical filters
             if 'numerical_filters' in filters and filters['numerical_filters']:
                 for num_filter in filters['numerical_filters']:
                     column = num_filter.get('column')
-                    min_val = num_filter.get('min')
-                    max_val = num_filter.get('max')
                     
                     if column and column in self.numerical_columns:
-                        if min_val is not None:
-                            self.filtered_data = self.filtered_data[self.filtered_data[column] >= min_val]
-                        
-                        if max_val is not None:
-                            self.filtered_data = self.filtered_data[self.filtered_data[column] <= max_val]
+                        plan.between(column, num_filter.get('min'), num_filter.get('max'))
+            
+            self.progress = 40
+            
+            # Evaluate the filters into one row mask and select the rows once
+            self.filtered_data = plan.apply()
             
             self.progress = 100
             
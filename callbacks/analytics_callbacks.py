@@ -1,26 +1,69 @@
-from dash import Output, Input, State, html, dcc
-import dash_bootstrap_components as dbc
+from dash import Output, Input, State, MATCH, html, dcc
 from dash_ag_grid import AgGrid
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-from utils.filter_utils import apply_date_filter, apply_categorical_filter, apply_numerical_filter, calculate_aggregations
+from dash.exceptions import PreventUpdate
+from utils.filter_utils import calculate_aggregations, dashboard_filter_plan
+from datastore.metrics import ANALYTICS_METRICS, available_metrics, row_metrics, total_metrics
+from datastore.rowmodel import ROW_BLOCK_SIZE, ROW_TABLE_BYTES, publish_rows, rows_response
+from datastore.selections import selection_cache, select_rows, published_filters
 import base64
 import io
 
+# Columns read by the analytics callbacks (group-by options and metrics)
+ANALYTICS_COLUMNS = [
+    'DATE', 'Month', 'Year', 'Chaine', 'Operation', 'Controleur',
+    'CNQ', 'CNQ_Percentage', 'Retouche', 'Rebut', 'Penalite'
+]
+
 def register_analytics_callbacks(app, data):
+    # Row selections published by the filter stage (see register_filter_callbacks)
+    cache = selection_cache(app.server)
+    
+    # Result tables shown by the grids, with a budget of their own (masks and pages never evict them)
+    tables = selection_cache(app.server, ROW_TABLE_BYTES, extension='analytics_tables')
+    
+    def selected_rows(selection, cnq_range=(None, None), cnq_pct_range=(None, None)):
+        """Rows of the filter stage's selection, optionally within CNQ and %CNQ ranges"""
+        filters = published_filters(selection)
+        if filters is None:
+            raise PreventUpdate
+        plan = (
+            dashboard_filter_plan(data, **filters)
+            .between('CNQ', *cnq_range)
+            .between('CNQ_Percentage', *cnq_pct_range)
+        )
+        return select_rows(cache, plan)
+    
+    def analytics_result(query):
+        """Rows, metrics, group-by and aggregated table of an analysis (the query of analytics_grid)"""
+        filtered_data = selected_rows(query['selection'], query['cnq_range'], query['cnq_pct_range'])
+        metrics, group_by = query['metrics'], query['group_by']
+        if filtered_data.empty:
+            return filtered_data, metrics, group_by, None
+        
+        # Default metrics if none selected
+        if not metrics or len(metrics) == 0:
+            metrics = ['CNQ'] if 'CNQ' in filtered_data.columns else filtered_data.select_dtypes(include=[np.number]).columns[:1].tolist()
+            
+        # Default group by if none selected
+        if not group_by or len(group_by) == 0:
+            group_by = ['Chaine'] if 'Chaine' in filtered_data.columns else filtered_data.select_dtypes(exclude=[np.number]).columns[:1].tolist()
+            
+        # Calculate aggregations, the top groups by the first metric (descending) within the limit if specified
+        sort_by = metrics[0] if metrics else None
+        aggregated_data = calculate_aggregations(filtered_data, group_by, metrics, sort_by=sort_by, limit=query['limit'])
+        return filtered_data, metrics, group_by, aggregated_data
+    
     @app.callback(
         [Output('analytics-table', 'children'),
          Output('analytics-chart', 'figure'),
          Output('analytics-summary', 'children'),
          Output('results-summary', 'children')],
         [Input('analytics-apply', 'n_clicks')],
-        [State('filter-period', 'start_date'),
-         State('filter-period', 'end_date'),
-         State('filter-chain', 'value'),
-         State('filter-operation', 'value'),
-         State('filter-controller', 'value'),
+        [State('filter-selection', 'data'),
          State('filter-cnq-min', 'value'),
          State('filter-cnq-max', 'value'),
          State('filter-cnq-pct-min', 'value'),
@@ -30,7 +73,7 @@ def register_analytics_callbacks(app, data):
          State('analytics-chart-type', 'value'),
          State('analytics-limit', 'value')]
     )
-    def update_analytics(n_clicks, start_date, end_date, chains, operations, controllers, 
+    def update_analytics(n_clicks, selection,
                         cnq_min, cnq_max, cnq_pct_min, cnq_pct_max, metrics, group_by, chart_type, limit):
         if n_clicks is None:
             # Initial empty state
@@ -42,29 +85,16 @@ def register_analytics_callbacks(app, data):
             )
             return html.Div(), fig, html.Div(), html.Div("Utilisez les filtres et cliquez sur 'Appliquer l'analyse'")
             
-        # Filter data
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters
-        if chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-            
-        if operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-            
-        if controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
-            
-        # Apply numerical filters
-        if cnq_min is not None or cnq_max is not None:
-            filtered_data = apply_numerical_filter(filtered_data, 'CNQ', cnq_min, cnq_max)
-            
-        if cnq_pct_min is not None or cnq_pct_max is not None:
-            filtered_data = apply_numerical_filter(filtered_data, 'CNQ_Percentage', cnq_pct_min, cnq_pct_max)
+        # Rows selected by the filter stage, within the CNQ ranges, and their aggregations
+        query = {
+            'selection': selection,
+            'cnq_range': [cnq_min, cnq_max],
+            'cnq_pct_range': [cnq_pct_min, cnq_pct_max],
+            'metrics': metrics,
+            'group_by': group_by,
+            'limit': limit
+        }
+        filtered_data, metrics, group_by, aggregated_data = analytics_result(query)
             
         # Handle empty data
         if filtered_data.empty:
@@ -77,26 +107,6 @@ def register_analytics_callbacks(app, data):
             )
             return html.Div("No data matches the selected filters"), fig, html.Div(), html.Div("No data matches the selected filters")
             
-        # Default metrics if none selected
-        if not metrics or len(metrics) == 0:
-            metrics = ['CNQ'] if 'CNQ' in filtered_data.columns else filtered_data.select_dtypes(include=[np.number]).columns[:1].tolist()
-            
-        # Default group by if none selected
-        if not group_by or len(group_by) == 0:
-            group_by = ['Chaine'] if 'Chaine' in filtered_data.columns else filtered_data.select_dtypes(exclude=[np.number]).columns[:1].tolist()
-            
-        # Calculate aggregations
-        aggregated_data = calculate_aggregations(filtered_data, group_by, metrics)
-        
-        # Sort by the first metric in descending order
-        sort_by = metrics[0] if metrics else None
-        if sort_by and sort_by in aggregated_data.columns:
-            aggregated_data = aggregated_data.sort_values(by=sort_by, ascending=False)
-        
-        # Apply limit if specified
-        if limit and limit > 0:
-            aggregated_data = aggregated_data.head(limit)
-            
         # Create chart
         if chart_type == 'bar':
             if len(group_by) == 1:
@@ -176,27 +186,25 @@ def register_analytics_callbacks(app, data):
             legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
         )
         
-        # Create data table
-        table = dbc.Table.from_dataframe(
-            aggregated_data,
-            striped=True,
-            bordered=True,
-            hover=True,
-            responsive=True,
-            className="data-table"
-        )
+        # Create data table: the result stays server-side, the grid fetches
+        # its visible blocks of rows (sorted and filtered by serve_analytics_rows)
+        token = publish_rows(tables, aggregated_data, query)
+        table = analytics_grid(token, aggregated_data, query)
         
-        # Create summary statistics
+        # Create summary statistics: the total over all the filtered rows (ratios
+        # like %CNQ are ratios of the totals), the other statistics over the rows
         summary_rows = []
+        totals = total_metrics(filtered_data, metrics)
+        rows = row_metrics(filtered_data, metrics)
         
         for metric in metrics:
-            if metric in filtered_data.columns:
+            if metric in totals.index:
                 # Calculate statistics
-                total = filtered_data[metric].sum()
-                mean = filtered_data[metric].mean()
-                median = filtered_data[metric].median()
-                min_val = filtered_data[metric].min()
-                max_val = filtered_data[metric].max()
+                total = totals[metric]
+                mean = rows[metric].mean()
+                median = rows[metric].median()
+                min_val = rows[metric].min()
+                max_val = rows[metric].max()
                 
                 # Add to summary
                 summary_rows.append(
@@ -227,7 +235,8 @@ def register_analytics_callbacks(app, data):
                     html.Tbody(summary_rows)
                 ],
                 className="table table-sm table-striped table-bordered"
-            )
+            ),
+            html.Small("Total sur l'ensemble des enregistrements filtrés ; moyenne, médiane, min et max par enregistrement", className="text-muted")
         ])
         
         # Results summary
@@ -235,14 +244,65 @@ def register_analytics_callbacks(app, data):
         
         return table, fig, summary, results_text
         
+    def analytics_grid(token, table, query):
+        """Grid of a published result, in the infinite row model (one grid per result token), with its query"""
+        column_defs = []
+        for column in table.columns:
+            if pd.api.types.is_datetime64_any_dtype(table[column]):
+                column_filter = 'agDateColumnFilter'
+            elif pd.api.types.is_numeric_dtype(table[column]):
+                column_filter = 'agNumberColumnFilter'
+            else:
+                column_filter = 'agTextColumnFilter'
+            column_defs.append({'field': column, 'filter': column_filter})
+        
+        return html.Div([
+            # Query of the result, to compute it again when its table is not published
+            dcc.Store(id={'type': 'analytics-query', 'query': token}, data=query),
+            AgGrid(
+                id={'type': 'analytics-grid', 'query': token},
+                columnDefs=column_defs,
+                defaultColDef={
+                    "resizable": True,
+                    "sortable": True,
+                    "filterParams": {"buttons": ["apply", "reset"]}
+                },
+                rowModelType="infinite",
+                dashGridOptions={
+                    "pagination": True,
+                    "paginationPageSize": ROW_BLOCK_SIZE,
+                    "cacheBlockSize": ROW_BLOCK_SIZE,
+                    "maxBlocksInCache": 10
+                },
+                className="ag-theme-alpine-dark"
+            )
+        ])
+    
+    @app.callback(
+        Output({'type': 'analytics-grid', 'query': MATCH}, 'getRowsResponse'),
+        [Input({'type': 'analytics-grid', 'query': MATCH}, 'getRowsRequest')],
+        [State({'type': 'analytics-grid', 'query': MATCH}, 'id'),
+         State({'type': 'analytics-query', 'query': MATCH}, 'data')]
+    )
+    def serve_analytics_rows(request, grid_id, query):
+        # Block of rows the grid asks for, sorted and filtered server-side
+        if request is None:
+            raise PreventUpdate
+        token = grid_id['query']
+        response = rows_response(cache, token, request, tables=tables)
+        if response is None:
+            # Result evicted (or too large to be kept): computed again from its query, and served from it
+            _, _, _, aggregated_data = analytics_result(query)
+            if aggregated_data is None:
+                raise PreventUpdate
+            publish_rows(tables, aggregated_data, query)
+            response = rows_response(cache, token, request, table=aggregated_data)
+        return response
+    
     @app.callback(
         Output('analytics-download', 'data'),
         [Input('analytics-export', 'n_clicks')],
-        [State('filter-period', 'start_date'),
-         State('filter-period', 'end_date'),
-         State('filter-chain', 'value'),
-         State('filter-operation', 'value'),
-         State('filter-controller', 'value'),
+        [State('filter-selection', 'data'),
          State('filter-cnq-min', 'value'),
          State('filter-cnq-max', 'value'),
          State('filter-cnq-pct-min', 'value'),
@@ -251,34 +311,13 @@ def register_analytics_callbacks(app, data):
          State('analytics-groupby', 'value'),
          State('analytics-limit', 'value')]
     )
-    def export_data(n_clicks, start_date, end_date, chains, operations, controllers, 
+    def export_data(n_clicks, selection,
                    cnq_min, cnq_max, cnq_pct_min, cnq_pct_max, metrics, group_by, limit):
         if n_clicks is None:
             return None
             
-        # Filter data
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters
-        if chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-            
-        if operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-            
-        if controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
-            
-        # Apply numerical filters
-        if cnq_min is not None or cnq_max is not None:
-            filtered_data = apply_numerical_filter(filtered_data, 'CNQ', cnq_min, cnq_max)
-            
-        if cnq_pct_min is not None or cnq_pct_max is not None:
-            filtered_data = apply_numerical_filter(filtered_data, 'CNQ_Percentage', cnq_pct_min, cnq_pct_max)
+        # Rows selected by the filter stage, within the CNQ ranges
+        filtered_data = selected_rows(selection, (cnq_min, cnq_max), (cnq_pct_min, cnq_pct_max))
             
         # Default metrics if none selected
         if not metrics or len(metrics) == 0:
@@ -290,16 +329,9 @@ def register_analytics_callbacks(app, data):
             
         # Calculate aggregations if group_by is specified
         if group_by and len(group_by) > 0:
-            export_data = calculate_aggregations(filtered_data, group_by, metrics)
-            
-            # Sort by the first metric in descending order
+            # The top groups by the first metric (descending), within the limit if specified
             sort_by = metrics[0] if metrics else None
-            if sort_by and sort_by in export_data.columns:
-                export_data = export_data.sort_values(by=sort_by, ascending=False)
-            
-            # Apply limit if specified
-            if limit and limit > 0:
-                export_data = export_data.head(limit)
+            export_data = calculate_aggregations(filtered_data, group_by, metrics, sort_by=sort_by, limit=limit)
         else:
             # Export raw filtered data
             export_data = filtered_data
@@ -317,32 +349,15 @@ def register_analytics_callbacks(app, data):
     @app.callback(
         [Output('analytics-metrics', 'options'),
          Output('analytics-groupby', 'options')],
-        [Input('filter-period', 'start_date'),
-         Input('filter-period', 'end_date'),
-         Input('filter-chain', 'value'),
-         Input('filter-operation', 'value'),
-         Input('filter-controller', 'value')]
+        [Input('filter-selection', 'data')]
     )
-    def update_dropdown_options(start_date, end_date, chains, operations, controllers):
-        # Filter data to get relevant options
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters
-        if chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-            
-        if operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-            
-        if controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
+    def update_dropdown_options(selection):
+        # Rows selected by the filter stage, to get relevant options
+        filtered_data = selected_rows(selection)
             
-        # Get numeric columns for metrics
+        # Get numeric columns for metrics, plus the registered metrics computed from them
         metric_columns = filtered_data.select_dtypes(include=[np.number]).columns.tolist()
+        metric_columns += [metric for metric in available_metrics(filtered_data, ANALYTICS_METRICS) if metric not in metric_columns]
         metric_options = [{'label': col, 'value': col} for col in metric_columns]
         
         # Get categorical columns for groupby
@@ -1,48 +1,123 @@
 from dash import Output, Input, State, callback_context
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
-from utils.graph_options import create_graph, create_gauge_chart
-from utils.filter_utils import apply_date_filter, apply_categorical_filter
+import json
+from utils.graph_options import create_gauge_chart
+from dash.exceptions import PreventUpdate
+from utils.filter_utils import dashboard_filter_plan
+from datastore.crossfilter import (
+    CNQ_COMPONENTS, cross_filter_measure, cross_filter_plan, describe_cross_filter,
+    empty_cross_filter, event_values, pick_measure, pick_values
+)
+from datastore.cube import cube_cells, ratio_mean, aggregate_measures
+from datastore.rollups import PERIOD_COLUMN, time_rollups
+from datastore.selections import selection_cache, selection_key, select_rows, published_filters
+from datastore.topk import top_rows
+
+# Columns read by the dashboard chart callbacks
+CHART_COLUMNS = [
+    'DATE', 'Chaine', 'Operation', 'Controleur', 'Quantite',
+    'CNQ', 'CNQ_Percentage', 'Retouche', 'Rebut', 'Penalite'
+]
+
+# Measures of the CNQ history chart
+TREND_MEASURES = ['CNQ', 'Retouche', 'Rebut', 'Penalite']
+
+def active_choice(outlines, choices, default):
+    """Choice of the active button of a group (the one not outlined), or default"""
+    return next((choice for outline, choice in zip(outlines, choices) if outline is False), default)
 
 def register_chart_callbacks(app, data):
+    # Row selections published by the filter stage (see register_filter_callbacks)
+    cache = selection_cache(app.server)
+    
+    def filter_plan(selection, exclude=None, cross=None, cross_exclude=None):
+        """Plan of the filter stage's selection, optionally without the filter of one category, with the charts' cross-filter"""
+        filters = published_filters(selection)
+        if filters is None:
+            raise PreventUpdate
+        if exclude is not None:
+            filters = {**filters, exclude: None}
+        return cross_filter_plan(dashboard_filter_plan(data, **filters), cross, cross_exclude)
+    
+    def selected_rows(selection, exclude=None, cross=None, cross_exclude=None):
+        """Rows of the filter stage's selection, as filter_plan"""
+        return select_rows(cache, filter_plan(selection, exclude, cross, cross_exclude), CHART_COLUMNS)
+    
+    def selected_cells(selection, exclude=None, cross=None, cross_exclude=None):
+        """Cube cells of the filter stage's selection (rows when there is no cube), computed once per filters and cross-filter"""
+        plan = filter_plan(selection, exclude, cross, cross_exclude)
+        key = 'cells:' + selection_key(plan)
+        cells = cache.get(key)
+        if cells is None:
+            cells = cube_cells(plan)
+            if cells is None:
+                return select_rows(cache, plan, CHART_COLUMNS)
+            cache.set(key, cells)
+        return cells
+    
+    def selected_rollups(selection, cross=None):
+        """Day to year rollups of the filter stage's selection, computed once per selection and cross-filter"""
+        key = 'rollups:' + selection['token'] + ':' + json.dumps(cross, sort_keys=True)
+        rollups = cache.get(key)
+        if rollups is None:
+            rollups = time_rollups(selected_cells(selection, cross=cross), TREND_MEASURES)
+            cache.set(key, rollups)
+        return rollups
+    
+    # Cross-filter of the charts: clicking (or box selecting) bars of the top
+    # chart picks values of its dimension, clicking a pie slice picks a CNQ
+    # component; the other charts are re-queried from the cube's cells
+    @app.callback(
+        [Output('chart-selection', 'data'),
+         Output('chart-selection-status', 'children')],
+        [Input('top-chart', 'clickData'),
+         Input('top-chart', 'selectedData'),
+         Input('pie-chart', 'clickData'),
+         Input('chart-selection-clear', 'n_clicks')],
+        [State('chart-selection', 'data')]
+    )
+    def update_chart_selection(top_click, top_selected, pie_click, clear_clicks, cross):
+        ctx = callback_context
+        if not ctx.triggered:
+            raise PreventUpdate
+        triggered = {trigger['prop_id'] for trigger in ctx.triggered}
+        
+        if 'chart-selection-clear.n_clicks' in triggered:
+            cross = empty_cross_filter()
+        elif 'pie-chart.clickData' in triggered:
+            labels = event_values(pie_click, 'label')
+            cross = pick_measure(cross, CNQ_COMPONENTS.get(labels[0]) if labels else None)
+        else:
+            # Bars carry the dimension they show in their customdata
+            event = top_selected if 'top-chart.selectedData' in triggered else top_click
+            points = (event or {}).get('points') or []
+            if not points or not points[0].get('customdata'):
+                raise PreventUpdate
+            cross = pick_values(cross, points[0]['customdata'], event_values(event, 'y'))
+        
+        description = describe_cross_filter(cross)
+        return cross, f"Sélection des graphiques: {description}" if description else ""
+    
     # Callback for metric values
     @app.callback(
         [Output('total-cnq', 'children'),
          Output('cnq-percentage', 'children'),
          Output('retouche-value', 'children'),
          Output('rebut-value', 'children')],
-        [Input('filter-period', 'start_date'),
-         Input('filter-period', 'end_date'),
-         Input('filter-chain', 'value'),
-         Input('filter-operation', 'value'),
-         Input('filter-controller', 'value')]
+        [Input('filter-selection', 'data'),
+         Input('chart-selection', 'data')]
     )
-    def update_metrics(start_date, end_date, chains, operations, controllers):
-        # Filter data
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters
-        if chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-            
-        if operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-            
-        if controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
+    def update_metrics(selection, cross=None):
+        # Cells (or rows) selected by the filter stage and the charts' cross-filter
+        filtered_data = selected_cells(selection, cross=cross)
         
         # Calculate metrics
         total_cnq = filtered_data['CNQ'].sum() if 'CNQ' in filtered_data.columns else 0
         
         # Calculate weighted average CNQ percentage
         if 'CNQ_Percentage' in filtered_data.columns and 'Quantite' in filtered_data.columns:
-            cnq_percentage = (filtered_data['CNQ'] / filtered_data['Quantite'].replace(0, np.nan)).mean() * 100
+            cnq_percentage = ratio_mean(filtered_data, 'CNQ', 'Quantite') * 100
         else:
             cnq_percentage = filtered_data['CNQ_Percentage'].mean() if 'CNQ_Percentage' in filtered_data.columns else 0
         
@@ -60,32 +135,16 @@ def register_chart_callbacks(app, data):
     # Callback for gauge chart
     @app.callback(
         Output('gauge-chart', 'figure'),
-        [Input('filter-period', 'start_date'),
-         Input('filter-period', 'end_date'),
-         Input('filter-chain', 'value'),
-         Input('filter-operation', 'value'),
-         Input('filter-controller', 'value')]
+        [Input('filter-selection', 'data'),
+         Input('chart-selection', 'data')]
     )
-    def update_gauge_chart(start_date, end_date, chains, operations, controllers):
-        # Filter data
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters
-        if chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-            
-        if operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-            
-        if controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
+    def update_gauge_chart(selection, cross=None):
+        # Cells (or rows) selected by the filter stage and the charts' cross-filter
+        filtered_data = selected_cells(selection, cross=cross)
         
-        # Calculate metrics for gauge
-        total_cnq = filtered_data['CNQ'].sum() if 'CNQ' in filtered_data.columns else 0
+        # Calculate metrics for gauge (the CNQ component picked on the pie, if any)
+        measure = cross_filter_measure(cross)
+        total_cnq = filtered_data[measure].sum() if measure in filtered_data.columns else 0
         
         # Set a target value or use a percentage of total production value
         if 'Quantite' in filtered_data.columns:
@@ -99,7 +158,7 @@ def register_chart_callbacks(app, data):
         fig = create_gauge_chart(
             value=total_cnq,
             max_val=max_acceptable_cnq,
-            title="CNQ Cumulé"
+            title=f"{measure} Cumulé"
         )
         
         return fig
@@ -107,29 +166,12 @@ def register_chart_callbacks(app, data):
     # Callback for pie chart
     @app.callback(
         Output('pie-chart', 'figure'),
-        [Input('filter-period', 'start_date'),
-         Input('filter-period', 'end_date'),
-         Input('filter-chain', 'value'),
-         Input('filter-operation', 'value'),
-         Input('filter-controller', 'value')]
+        [Input('filter-selection', 'data'),
+         Input('chart-selection', 'data')]
     )
-    def update_pie_chart(start_date, end_date, chains, operations, controllers):
-        # Filter data
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters
-        if chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-            
-        if operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-            
-        if controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
+    def update_pie_chart(selection, cross=None):
+        # Cells (or rows) selected by the filter stage and the charts' cross-filter
+        filtered_data = selected_cells(selection, cross=cross)
         
         # Calculate components for pie chart
         retouche = filtered_data['Retouche'].sum() if 'Retouche' in filtered_data.columns else 0
@@ -165,6 +207,11 @@ def register_chart_callbacks(app, data):
                 textinfo='percent+value',
                 textposition='inside'
             )
+            
+            # Pull out the component picked on the pie
+            measure = cross_filter_measure(cross, None)
+            if measure:
+                fig.update_traces(pull=[0.1 if CNQ_COMPONENTS[label] == measure else 0 for label in labels])
         
         # Update layout
         fig.update_layout(
@@ -179,17 +226,16 @@ def register_chart_callbacks(app, data):
     # Callback for line chart - trend over time
     @app.callback(
         Output('line-chart', 'figure'),
-        [Input('filter-period', 'start_date'),
-         Input('filter-period', 'end_date'),
-         Input('filter-chain', 'value'),
-         Input('filter-operation', 'value'),
-         Input('filter-controller', 'value'),
+        [Input('filter-selection', 'data'),
          Input('line-day-btn', 'n_clicks'),
          Input('line-week-btn', 'n_clicks'),
-         Input('line-month-btn', 'n_clicks')]
+         Input('line-month-btn', 'n_clicks'),
+         Input('chart-selection', 'data')],
+        [State('line-day-btn', 'outline'),
+         State('line-week-btn', 'outline'),
+         State('line-month-btn', 'outline')]
     )
-    def update_line_chart(start_date, end_date, chains, operations, controllers, 
-                          day_clicks, week_clicks, month_clicks):
+    def update_line_chart(selection, day_clicks, week_clicks, month_clicks, cross=None, *outlines):
         # Determine which time period button was clicked
         ctx = callback_context
         if not ctx.triggered:
@@ -200,25 +246,14 @@ def register_chart_callbacks(app, data):
                 time_period = 'day'
             elif button_id == 'line-week-btn':
                 time_period = 'week'
-            else:
+            elif button_id == 'line-month-btn':
                 time_period = 'month'
+            else:
+                # Filter or cross-filter change: keep the period of the active (not outlined) button
+                time_period = active_choice(outlines, ['day', 'week', 'month'], 'month')
         
-        # Filter data
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters
-        if chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-            
-        if operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-            
-        if controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
+        # Cells (or rows) selected by the filter stage and the charts' cross-filter
+        filtered_data = selected_cells(selection, cross=cross)
         
         # Check if we have date column
         if 'DATE' not in filtered_data.columns or filtered_data.empty:
@@ -237,27 +272,12 @@ def register_chart_callbacks(app, data):
             )
             return fig
         
-        # Group by time period
-        if time_period == 'day':
-            # Daily trend
-            filtered_data['TimePeriod'] = filtered_data['DATE'].dt.date
-            freq = 'D'
-        elif time_period == 'week':
-            # Weekly trend
-            filtered_data['TimePeriod'] = filtered_data['DATE'].dt.to_period('W').apply(lambda x: x.start_time)
-            freq = 'W'
-        else:
-            # Monthly trend
-            filtered_data['TimePeriod'] = filtered_data['DATE'].dt.to_period('M').apply(lambda x: x.start_time)
-            freq = 'M'
-        
-        # Aggregate data by time period
-        trend_data = filtered_data.groupby('TimePeriod').agg({
-            'CNQ': 'sum',
-            'Retouche': 'sum',
-            'Rebut': 'sum',
-            'Penalite': 'sum'
-        }).reset_index()
+        # Pick the series of the time period among the selection's rollups
+        trend_data = selected_rollups(selection, cross)[time_period].rename(columns={PERIOD_COLUMN: 'TimePeriod'})
+        
+        # Lines of the components not picked on the pie are only in the legend
+        measure = cross_filter_measure(cross)
+        shown = lambda column: None if measure in ('CNQ', column) else 'legendonly'
         
         # Create time series chart
         fig = go.Figure()
@@ -277,7 +297,8 @@ def register_chart_callbacks(app, data):
             y=trend_data['Retouche'],
             name='Retouche',
             line=dict(color='#8c67ef', width=2),
-            mode='lines+markers'
+            mode='lines+markers',
+            visible=shown('Retouche')
         ))
         
         fig.add_trace(go.Scatter(
@@ -285,7 +306,8 @@ def register_chart_callbacks(app, data):
             y=trend_data['Rebut'],
             name='Rebut',
             line=dict(color='#f2c85b', width=2),
-            mode='lines+markers'
+            mode='lines+markers',
+            visible=shown('Rebut')
         ))
         
         fig.add_trace(go.Scatter(
@@ -293,17 +315,18 @@ def register_chart_callbacks(app, data):
             y=trend_data['Penalite'],
             name='Pénalité',
             line=dict(color='#e97254', width=2),
-            mode='lines+markers'
+            mode='lines+markers',
+            visible=shown('Penalite')
         ))
         
-        # Add moving average for CNQ
+        # Add moving average for CNQ (or the component picked on the pie)
         window_size = 3 if len(trend_data) >= 3 else len(trend_data)
         if window_size > 0:
-            trend_data['CNQ_MA'] = trend_data['CNQ'].rolling(window=window_size, min_periods=1).mean()
+            trend_data['CNQ_MA'] = trend_data[measure].rolling(window=window_size, min_periods=1).mean()
             fig.add_trace(go.Scatter(
                 x=trend_data['TimePeriod'],
                 y=trend_data['CNQ_MA'],
-                name=f'CNQ (Moyenne mobile sur {window_size})',
+                name=f'{measure} (Moyenne mobile sur {window_size})',
                 line=dict(color='white', width=2, dash='dot'),
                 mode='lines'
             ))
@@ -331,17 +354,16 @@ def register_chart_callbacks(app, data):
     # Callback for top chart (by Chain, Operation, Controller)
     @app.callback(
         Output('top-chart', 'figure'),
-        [Input('filter-period', 'start_date'),
-         Input('filter-period', 'end_date'),
-         Input('filter-chain', 'value'),
-         Input('filter-operation', 'value'),
-         Input('filter-controller', 'value'),
+        [Input('filter-selection', 'data'),
          Input('top-chain-btn', 'n_clicks'),
          Input('top-operation-btn', 'n_clicks'),
-         Input('top-controller-btn', 'n_clicks')]
+         Input('top-controller-btn', 'n_clicks'),
+         Input('chart-selection', 'data')],
+        [State('top-chain-btn', 'outline'),
+         State('top-operation-btn', 'outline'),
+         State('top-controller-btn', 'outline')]
     )
-    def update_top_chart(start_date, end_date, chains, operations, controllers,
-                         chain_clicks, operation_clicks, controller_clicks):
+    def update_top_chart(selection, chain_clicks, operation_clicks, controller_clicks, cross=None, *outlines):
         # Determine which category button was clicked
         ctx = callback_context
         if not ctx.triggered:
@@ -352,58 +374,60 @@ def register_chart_callbacks(app, data):
                 category = 'Chaine'
             elif button_id == 'top-operation-btn':
                 category = 'Operation'
-            else:
+            elif button_id == 'top-controller-btn':
                 category = 'Controleur'
-        
-        # Filter data
-        filtered_data = data.copy()
-        
-        # Apply date filter
-        if start_date or end_date:
-            filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-            
-        # Apply categorical filters, but not for the category we're showing
-        if category != 'Chaine' and chains and len(chains) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
+            else:
+                # Filter or cross-filter change: keep the category of the active (not outlined) button
+                category = active_choice(outlines, ['Chaine', 'Operation', 'Controleur'], 'Chaine')
+        
+        if published_filters(selection) is None:
+            raise PreventUpdate
+        
+        # Top 10 by CNQ (or the component picked on the pie), computed once per selection, category and cross-filter
+        measure = cross_filter_measure(cross)
+        picked = set((cross or {}).get('dimensions', {}).get(category, []))
+        key = f'top:{category}:{selection["token"]}:' + json.dumps(cross, sort_keys=True)
+        top_data = cache.get(key)
+        if top_data is None:
+            # Cells (or rows) selected by the filter stage and the charts' cross-filter,
+            # but neither filtered nor cross-filtered on the category we're showing
+            category_filters = {'Chaine': 'chains', 'Operation': 'operations', 'Controleur': 'controllers'}
+            filtered_data = selected_cells(selection, exclude=category_filters[category],
+                                           cross=cross, cross_exclude=category)
             
-        if category != 'Operation' and operations and len(operations) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
+            # Check if category exists in data
+            if category not in filtered_data.columns or filtered_data.empty:
+                # Create empty chart with message
+                fig = go.Figure()
+                fig.add_annotation(
+                    text=f"Pas de données disponibles pour {category}",
+                    showarrow=False,
+                    font=dict(size=18)
+                )
+                fig.update_layout(
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    margin=dict(l=20, r=20, t=50, b=20),
+                    height=350
+                )
+                return fig
             
-        if category != 'Controleur' and controllers and len(controllers) > 0:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
-        
-        # Check if category exists in data
-        if category not in filtered_data.columns or filtered_data.empty:
-            # Create empty chart with message
-            fig = go.Figure()
-            fig.add_annotation(
-                text=f"Pas de données disponibles pour {category}",
-                showarrow=False,
-                font=dict(size=18)
-            )
-            fig.update_layout(
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                margin=dict(l=20, r=20, t=50, b=20),
-                height=350
-            )
-            return fig
-        
-        # Group by category and calculate metrics
-        top_data = filtered_data.groupby(category).agg({
-            'CNQ': 'sum',
-            'CNQ_Percentage': 'mean',
-            'Retouche': 'sum',
-            'Rebut': 'sum',
-            'Penalite': 'sum',
-            'Quantite': 'sum'
-        }).reset_index()
-        
-        # Sort by CNQ descending and take top 10
-        top_data = top_data.sort_values('CNQ', ascending=False).head(10)
-        
-        # Create horizontal bar chart
+            # Group by category and calculate metrics, keeping the top 10 by partial selection
+            top_data = top_rows(aggregate_measures(filtered_data, category, {
+                'CNQ': 'sum',
+                'CNQ_Percentage': 'mean',
+                'Retouche': 'sum',
+                'Rebut': 'sum',
+                'Penalite': 'sum',
+                'Quantite': 'sum'
+            }), measure, 10)
+            cache.set(key, top_data)
+        
+        # Create horizontal bar chart; bars carry their category for the cross-filter,
+        # and the values picked on it stand out
         fig = go.Figure()
+        customdata = [category] * len(top_data)
+        opacity = [1 if not picked or str(value) in picked else 0.35 for value in top_data[category]]
         
         # Add CNQ bars
         fig.add_trace(go.Bar(
@@ -411,7 +435,8 @@ def register_chart_callbacks(app, data):
             x=top_data['CNQ'],
             name='CNQ Total',
             orientation='h',
-            marker=dict(color='#2dcecc')
+            marker=dict(color='#2dcecc', opacity=opacity),
+            customdata=customdata
         ))
         
         # Add component bars in a grouped format
@@ -420,7 +445,8 @@ def register_chart_callbacks(app, data):
             x=top_data['Retouche'],
             name='Retouche',
             orientation='h',
-            marker=dict(color='#8c67ef')
+            marker=dict(color='#8c67ef', opacity=opacity),
+            customdata=customdata
         ))
         
         fig.add_trace(go.Bar(
@@ -428,7 +454,8 @@ def register_chart_callbacks(app, data):
             x=top_data['Rebut'],
             name='Rebut',
             orientation='h',
-            marker=dict(color='#f2c85b')
+            marker=dict(color='#f2c85b', opacity=opacity),
+            customdata=customdata
         ))
         
         fig.add_trace(go.Bar(
@@ -436,7 +463,8 @@ def register_chart_callbacks(app, data):
             x=top_data['Penalite'],
             name='Pénalité',
             orientation='h',
-            marker=dict(color='#e97254')
+            marker=dict(color='#e97254', opacity=opacity),
+            customdata=customdata
         ))
         
         # Update layout
@@ -447,7 +475,7 @@ def register_chart_callbacks(app, data):
         }
         
         fig.update_layout(
-            title=f"Top 10 {category_names.get(category, category)} par CNQ",
+            title=f"Top 10 {category_names.get(category, category)} par {measure}",
             xaxis_title="Valeur (€)",
             yaxis_title=category,
             template="plotly_dark",
@@ -456,7 +484,8 @@ def register_chart_callbacks(app, data):
             margin=dict(l=40, r=40, t=50, b=40),
             legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
             height=350,
-            barmode='group'
+            barmode='group',
+            dragmode='select'
         )
         
         # Add grid lines
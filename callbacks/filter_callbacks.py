@@ -1,8 +1,64 @@
-from dash import Output, Input, State, callback_context
+import dash
+from dash import Output, Input, State, callback_context, html
 import dash_bootstrap_components as dbc
-from utils.filter_utils import apply_date_filter, apply_categorical_filter
+from utils.filter_utils import apply_date_filter, apply_categorical_filter, dashboard_filter_plan, dashboard_facets, dropdown_options
+from datastore.selections import selection_cache, publish_selection
 
 def register_filter_callbacks(app, data):
+    # Row selections, shared with the callbacks reading the filter token
+    cache = selection_cache(app.server)
+    
+    # Filter stage: evaluates the filters once per change and publishes the
+    # selection (its token and filters) for the charts, instead of each one filtering
+    @app.callback(
+        Output('filter-selection', 'data'),
+        [Input('filter-period', 'start_date'),
+         Input('filter-period', 'end_date'),
+         Input('filter-chain', 'value'),
+         Input('filter-operation', 'value'),
+         Input('filter-controller', 'value'),
+         Input('filter-category', 'value')]
+    )
+    def update_filter_selection(start_date, end_date, chains, operations, controllers, categories=None):
+        filters = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'chains': chains,
+            'operations': operations,
+            'controllers': controllers,
+            'categories': categories
+        }
+        return publish_selection(cache, dashboard_filter_plan(data, **filters), filters)
+    
+    # Cross-filtered dropdowns: each offers the values still reachable under
+    # the other filters, with their rows, counted from the bitmap index
+    @app.callback(
+        [Output('filter-chain', 'options'),
+         Output('filter-operation', 'options'),
+         Output('filter-controller', 'options'),
+         Output('filter-category', 'options')],
+        [Input('filter-period', 'start_date'),
+         Input('filter-period', 'end_date'),
+         Input('filter-chain', 'value'),
+         Input('filter-operation', 'value'),
+         Input('filter-controller', 'value'),
+         Input('filter-category', 'value')]
+    )
+    def update_filter_options(start_date, end_date, chains, operations, controllers, categories):
+        filters = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'chains': chains,
+            'operations': operations,
+            'controllers': controllers,
+            'categories': categories
+        }
+        facets = dashboard_facets(data, filters)
+        return [
+            dropdown_options(facets.get(facet, {}), filters[facet])
+            for facet in ('chains', 'operations', 'controllers', 'categories')
+        ]
+    
     @app.callback(
         Output("additional-filters", "is_open"),
         [Input("toggle-filters-button", "n_clicks")],
@@ -19,6 +75,7 @@ def register_filter_callbacks(app, data):
          Output("filter-chain", "value"),
          Output("filter-operation", "value"),
          Output("filter-controller", "value"),
+         Output("filter-category", "value"),
          Output("filter-cnq-min", "value"),
          Output("filter-cnq-max", "value"),
          Output("filter-cnq-pct-min", "value"),
@@ -32,13 +89,13 @@ def register_filter_callbacks(app, data):
         if not ctx.triggered:
             # No trigger (initial load)
             button_text = "Afficher plus de filtres"
-            return None, None, None, None, None, None, None, None, None, button_text
+            return None, None, None, None, None, None, None, None, None, None, button_text
             
         trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
         
         if trigger_id == "reset-filters-button" and n_clicks:
             # Reset all filters
-            return None, None, None, None, None, None, None, None, None, "Afficher plus de filtres"
+            return None, None, None, None, None, None, None, None, None, None, "Afficher plus de filtres"
         
         if trigger_id == "additional-filters":
             # Update toggle button text based on whether filters are shown
@@ -46,10 +103,10 @@ def register_filter_callbacks(app, data):
                 button_text = "Masquer les filtres"
             else:
                 button_text = "Afficher plus de filtres"
-            return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, button_text
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, button_text
             
         # If no condition met, don't update anything
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
         
     @app.callback(
         Output('filter-loading-output', 'children'),
@@ -58,12 +115,13 @@ def register_filter_callbacks(app, data):
          Input('filter-chain', 'value'),
          Input('filter-operation', 'value'),
          Input('filter-controller', 'value'),
+         Input('filter-category', 'value'),
          Input('filter-cnq-min', 'value'),
          Input('filter-cnq-max', 'value'),
          Input('filter-cnq-pct-min', 'value'),
          Input('filter-cnq-pct-max', 'value')]
     )
-    def update_filter_status(start_date, end_date, chains, operations, controllers, cnq_min, cnq_max, cnq_pct_min, cnq_pct_max):
+    def update_filter_status(start_date, end_date, chains, operations, controllers, categories, cnq_min, cnq_max, cnq_pct_min, cnq_pct_max):
         # Gets called whenever filters change
         active_filters = []
         
@@ -92,6 +150,12 @@ def register_filter_callbacks(app, data):
             else:
                 active_filters.append(f"Contrôleur: {len(controllers)} sélectionnés")
                 
+        if categories and len(categories) > 0:
+            if len(categories) <= 3:
+                active_filters.append(f"Catégorie: {', '.join(categories)}")
+            else:
+                active_filters.append(f"Catégorie: {len(categories)} sélectionnés")
+                
         if cnq_min is not None or cnq_max is not None:
             if cnq_min is not None and cnq_max is not None:
                 active_filters.append(f"CNQ: de {cnq_min} à {cnq_max}")
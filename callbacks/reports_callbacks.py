@@ -4,9 +4,13 @@ import pandas as pd
 import traceback
 from utils.graph_options import create_graph
 from utils.pdf_generator import generate_pdf
-from utils.filter_utils import apply_date_filter, apply_categorical_filter
+from utils.filter_utils import dashboard_filter_plan
+from datastore.selections import selection_cache, select_rows, published_filters
 
 def register_reports_callbacks(app, data):
+    # Row selections published by the filter stage (see register_filter_callbacks)
+    cache = selection_cache(app.server)
+    
     @app.callback(
         Output('graphs-container', 'children'),
         [Input('add-graph-button', 'n_clicks')],
@@ -16,34 +20,18 @@ def register_reports_callbacks(app, data):
          State('color-selector', 'value'),
          State('graphs-container', 'children'),
          # Add filter states to apply them to the graph
-         State('filter-period', 'start_date'),
-         State('filter-period', 'end_date'),
-         State('filter-chain', 'value'),
-         State('filter-operation', 'value'),
-         State('filter-controller', 'value')]
+         State('filter-selection', 'data')]
     )
-    def add_graph(n_clicks, graph_type, x_col, y_col, color_col, existing_graphs,
-                 start_date, end_date, chains, operations, controllers):
+    def add_graph(n_clicks, graph_type, x_col, y_col, color_col, existing_graphs, selection):
         if n_clicks is None or not all([graph_type, x_col, y_col]):
             return existing_graphs or []
         
         try:
-            # Apply filters to data for the graph
-            filtered_data = data.copy()
-            
-            # Apply date filter
-            if start_date or end_date:
-                filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-                
-            # Apply categorical filters
-            if chains and len(chains) > 0:
-                filtered_data = apply_categorical_filter(filtered_data, 'Chaine', chains)
-                
-            if operations and len(operations) > 0:
-                filtered_data = apply_categorical_filter(filtered_data, 'Operation', operations)
-                
-            if controllers and len(controllers) > 0:
-                filtered_data = apply_categorical_filter(filtered_data, 'Controleur', controllers)
+            # Rows selected by the filter stage for the graph
+            filters = published_filters(selection)
+            if filters is None:
+                return existing_graphs or []
+            filtered_data = select_rows(cache, dashboard_filter_plan(data, **filters))
             
             # Handle date columns for better visualization
             df_for_graph = filtered_data.copy()
@@ -2,6 +2,7 @@ from dash import html, dcc
 import dash_bootstrap_components as dbc
 from dash_ag_grid import AgGrid
 from components.filters import create_filters
+from datastore.metrics import ANALYTICS_METRICS, available_metrics
 
 def create_analytics_layout(data):
     # Define important columns to show in filters
@@ -35,9 +36,8 @@ def create_analytics_layout(data):
                                 dcc.Dropdown(
                                     id='analytics-metrics',
                                     options=[
-                                        {'label': col, 'value': col}
-                                        for col in ['CNQ', 'CNQ_Percentage', 'Retouche', 'Rebut', 'Penalite']
-                                        if col in data.columns
+                                        {'label': metric, 'value': metric}
+                                        for metric in available_metrics(data, ANALYTICS_METRICS)
                                     ],
                                     multi=True,
                                     value=['CNQ', 'CNQ_Percentage'] if 'CNQ' in data.columns else [],
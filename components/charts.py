@@ -7,6 +7,16 @@ def create_charts():
         # Metrics row
         create_metrics(),
         
+        # Cross-filter picked on the charts (top chart bars, pie slices), applied to the other charts
+        dcc.Store(id="chart-selection"),
+        dbc.Row([
+            dbc.Col(html.Div(id="chart-selection-status", className="filter-status"), width=10),
+            dbc.Col(
+                dbc.Button("Effacer la sélection", id="chart-selection-clear", color="link", size="sm", n_clicks=0),
+                width=2, className="text-end"
+            )
+        ], className="mb-2"),
+        
         # Charts row
         dbc.Row([
             # Gauge chart for CNQ Cumulé
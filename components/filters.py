@@ -3,26 +3,17 @@ from dash import html, dcc
 import pandas as pd
 import traceback
 from datetime import datetime, timedelta
+from utils.filter_utils import dashboard_facets, dropdown_options
 
 def create_filters(data):
     try:
-        # Initialize filter options
-        chain_options = []
-        operation_options = []
-        controller_options = []
-        
-        # Get unique values for each filter
-        if 'Chaine' in data.columns:
-            chain_options = [{"label": str(val), "value": str(val)} 
-                           for val in sorted(data['Chaine'].dropna().unique())]
-        
-        if 'Operation' in data.columns:
-            operation_options = [{"label": str(val), "value": str(val)} 
-                               for val in sorted(data['Operation'].dropna().unique())]
-        
-        if 'Controleur' in data.columns:
-            controller_options = [{"label": str(val), "value": str(val)} 
-                                for val in sorted(data['Controleur'].dropna().unique())]
+        # Values of each filter with their rows, from the bitmap index (narrowed
+        # to the other filters by update_filter_options once filters are set)
+        facets = dashboard_facets(data)
+        chain_options = dropdown_options(facets.get('chains', {}))
+        operation_options = dropdown_options(facets.get('operations', {}))
+        controller_options = dropdown_options(facets.get('controllers', {}))
+        category_options = dropdown_options(facets.get('categories', {}))
         
         # Get date range
         start_date = data['DATE'].min() if 'DATE' in data.columns else datetime.now() - timedelta(days=30)
@@ -33,7 +24,9 @@ def create_filters(data):
                 html.Div([
                     html.H5("Filtres", className="card-title mb-0"),
                     html.Div(id="filter-status", className="filter-status mt-1")
-                ])
+                ]),
+                # Filters and token of the filtered rows (kept server-side), read by the charts
+                dcc.Store(id="filter-selection")
             ], className="d-flex justify-content-between align-items-center"),
             dbc.CardBody([
                 # Loading spinner for filter updates
@@ -108,6 +101,21 @@ def create_filters(data):
                         ], width=6)
                     ]),
                     
+                    dbc.Row([
+                        # Category filter
+                        dbc.Col([
+                            html.Label("Catégorie", className="filter-label"),
+                            dcc.Dropdown(
+                                id="filter-category",
+                                options=category_options,
+                                multi=True,
+                                placeholder="Sélectionner Catégorie",
+                                className="filter-dropdown mb-3",
+                                clearable=True
+                            )
+                        ], width=6)
+                    ]),
+                    
                     # Metric filters
                     dbc.Row([
                         dbc.Col([
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+from datastore.indexes import attach_index, column_buffer, find_rows
+
+# Filter columns indexed with one bitmap per value
+BITMAP_COLUMNS = ['Chaine', 'Operation', 'Controleur', 'IDControleur', 'Categorie', 'IDChaineMontage1']
+
+# Values found on fewer rows than this share keep a sorted array of row
+# positions (4 bytes per matching row) instead of a bitset (1 bit per row)
+SPARSE_MAX_RATIO = 1 / 32
+
+# Number of bits set in each byte value, to count the rows of packed bitsets
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+def _index_column(series):
+    """Build the bitmap of each value of a column, keyed by the value as a string"""
+    n = len(series)
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    # Values are matched as strings, like apply_categorical_filter does
+    label_codes, labels = pd.factorize(pd.Index(uniques).astype(str))
+    row_labels = label_codes[codes]
+
+    order = np.argsort(row_labels, kind='stable').astype(np.int32 if n < 2 ** 31 else np.int64)
+    label_counts = np.bincount(row_labels, minlength=len(labels))
+    bounds = np.r_[0, np.cumsum(label_counts)]
+    bitmaps = {}
+    counts = {}
+    for code, label in enumerate(labels):
+        counts[label] = int(label_counts[code])
+        positions = order[bounds[code]:bounds[code + 1]]
+        if len(positions) < n * SPARSE_MAX_RATIO:
+            bitmaps[label] = positions
+        else:
+            bits = np.zeros(n, dtype=bool)
+            bits[positions] = True
+            bitmaps[label] = np.packbits(bits)
+    return {'buffer': column_buffer(series), 'bitmaps': bitmaps, 'counts': counts}
+
+def build_bitmap_index(data, columns=BITMAP_COLUMNS):
+    """
+    Index the rows holding each value of the filter columns
+
+    Every value gets a compressed bitset over row positions: a packed bitset
+    when it is frequent, the sorted list of its rows when it is rare. A
+    multi-select filter is then the OR of its values' bitmaps, several
+    filters the AND of those, without scanning the columns. The number of
+    rows of each value is kept too, to estimate how selective a filter is.
+
+    Args:
+        data: Loaded DataFrame
+        columns: Columns to index (those missing from data are skipped)
+    """
+    index = {
+        'rows': len(data),
+        'columns': {col: _index_column(data[col]) for col in columns if col in data.columns}
+    }
+    attach_index(data, 'bitmaps', index)
+
+def _column_index(index, data, column):
+    """Bitmaps of a column of data, or None when the column has none or was replaced after indexing"""
+    column_index = index['columns'].get(column)
+    if column_index is None or column not in data.columns:
+        return None
+    if not np.may_share_memory(column_buffer(data[column]), column_index['buffer']):
+        return None
+    return column_index
+
+def bitmap_count(data, column, values):
+    """
+    Count the indexed rows holding any of the values of a column
+
+    Args:
+        data: DataFrame indexed with build_bitmap_index, or a slice of it
+        column: Column name
+        values: List of values, matched as strings
+
+    Returns:
+        Tuple (matching rows, indexed rows) over the whole indexed frame,
+        or None when the column has no up-to-date bitmaps
+    """
+    index, _ = find_rows(data, 'bitmaps')
+    if index is None:
+        return None
+    column_index = _column_index(index, data, column)
+    if column_index is None:
+        return None
+    if not isinstance(values, list):
+        values = [values]
+    matching = sum(column_index['counts'].get(label, 0) for label in {str(value) for value in values})
+    return matching, index['rows']
+
+def bitmap_value_counts(data, column, selection=None):
+    """
+    Count the rows of a selection holding each value of an indexed column
+
+    Each value's bitmap is intersected with the selection: rare values look
+    up their row positions, frequent ones count the bits of their packed
+    bitset ANDed with the selection's, so the column itself is never read.
+
+    Args:
+        data: DataFrame indexed with build_bitmap_index, or a slice of it
+        column: Column name
+        selection: Tuple (start, stop, mask) over data's rows, as returned by
+            FilterPlan.selection, or None for all of them
+
+    Returns:
+        Dictionary of each value (as a string) to its number of selected
+        rows, or None when the column has no up-to-date bitmaps
+    """
+    index, offset = find_rows(data, 'bitmaps')
+    if index is None or offset + len(data) > index['rows']:
+        return None
+    column_index = _column_index(index, data, column)
+    if column_index is None:
+        return None
+
+    n = index['rows']
+    start, stop, mask = selection if selection is not None else (0, len(data), None)
+    if mask is None and offset + start == 0 and offset + stop == n:
+        return dict(column_index['counts'])
+
+    # Selected rows, as positions of the indexed frame
+    bits = np.zeros(n, dtype=bool)
+    bits[offset + start:offset + stop] = True if mask is None else mask
+    packed = None
+    counts = {}
+    for label, bitmap in column_index['bitmaps'].items():
+        if bitmap.dtype == np.uint8:
+            if packed is None:
+                packed = np.packbits(bits)
+            counts[label] = int(POPCOUNT[np.bitwise_and(bitmap, packed)].sum())
+        else:
+            counts[label] = int(np.count_nonzero(bits[bitmap]))
+    return counts
+
+def _union(column_index, values, n):
+    """Packed bitset of the rows holding any of the values"""
+    packed = np.zeros((n + 7) // 8, dtype=np.uint8)
+    for value in values:
+        bitmap = column_index['bitmaps'].get(str(value))
+        if bitmap is None:
+            continue
+        if bitmap.dtype == np.uint8:
+            np.bitwise_or(packed, bitmap, out=packed)
+        else:
+            np.bitwise_or.at(packed, bitmap >> 3, (0x80 >> (bitmap & 7)).astype(np.uint8))
+    return packed
+
+def bitmap_mask(data, filters):
+    """
+    Evaluate categorical filters on a frame from its bitmap index
+
+    Args:
+        data: DataFrame indexed with build_bitmap_index, sharing its rows or
+            sliced from it with slice_rows (a date range)
+        filters: Mapping of column to the list of values to keep
+
+    Returns:
+        Boolean array of the rows passing every filter, or None when a
+        filtered column has no up-to-date bitmaps
+    """
+    index, offset = find_rows(data, 'bitmaps')
+    if index is None or offset + len(data) > index['rows']:
+        return None
+
+    packed = None
+    for column, values in filters.items():
+        column_index = _column_index(index, data, column)
+        if column_index is None:
+            return None
+        if not isinstance(values, list):
+            values = [values]
+        union = _union(column_index, values, index['rows'])
+        packed = union if packed is None else np.bitwise_and(packed, union, out=packed)
+
+    if packed is None:
+        return np.ones(len(data), dtype=bool)
+    return np.unpackbits(packed, count=index['rows']).view(bool)[offset:offset + len(data)]
@@ -0,0 +1,408 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+import pandas as pd
+from functools import partial
+from datastore.partitions import DateArchive, partition_labels, partition_order
+from datastore.schema import concat_frames
+
+# Snapshots live next to the sources, outside of version control
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+
+# Bump when the snapshot layout or the stored dtypes change so stale files are rebuilt
+CACHE_VERSION = 9
+
+# Lists a partitioned table's partitions in the order of its rows
+PARTITION_ORDER_FILE = 'partitions.json'
+
+# Parquet metadata key listing the categorical columns: Arrow reads
+# categories of integers (chain or operation IDs) back as plain integers
+CATEGORICAL_ATTR = 'categorical_columns'
+
+def read_csv(csv_path, **kwargs):
+    """
+    Read a CSV export with UTF-8 first, then latin1 as a fallback
+
+    Args:
+        csv_path: Path of the CSV file
+        **kwargs: Extra arguments forwarded to pd.read_csv
+
+    Returns:
+        Parsed DataFrame
+    """
+    kwargs.setdefault('low_memory', False)
+    try:
+        return pd.read_csv(csv_path, encoding='utf-8', **kwargs)
+    except UnicodeDecodeError:
+        if hasattr(csv_path, 'seek'):
+            csv_path.seek(0)
+        return pd.read_csv(csv_path, encoding='latin1', **kwargs)
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 of a file's content
+
+    Args:
+        path: Path of the file
+        chunk_size: Number of bytes read at a time
+
+    Returns:
+        Hex digest of the content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def snapshot_paths(csv_path, variant='full'):
+    """
+    Get the snapshot and metadata paths for a source file
+
+    Args:
+        csv_path: Path of the source CSV
+        variant: Name distinguishing different parses of the same file
+
+    Returns:
+        Tuple (snapshot path, metadata path)
+    """
+    source = os.path.abspath(csv_path)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    source_key = hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]
+    base = os.path.join(CACHE_DIR, f"{stem}-{source_key}-{variant}")
+    return base + '.parquet', base + '.meta.json'
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _arrow_safe(data):
+    """Cast object columns holding mixed Python types to strings so Arrow can store them"""
+    mixed = [
+        col for col in data.columns
+        if data[col].dtype == object
+        and pd.api.types.infer_dtype(data[col], skipna=True) not in ('string', 'empty')
+    ]
+    if not mixed:
+        return data
+    data = data.copy()
+    for col in mixed:
+        data[col] = data[col].where(data[col].isna(), data[col].astype(str))
+    return data
+
+def _table_path(snapshot_path, name):
+    return snapshot_path[:-len('.parquet')] + f".{name}.parquet"
+
+def _partition_dir(path):
+    return path[:-len('.parquet')]
+
+def _write_file(path, data):
+    data = _arrow_safe(data)
+    categorical = [col for col in data.columns if isinstance(data[col].dtype, pd.CategoricalDtype)]
+    if categorical:
+        data = data.copy(deep=False)
+        data.attrs = {**data.attrs, CATEGORICAL_ATTR: categorical}
+    tmp_path = path + '.tmp'
+    data.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+def _read_file(path):
+    data = pd.read_parquet(path)
+    categorical = data.attrs.pop(CATEGORICAL_ATTR, [])
+    cast = {
+        col: data[col].astype('category') for col in categorical
+        if col in data.columns and not isinstance(data[col].dtype, pd.CategoricalDtype)
+    }
+    return data.assign(**cast) if cast else data
+
+def _write_table(path, data, partition_by=None, only=None):
+    """
+    Write a table to a Parquet file, or to a directory holding one file per
+    year/month partition when it has the partition_by column
+
+    Args:
+        path: Path of the table's file
+        data: DataFrame to write
+        partition_by: Name of the date column partitioning the table, or None
+        only: Partition labels to write, or None to rewrite the whole table
+    """
+    directory = _partition_dir(path)
+    if partition_by is None or partition_by not in data.columns:
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        _write_file(path, data)
+        return
+
+    if only is None and os.path.exists(path):
+        os.remove(path)
+    os.makedirs(directory, exist_ok=True)
+    labels = partition_labels(data[partition_by])
+    positions = labels.groupby(labels).indices
+    for label, rows in positions.items():
+        if only is None or label in only:
+            _write_file(os.path.join(directory, f"{label}.parquet"), data.take(rows).reset_index(drop=True))
+    if only is None:
+        # Drop partitions left from a previous version of the source
+        for name in os.listdir(directory):
+            if name.endswith('.parquet') and name[:-len('.parquet')] not in positions:
+                os.remove(os.path.join(directory, name))
+    _write_meta(os.path.join(directory, PARTITION_ORDER_FILE), list(labels.unique()))
+
+def _stored_partitions(path):
+    """Labels of a partitioned table's partitions, in the order they had when written (None when stored whole)"""
+    directory = _partition_dir(path)
+    if not os.path.isdir(directory):
+        return None
+    stored = [name[:-len('.parquet')] for name in os.listdir(directory) if name.endswith('.parquet')]
+    order = _read_meta(os.path.join(directory, PARTITION_ORDER_FILE)) or []
+    labels = [label for label in order if label in stored]
+    return labels + partition_order(label for label in stored if label not in labels)
+
+def _read_table(path, partitions=None):
+    """
+    Read a table, concatenating its partitions in the order they had when written
+
+    Args:
+        path: Path of the table's file
+        partitions: Labels of the partitions to read, or None for all (a
+            table stored whole is always read whole)
+
+    Returns:
+        DataFrame
+    """
+    stored = _stored_partitions(path)
+    if stored is None:
+        return _read_file(path)
+    directory = _partition_dir(path)
+    labels = stored if partitions is None else [label for label in stored if label in partitions]
+    if not labels:
+        # No partition selected: the columns and dtypes of the table, without rows
+        return _read_file(os.path.join(directory, f"{stored[0]}.parquet")).iloc[0:0]
+    return concat_frames([_read_file(os.path.join(directory, f"{label}.parquet")) for label in labels])
+
+def _table_exists(path):
+    return os.path.exists(path) or os.path.isdir(_partition_dir(path))
+
+def _write_snapshot(snapshot_path, data, partition_by=None, only=None):
+    """Write a DataFrame, or a dictionary of named tables, and return the table names"""
+    if isinstance(data, dict):
+        for name, table in data.items():
+            _write_table(_table_path(snapshot_path, name), table, partition_by, only)
+        return list(data)
+    _write_table(snapshot_path, data, partition_by, only)
+    return None
+
+def _read_snapshot(snapshot_path, tables=None, partitions=None):
+    if tables is None:
+        return _read_table(snapshot_path, partitions)
+    return {name: _read_table(_table_path(snapshot_path, name), partitions) for name in tables}
+
+def _snapshot_exists(snapshot_path, tables=None):
+    if tables is None:
+        return _table_exists(snapshot_path)
+    return all(_table_exists(_table_path(snapshot_path, name)) for name in tables)
+
+def _partitions_of(data, partition_by):
+    """Get the partition labels holding rows of a DataFrame or dictionary of tables"""
+    tables = data.values() if isinstance(data, dict) else [data]
+    labels = set()
+    for table in tables:
+        if partition_by is not None and partition_by in table.columns:
+            labels.update(partition_labels(table[partition_by]).unique())
+    return labels
+
+def read_appended(csv_path, size, sha256, chunk_size=1 << 20):
+    """
+    Get the complete lines appended to a file since it was size bytes long
+
+    The first size bytes must still hash to sha256 and end with a line
+    break; a partly written last line is left for the next call.
+
+    Args:
+        csv_path: Path of the source CSV
+        size: Number of bytes already ingested
+        sha256: Hex digest of those bytes
+        chunk_size: Number of bytes read at a time
+
+    Returns:
+        Tuple (appended bytes, digest of everything up to their end), or None
+        if the file was truncated or rewritten
+    """
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        remaining = size
+        last = b''
+        while remaining:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                return None
+            digest.update(chunk)
+            remaining -= len(chunk)
+            last = chunk[-1:]
+        if digest.hexdigest() != sha256 or last != b'\n':
+            return None
+        tail = f.read()
+
+    tail = tail[:tail.rfind(b'\n') + 1]
+    digest.update(tail)
+    return tail, digest.hexdigest()
+
+def _count_rows(data):
+    return {name: len(table) for name, table in data.items()} if isinstance(data, dict) else len(data)
+
+def _append_tail(csv_path, parse, append, snapshot_path, meta_path, meta, stat, partition_by=None):
+    """Parse the records appended since the snapshot and merge them in, or return None to rebuild"""
+    appended = read_appended(csv_path, meta['size'], meta.get('sha256'))
+    if appended is None:
+        print(f"{csv_path} was rewritten: rebuilding its snapshot")
+        return None
+    tail, content_hash = appended
+
+    try:
+        data = _read_snapshot(snapshot_path, meta.get('tables'))
+        if tail:
+            header = list(read_csv(csv_path, nrows=0).columns)
+            new = parse(io.BytesIO(tail), header=None, names=header)
+            data = append(data, new)
+            if data is None:
+                return None
+            # Only the partitions receiving records are rewritten
+            _write_snapshot(snapshot_path, data, partition_by, only=_partitions_of(new, partition_by))
+    except Exception as e:
+        print(f"Could not append to the snapshot, rebuilding: {str(e)}")
+        return None
+
+    meta.update({
+        'size': meta['size'] + len(tail),
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': content_hash,
+        'rows': _count_rows(data)
+    })
+    _write_meta(meta_path, meta)
+    print(f"Loaded {csv_path} from snapshot plus {len(tail)} appended bytes ({_count_rows(data)} rows)")
+    return data
+
+def load_cached_csv(csv_path, parse=read_csv, variant='full', append=None, partition_by=None):
+    """
+    Load a parsed CSV from its columnar snapshot, rebuilding it only when the source changed
+
+    The snapshot is keyed by the source file's size, modification time and
+    content hash. When size and mtime match, the snapshot is used directly;
+    when only the mtime moved (file touched or copied), the content hash
+    decides.
+
+    When append is given and the file grew from its end (the bytes already
+    ingested are unchanged), only the appended lines are parsed and merged
+    into the snapshot. The metadata's size is then the byte offset of the
+    next record to ingest. Any other change triggers a full parse and a new
+    snapshot.
+
+    Args:
+        csv_path: Path of the source CSV
+        parse: Callable taking the CSV path and returning the parsed, typed DataFrame
+            (or a dictionary of named DataFrames, stored as one file each)
+        variant: Name of the snapshot, one per distinct parse function
+        append: Callable merging the parse of the appended lines into the
+            snapshot's data, returning None when they cannot be appended
+        partition_by: Date column splitting the stored tables into year/month
+            partitions (tables without it are stored whole)
+
+    Returns:
+        Parsed DataFrame, or dictionary of DataFrames
+    """
+    stat = os.stat(csv_path)
+    snapshot_path, meta_path = snapshot_paths(csv_path, variant)
+    meta = _read_meta(meta_path)
+    content_hash = None
+
+    if (meta and meta.get('version') == CACHE_VERSION and meta.get('partition_by') == partition_by
+            and _snapshot_exists(snapshot_path, meta.get('tables'))):
+        if append is not None and meta.get('size', 0) < stat.st_size:
+            data = _append_tail(csv_path, parse, append, snapshot_path, meta_path, meta, stat, partition_by)
+            if data is not None:
+                return data
+        if meta.get('size') == stat.st_size:
+            if meta.get('mtime_ns') != stat.st_mtime_ns:
+                content_hash = hash_file(csv_path)
+            if content_hash is None or content_hash == meta.get('sha256'):
+                try:
+                    data = _read_snapshot(snapshot_path, meta.get('tables'))
+                    if content_hash is not None:
+                        # Same content, new mtime: refresh the key to skip hashing next time
+                        meta['mtime_ns'] = stat.st_mtime_ns
+                        _write_meta(meta_path, meta)
+                    print(f"Loaded {csv_path} from snapshot ({_count_rows(data)} rows)")
+                    return data
+                except Exception as e:
+                    print(f"Snapshot unreadable, rebuilding: {str(e)}")
+
+    data = parse(csv_path)
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tables = _write_snapshot(snapshot_path, data, partition_by)
+        _write_meta(meta_path, {
+            'version': CACHE_VERSION,
+            'source': os.path.abspath(csv_path),
+            'variant': variant,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': content_hash or hash_file(csv_path),
+            'tables': tables,
+            'partition_by': partition_by,
+            'rows': _count_rows(data)
+        })
+    except ImportError as e:
+        # No Parquet engine installed: keep working without a snapshot
+        print(f"Snapshot disabled: {str(e)}")
+    except Exception as e:
+        print(f"Could not write snapshot for {csv_path}: {str(e)}")
+
+    return data
+
+def open_archive(csv_path, variant='full'):
+    """
+    Open the year/month partitions of a source's snapshot, without reading them
+
+    Only an up-to-date snapshot written with partition_by is opened: the
+    source must still have the size and modification time it was ingested
+    with (load_cached_csv refreshes the snapshot otherwise).
+
+    Args:
+        csv_path: Path of the source CSV
+        variant: Name of the snapshot, as given to load_cached_csv
+
+    Returns:
+        DateArchive whose reads return the snapshot's data (DataFrame or
+        dictionary of tables: partitioned tables hold the rows of the
+        partitions read, the others are read whole), or None
+    """
+    stat = os.stat(csv_path)
+    snapshot_path, meta_path = snapshot_paths(csv_path, variant)
+    meta = _read_meta(meta_path)
+    if not (meta and meta.get('version') == CACHE_VERSION and meta.get('partition_by')
+            and meta.get('size') == stat.st_size and meta.get('mtime_ns') == stat.st_mtime_ns
+            and _snapshot_exists(snapshot_path, meta.get('tables'))):
+        return None
+
+    tables = meta.get('tables')
+    paths = [snapshot_path] if tables is None else [_table_path(snapshot_path, name) for name in tables]
+    labels = set()
+    for path in paths:
+        labels.update(_stored_partitions(path) or [])
+    return DateArchive(
+        partition_order(labels),
+        partial(_read_snapshot, snapshot_path, tables),
+        date_column=meta['partition_by']
+    )
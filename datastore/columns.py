@@ -0,0 +1,72 @@
+import hashlib
+
+# Source columns the loaders read to build the alias columns (Chaine,
+# Operation, Controleur, Quantite...) and the CNQ components, plus the
+# record number, correction date and dimension keys. They are always part
+# of a projection, whatever the view.
+DERIVATION_COLUMNS = [
+    'DATE', 'date', 'n°_enr.', 'IDReclamation', 'ModifieLe', 'IDEmploye', 'IDOFabrication', 'IDCodeErreur',
+    'IDChaineMontage', 'IDchainemontage', 'IDChaineMontage1', 'IDChaineMontage2',
+    'IDOperation', 'IDoperation', 'IDOperation1', 'Operation', 'operation',
+    'IDControleur', 'IDcontroleur', 'Contrôleur (se)', 'Chaîne',
+    'Qtte', 'Qtte OF', 'Quantite', 'Quantite2', 'QtteLct', 'QtteLct2', 'QtteSondee',
+    'NbrReclamations', 'DeuxiemeChoix', 'Note', 'ValeurOF', 'Libelle', 'libelle',
+    'temps', 'tauxhoraire', 'prix', 'MontantPenalite'
+]
+
+def projection(*manifests):
+    """
+    Merge view manifests into the list of columns to load
+
+    Args:
+        *manifests: Column lists declared by the views; None means every column
+
+    Returns:
+        List of column names (derivation columns included), or None to load everything
+    """
+    if not manifests or any(manifest is None for manifest in manifests):
+        return None
+
+    columns = []
+    seen = set()
+    for manifest in (DERIVATION_COLUMNS,) + manifests:
+        for col in manifest:
+            if col.lower() not in seen:
+                seen.add(col.lower())
+                columns.append(col)
+    return columns
+
+def usecols_matcher(columns):
+    """
+    Build a pd.read_csv usecols callable matching column names case-insensitively
+
+    The two exports of res.csv spell the same columns differently
+    (IDChaineMontage vs idchainemontage), so a manifest entry selects
+    the column whatever its case. Names that are not in the file, like
+    derived columns, are simply ignored.
+
+    Args:
+        columns: List of column names, or None for every column
+
+    Returns:
+        Callable for usecols, or None
+    """
+    if columns is None:
+        return None
+    wanted = {col.lower() for col in columns}
+    return lambda name: name.lower() in wanted
+
+def projection_key(columns):
+    """
+    Short stable name for a projection, used to key snapshots
+
+    Args:
+        columns: List of column names, or None for every column
+
+    Returns:
+        'all' or a short hash of the column set
+    """
+    if columns is None:
+        return 'all'
+    names = ','.join(sorted({col.lower() for col in columns}))
+    return hashlib.sha1(names.encode('utf-8')).hexdigest()[:8]
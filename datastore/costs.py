@@ -0,0 +1,57 @@
+# Parameters a frame's cost columns were computed with, kept in its attrs
+COST_PARAMETERS_ATTR = 'cost_parameters'
+
+# Assumed price per unit, the value base of the orders without an OF value
+DEFAULT_UNIT_PRICE = 100
+
+def cost_step(column, compute, parameters=(), inputs=()):
+    """
+    Declare one derived column of a cost model
+
+    Args:
+        column: Name of the column the step writes
+        compute: Callable (data, parameters) returning the column's values
+        parameters: Names of the parameters the values depend on
+        inputs: Derived columns of earlier steps the values are computed from
+
+    Returns:
+        Step dictionary, to list in a model in computation order
+    """
+    return {'column': column, 'compute': compute, 'parameters': set(parameters), 'inputs': set(inputs)}
+
+def apply_cost_model(data, model, parameters):
+    """
+    Compute the cost columns of a model from the raw columns of a frame
+
+    The first call computes every step. On a frame already priced, only the
+    steps depending on a parameter that changed, directly or through an
+    earlier step, are recomputed; the other columns, like the raw ones, are
+    shared with data rather than copied. Reloading the source is never needed.
+
+    Args:
+        data: DataFrame holding the raw columns (and possibly earlier cost columns)
+        model: List of cost_step dictionaries, in computation order
+        parameters: Parameter values; on a priced frame, only those to change
+
+    Returns:
+        DataFrame with the cost columns (data itself when nothing changed)
+    """
+    current = data.attrs.get(COST_PARAMETERS_ATTR)
+    if current is None:
+        merged = dict(parameters)
+        changed = set(merged)
+    else:
+        merged = {**current, **parameters}
+        changed = {name for name, value in merged.items() if current.get(name) != value}
+        if not changed:
+            return data
+
+    priced = data.copy(deep=False)
+    recomputed = set()
+    for step in model:
+        if current is None or step['parameters'] & changed or step['inputs'] & recomputed:
+            priced[step['column']] = step['compute'](priced, merged)
+            recomputed.add(step['column'])
+
+    priced.attrs = {**data.attrs, COST_PARAMETERS_ATTR: merged}
+    return priced
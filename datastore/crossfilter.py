@@ -0,0 +1,107 @@
+# Cost components of the CNQ breakdown pie: slice label to measure column
+CNQ_COMPONENTS = {'Retouche': 'Retouche', 'Rebut': 'Rebut', 'Pénalité': 'Penalite'}
+
+def empty_cross_filter():
+    """Cross-filter picking nothing: no dimension values, no CNQ component"""
+    return {'dimensions': {}, 'measure': None}
+
+def event_values(event, key):
+    """
+    Values picked by a Plotly click or selection event
+
+    Args:
+        event: Dash clickData / selectedData, or the selection of a
+            Streamlit plotly_chart event (all hold a 'points' list)
+        key: Point field holding the picked value ('x' or 'y' for bars,
+            'label' for pie slices)
+
+    Returns:
+        List of the distinct values, as strings, in the order picked
+    """
+    values = []
+    for point in (event or {}).get('points') or []:
+        value = point.get(key)
+        if value is not None and str(value) not in values:
+            values.append(str(value))
+    return values
+
+def pick_values(cross, dimension, values):
+    """
+    Cross-filter after values of a dimension were picked on a chart
+
+    Picking exactly the values already picked on the dimension clears them,
+    so clicking a bar again undoes its selection. The other dimensions and
+    the component are kept.
+
+    Args:
+        cross: Current cross-filter (or None)
+        dimension: Column the chart shows
+        values: Values picked (from event_values), empty to clear the dimension
+
+    Returns:
+        New cross-filter dictionary
+    """
+    cross = cross or empty_cross_filter()
+    dimensions = dict(cross['dimensions'])
+    if not values or sorted(dimensions.get(dimension, [])) == sorted(values):
+        dimensions.pop(dimension, None)
+    else:
+        dimensions[dimension] = list(values)
+    return {'dimensions': dimensions, 'measure': cross['measure']}
+
+def pick_measure(cross, measure):
+    """
+    Cross-filter after a CNQ component was picked (picking it again clears it)
+
+    Args:
+        cross: Current cross-filter (or None)
+        measure: Component column (a value of CNQ_COMPONENTS), or None
+
+    Returns:
+        New cross-filter dictionary
+    """
+    cross = cross or empty_cross_filter()
+    measure = None if measure == cross['measure'] else measure
+    return {'dimensions': dict(cross['dimensions']), 'measure': measure}
+
+def cross_filter_plan(plan, cross, exclude=None):
+    """
+    Add a cross-filter's picks to a filter plan
+
+    The picks are categorical filters on cube dimensions, so the plan is
+    still answered from the cube's cells and their bitmap index.
+
+    Args:
+        plan: FilterPlan of the dashboard filters
+        cross: Cross-filter (or None)
+        exclude: Dimension whose picks are left out (the chart they were
+            picked on, which keeps showing every value)
+
+    Returns:
+        The plan
+    """
+    for dimension, values in ((cross or {}).get('dimensions') or {}).items():
+        if dimension != exclude:
+            plan.isin(dimension, values)
+    return plan
+
+def cross_filter_measure(cross, default='CNQ'):
+    """Measure the charts show under a cross-filter: the picked CNQ component, or default"""
+    return (cross or {}).get('measure') or default
+
+def describe_cross_filter(cross):
+    """
+    Text describing a cross-filter's picks
+
+    Args:
+        cross: Cross-filter (or None)
+
+    Returns:
+        String such as 'Chaine: 58, 66 · Composante: Rebut', empty when nothing is picked
+    """
+    cross = cross or empty_cross_filter()
+    parts = [f"{dimension}: {', '.join(values)}" for dimension, values in cross['dimensions'].items()]
+    if cross['measure']:
+        label = next((label for label, column in CNQ_COMPONENTS.items() if column == cross['measure']), cross['measure'])
+        parts.append(f"Composante: {label}")
+    return ' · '.join(parts)
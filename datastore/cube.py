@@ -0,0 +1,308 @@
+import numpy as np
+import pandas as pd
+from datastore.bitmaps import build_bitmap_index
+from datastore.dates import register_date_index
+from datastore.indexes import attach_index, column_buffer, find_index
+
+# Dimensions of the cube, besides the day (those missing from the data are skipped)
+CUBE_DIMENSIONS = ['Chaine', 'Operation', 'IDOperation', 'Controleur', 'IDControleur', 'Categorie']
+
+# Measures of the cube: each cell holds their sum and their count of non-missing values
+CUBE_MEASURES = [
+    'CNQ', 'Retouche', 'Rebut', 'Penalite', 'Qtte', 'QtteSondee', 'QtteLct', 'ValeurOF',
+    'Quantite', 'CNQ_Percentage', 'CoutRetoucheUnitaire', 'CoutRebutUnitaire'
+]
+
+# Row ratios some views average (numerator, denominator), kept as measures named 'numerator/denominator'
+CUBE_RATIOS = [('CNQ', 'Quantite')]
+
+# Suffix of the columns counting a measure's non-missing values in the cells
+COUNT_SUFFIX = '__count'
+
+# Column counting the rows of each cell
+ROWS_COLUMN = '__rows'
+
+# Attribute marking a frame of cube cells (rather than rows)
+CUBE_ATTR = 'cube_cells'
+
+# Columns stamping a row's version: its record number and its last correction
+# date (found whatever their case). A day whose rows' stamps are unchanged
+# since the previous build keeps its cells; only the other days are regrouped.
+RECORD_COLUMNS = ['n°_enr.', 'IDReclamation']
+MODIFIED_COLUMN = 'modifiele'
+
+# Latest cube built for each source (see build_cube's source)
+_latest_cubes = {}
+
+def _ratio_name(numerator, denominator):
+    return f'{numerator}/{denominator}'
+
+def _measure_values(data, measure):
+    """Row values of a measure as floats, with their buffers (to tell when they change)"""
+    if measure in data.columns:
+        column = data[measure]
+        return column.to_numpy(dtype=float, na_value=np.nan), [column_buffer(column)]
+    numerator, denominator = measure.split('/')
+    values = (data[numerator] / data[denominator].replace(0, np.nan)).to_numpy(dtype=float, na_value=np.nan)
+    return values, [column_buffer(data[numerator]), column_buffer(data[denominator])]
+
+def _aggregate(cells, size, values, dtype=None):
+    """Sum and non-missing count of values per cell (sums of an integer dtype as int64)"""
+    present = ~np.isnan(values)
+    total = np.bincount(cells, weights=np.where(present, values, 0.0), minlength=size)
+    if dtype is not None and pd.api.types.is_integer_dtype(dtype):
+        # Integer sums are int64 whatever the column's width, as a groupby sum would
+        total = total.round().astype(np.int64)
+    count = np.bincount(cells, weights=present, minlength=size).astype(np.int64)
+    return total, count
+
+def _measure_dtype(data, measure):
+    return data[measure].dtype if measure in data.columns else None
+
+def _row_cells(cube, data):
+    """Cell of each row of data, matched on the cells' keys (computed once, when a measure is re-aggregated)"""
+    if cube['cells'] is None:
+        keys = cube['keys']
+        rows = pd.DataFrame({
+            cube['date_column']: data[cube['date_column']].dt.normalize(),
+            **{column: data[column] for column in cube['dimensions']}
+        })
+        cube['cells'] = pd.MultiIndex.from_frame(keys).get_indexer(pd.MultiIndex.from_frame(rows))
+    return cube['cells']
+
+def _aggregate_measure(cube, data, measure):
+    """Sum and count of a measure per cell"""
+    values, buffers = _measure_values(data, measure)
+    total, count = _aggregate(_row_cells(cube, data), len(cube['keys']), values, _measure_dtype(data, measure))
+    return {'buffers': buffers, 'sum': total, 'count': count}
+
+def _find_column(data, name):
+    return next((column for column in data.columns if column.lower() == name.lower()), None)
+
+def _day_stamps(data, day_values):
+    """
+    Version of each day's rows: their number and a checksum of their stamps
+
+    Returns:
+        Dictionary of day (as int64) to (rows, checksum), or None when data
+        has no correction date column to tell corrected rows
+    """
+    modified = _find_column(data, MODIFIED_COLUMN)
+    if modified is None:
+        return None
+    columns = [column for column in map(lambda name: _find_column(data, name), RECORD_COLUMNS) if column is not None]
+    hashes = pd.util.hash_pandas_object(data[columns + [modified]], index=False).to_numpy()
+    days, inverse, rows = np.unique(day_values, return_inverse=True, return_counts=True)
+    # Order-independent checksum of the day's rows (wrapping sum)
+    checksums = np.zeros(len(days), dtype=np.uint64)
+    np.add.at(checksums, inverse, hashes)
+    return {day: (count, checksum) for day, count, checksum in zip(days.tolist(), rows.tolist(), checksums.tolist())}
+
+def build_cube(data, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES, ratios=CUBE_RATIOS, date_column='DATE', source=None):
+    """
+    Materialize the cube of a loaded frame: its measures summed by day and dimensions
+
+    Each cell holds the rows of one day and one combination of dimension
+    values, with the sum and non-missing count of every measure, so sums
+    and means over any filter on the day and the dimensions are computed
+    from the cells instead of the rows. The cells are indexed like the
+    loaded rows (date order, bitmaps), so FilterPlan filters them quickly.
+
+    When the previous cube of the same source is known, the cells of the
+    days whose rows did not change (same number of rows, same record
+    numbers and correction dates) are kept, and only the rows of new or
+    corrected days are grouped and summed.
+
+    Args:
+        data: Loaded DataFrame (sorted by date)
+        dimensions: Columns to group by besides the day
+        measures: Numeric columns to sum
+        ratios: Pairs of columns whose row ratio is a measure too
+        date_column: Column name containing date values
+        source: Name of what data was loaded from (path and projection), to
+            update the cube of its previous load instead of rebuilding it
+    """
+    if date_column not in data.columns or not pd.api.types.is_datetime64_any_dtype(data[date_column]):
+        return
+    dimensions = [column for column in dimensions if column in data.columns]
+    measures = [column for column in measures if column in data.columns and pd.api.types.is_numeric_dtype(data[column])]
+    measures += [
+        _ratio_name(numerator, denominator) for numerator, denominator in ratios
+        if numerator in measures and denominator in measures
+    ]
+
+    dates = data[date_column]
+    days = dates.dt.normalize()
+    # Days as integers (missing dates first, like the rows)
+    day_values = days.to_numpy().view(np.int64)
+    stamps = _day_stamps(data, day_values)
+
+    previous = _latest_cubes.get(source) if source is not None else None
+    if (previous is None or stamps is None or previous['stamps'] is None or previous['dimensions'] != dimensions
+            or list(previous['base']) != measures or previous['date_column'] != date_column):
+        previous = None
+        kept_days = np.array([], dtype=np.int64)
+        rows = np.arange(len(data))
+    else:
+        kept_days = np.array([day for day, stamp in stamps.items() if previous['stamps'].get(day) == stamp], dtype=np.int64)
+        rows = np.flatnonzero(~np.isin(day_values, kept_days))
+
+    # Group the rows of the days to (re)build
+    keys = pd.DataFrame({date_column: days, **{column: data[column] for column in dimensions}}).iloc[rows]
+    cells = keys.groupby(list(keys.columns), observed=True, dropna=False, sort=False).ngroup().to_numpy()
+    _, first_rows = np.unique(cells, return_index=True)
+    keys = keys.iloc[first_rows].reset_index(drop=True)
+    size = len(keys)
+    base, buffers = {}, {}
+    for measure in measures:
+        values, buffers[measure] = _measure_values(data, measure)
+        base[measure] = _aggregate(cells, size, values[rows], _measure_dtype(data, measure))
+    cell_rows = np.bincount(cells, minlength=size)
+
+    if previous is not None:
+        # Add the kept cells of the unchanged days, then put the cells back in date order
+        kept = np.flatnonzero(np.isin(previous['keys'][date_column].to_numpy().view(np.int64), kept_days))
+        kept_keys = previous['keys'].iloc[kept].astype({column: data[column].dtype for column in dimensions})
+        keys = pd.concat([kept_keys, keys], ignore_index=True)
+        order = np.argsort(keys[date_column].to_numpy().view(np.int64), kind='stable')
+        keys = keys.iloc[order].reset_index(drop=True)
+        cell_rows = np.concatenate([previous['rows'][kept], cell_rows])[order]
+        for measure in measures:
+            total = np.concatenate([previous['base'][measure][0][kept], base[measure][0]])[order]
+            count = np.concatenate([previous['base'][measure][1][kept], base[measure][1]])[order]
+            base[measure] = (total, count)
+        print(f"Cube updated: {len(rows)} rows of {len(data)} regrouped, {len(kept)} cells kept")
+        cells = None
+    register_date_index(keys, date_column)
+    build_bitmap_index(keys, dimensions)
+
+    cube = {
+        'date_column': date_column,
+        'dimensions': dimensions,
+        # A date filter selects the same rows as its days' cells when rows are whole days
+        'exact_days': bool((dates.dropna() == days.dropna()).all()),
+        'cells': cells,
+        'keys': keys,
+        'rows': cell_rows,
+        'stamps': stamps,
+        # Sums and counts of the measures as loaded, the base of the next load's update
+        'base': base,
+        'measures': {
+            measure: {'buffers': buffers[measure], 'sum': total, 'count': count}
+            for measure, (total, count) in base.items()
+        },
+        'frame': None
+    }
+    attach_index(data, 'cube', cube)
+    if source is not None:
+        _latest_cubes[source] = cube
+
+def _cube_frame(cube, data):
+    """Frame of the cells, re-aggregating the measures whose columns changed in data (repricing)"""
+    measures = dict(cube['measures'])
+    changed = False
+    for measure, aggregate in measures.items():
+        current = [column_buffer(data[column]) for column in measure.split('/') if column in data.columns]
+        if len(current) != len(aggregate['buffers']) or not all(
+            np.may_share_memory(buffer, indexed) for buffer, indexed in zip(current, aggregate['buffers'])
+        ):
+            measures[measure] = _aggregate_measure(cube, data, measure)
+            changed = True
+
+    frame = cube['frame']
+    if frame is None or changed:
+        # Shallow copy of the keys: the cells keep their date and bitmap indexes
+        frame = cube['keys'].copy(deep=False)
+        for measure, aggregate in measures.items():
+            frame[measure] = aggregate['sum']
+            frame[measure + COUNT_SUFFIX] = aggregate['count']
+        frame[ROWS_COLUMN] = cube['rows']
+        frame.attrs = {CUBE_ATTR: True}
+        cube['measures'], cube['frame'] = measures, frame
+    return frame
+
+def cube_cells(plan):
+    """
+    Answer a filter plan over the loaded rows from their cube
+
+    Args:
+        plan: FilterPlan over a frame with a cube (see build_cube)
+
+    Returns:
+        DataFrame of the cells passing the plan's filters (columns: the day,
+        the dimensions, the measure sums and counts), or None when the cube
+        cannot answer: no cube, a filter on a column that is not a
+        dimension, or a date filter on rows that are not whole days
+    """
+    cube = find_index(plan.data, 'cube')
+    if cube is None:
+        return None
+    for predicate in plan.predicates:
+        if predicate['column'] == cube['date_column']:
+            if not cube['exact_days']:
+                return None
+        elif predicate['column'] not in cube['dimensions']:
+            return None
+    return plan.on(_cube_frame(cube, plan.data)).apply()
+
+def is_cube_cells(frame):
+    """Whether a frame holds cube cells rather than rows"""
+    return bool(frame.attrs.get(CUBE_ATTR))
+
+def measure_mean(frame, column):
+    """
+    Mean of a measure over rows or cube cells (missing values skipped)
+
+    Args:
+        frame: DataFrame of rows, or of cells from cube_cells
+        column: Measure column
+
+    Returns:
+        Mean value (NaN when there is no value)
+    """
+    if not is_cube_cells(frame):
+        return frame[column].mean()
+    count = frame[column + COUNT_SUFFIX].sum()
+    return frame[column].sum() / count if count else np.nan
+
+def ratio_mean(frame, numerator, denominator):
+    """
+    Mean of the row ratio numerator / denominator (rows with a zero denominator skipped)
+
+    Args:
+        frame: DataFrame of rows, or of cells from cube_cells
+        numerator: Numerator column
+        denominator: Denominator column
+
+    Returns:
+        Mean ratio (NaN when there is no value)
+    """
+    if not is_cube_cells(frame):
+        return (frame[numerator] / frame[denominator].replace(0, np.nan)).mean()
+    return measure_mean(frame, _ratio_name(numerator, denominator))
+
+def aggregate_measures(frame, by, aggregations):
+    """
+    Group rows or cube cells and aggregate measures, like groupby(by).agg(aggregations).reset_index()
+
+    Args:
+        frame: DataFrame of rows, or of cells from cube_cells
+        by: Column or list of columns to group by
+        aggregations: Dictionary of measure column to 'sum' or 'mean'
+
+    Returns:
+        DataFrame with a row per group
+    """
+    if not is_cube_cells(frame):
+        return frame.groupby(by, observed=True).agg(aggregations).reset_index()
+    columns = []
+    for column, how in aggregations.items():
+        columns += [column, column + COUNT_SUFFIX] if how == 'mean' else [column]
+    sums = frame.groupby(by, observed=True)[columns].sum()
+    result = pd.DataFrame(index=sums.index)
+    for column, how in aggregations.items():
+        if how == 'mean':
+            result[column] = sums[column] / sums[column + COUNT_SUFFIX].replace(0, np.nan)
+        else:
+            result[column] = sums[column]
+    return result.reset_index()
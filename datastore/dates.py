@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from datastore.indexes import attach_index, find_index, slice_rows
+
+def sort_by_date(data, date_column='DATE'):
+    """
+    Sort rows by date, rows without a date first
+
+    The sort is stable: rows of the same date keep the export's order.
+
+    Args:
+        data: DataFrame to sort
+        date_column: Column name containing date values
+
+    Returns:
+        Sorted DataFrame numbered from 0 (data itself if already sorted)
+    """
+    if date_column not in data.columns:
+        return data
+    dates = data[date_column]
+    missing = int(dates.isna().sum())
+    if dates.iloc[:missing].isna().all() and dates.iloc[missing:].is_monotonic_increasing:
+        return data
+    return data.sort_values(date_column, kind='stable', na_position='first').reset_index(drop=True)
+
+def register_date_index(data, date_column='DATE'):
+    """
+    Index the date order of a frame sorted by sort_by_date
+
+    apply_date_filter then finds a date range by binary search and returns
+    it as a view of the rows, on this frame and on any frame sharing its rows.
+
+    Args:
+        data: DataFrame sorted by date
+        date_column: Column name containing date values
+    """
+    if date_column not in data.columns or not pd.api.types.is_datetime64_any_dtype(data[date_column]):
+        return
+    dates = data[date_column]
+    missing = int(dates.isna().sum())
+    if not (dates.iloc[:missing].isna().all() and dates.iloc[missing:].is_monotonic_increasing):
+        return
+    attach_index(data, 'dates', {'date_column': date_column, 'missing': missing, 'buffer': dates.to_numpy()})
+
+def date_range_positions(data, start_date=None, end_date=None, date_column='DATE'):
+    """
+    Find the rows of a date-sorted frame within a date range by binary search
+
+    Args:
+        data: DataFrame registered with register_date_index (or sharing its rows)
+        start_date: Start of the range (inclusive), or None
+        end_date: End of the range (inclusive), or None
+        date_column: Column name containing date values
+
+    Returns:
+        Tuple (start, stop) of row positions, or None when data has no date index
+    """
+    index = find_index(data, 'dates')
+    if index is None or index['date_column'] != date_column:
+        return None
+    dates = data[date_column].to_numpy()
+    if not np.may_share_memory(dates, index['buffer']):
+        # The date column was replaced after indexing
+        return None
+
+    if start_date is None and end_date is None:
+        return 0, len(dates)
+
+    # Missing dates never satisfy a bound
+    dated = dates[index['missing']:]
+    start = index['missing']
+    stop = len(dates)
+    if start_date is not None:
+        start += int(np.searchsorted(dated, pd.Timestamp(start_date).to_datetime64(), side='left'))
+    if end_date is not None:
+        stop = index['missing'] + int(np.searchsorted(dated, pd.Timestamp(end_date).to_datetime64(), side='right'))
+    return start, max(start, stop)
+
+def slice_dates(data, start_date=None, end_date=None, date_column='DATE'):
+    """
+    Get the rows of a date range as a view, without copying or scanning
+
+    Args:
+        data: DataFrame registered with register_date_index (or sharing its rows)
+        start_date: Start of the range (inclusive), or None
+        end_date: End of the range (inclusive), or None
+        date_column: Column name containing date values
+
+    Returns:
+        View of the rows within the range, or None when data has no date index
+    """
+    positions = date_range_positions(data, start_date, end_date, date_column)
+    if positions is None:
+        return None
+    return slice_rows(data, *positions)
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from datastore.bitmaps import bitmap_value_counts
+
+# Dropdowns of the filter panels: key of their values in the filters, and
+# the columns they filter (the first one present)
+FACETS = {
+    'chains': ['idchainemontage', 'IDchainemontage', 'Chaine'],
+    'operations': ['Operation'],
+    'controllers': ['idcontroleur', 'IDcontroleur', 'IDControleur', 'Controleur'],
+    'categories': ['Categorie'],
+}
+
+# Number of facet counts kept (the least recently used are evicted)
+FACET_CACHE_SIZE = 256
+
+# Value counts by (frame's rows, plan signature, column)
+_facet_cache = OrderedDict()
+
+def facet_column(data, facet, columns=None):
+    """Column a facet filters in data (columns overriding FACETS), or None when data has none of them"""
+    candidates = [columns[facet]] if columns and facet in columns else FACETS[facet]
+    return next((column for column in candidates if column in data.columns), None)
+
+def _selected_value_counts(plan, column):
+    """Count each value (as a string) of a column over a plan's rows, reading the column"""
+    series = plan.apply([column])[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.array.codes
+        counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+        labels = pd.Index(series.cat.categories).astype(str)
+        result = {label: int(count) for label, count in zip(labels, counts)}
+        missing = int(np.count_nonzero(codes < 0))
+        if missing:
+            result['nan'] = result.get('nan', 0) + missing
+        return result
+    return {str(label): int(count) for label, count in series.astype(str).value_counts().items()}
+
+def facet_counts(data, filters, build_plan, facets=None, columns=None):
+    """
+    Values of each dropdown still reachable under the other active filters, with their row counts
+
+    The counts of a facet ignore its own selection (its other values stay
+    offered) but apply every other filter. Indexed columns are counted from
+    the bitmap index over the selection, the others from the selected rows;
+    counts are cached by the filters they were computed under.
+
+    Args:
+        data: Loaded DataFrame
+        filters: Filter values of the panel ('start_date', 'end_date',
+            'chains', 'operations', 'controllers', 'categories'...)
+        build_plan: Function building the FilterPlan of (data, filters) the
+            way the panel filters (e.g. all_filters_plan)
+        facets: Facets to count, among FACETS (None for all)
+        columns: Column of each facet, when build_plan filters other columns
+            than FACETS' first present candidate
+
+    Returns:
+        Dictionary of facet to {value (as a string): rows}, for the facets
+        whose column is in data, values in sorted order
+    """
+    results = {}
+    for facet in facets or FACETS:
+        column = facet_column(data, facet, columns)
+        if column is None:
+            continue
+        plan = build_plan(data, dict(filters, **{facet: None}))
+        key = (id(data.index), len(data), plan.signature(), column)
+        counts = _facet_cache.get(key)
+        if counts is None:
+            counts = bitmap_value_counts(data, column, plan.selection())
+            if counts is None:
+                counts = _selected_value_counts(plan, column)
+            counts = dict(sorted(counts.items()))
+            _facet_cache[key] = counts
+            while len(_facet_cache) > FACET_CACHE_SIZE:
+                _facet_cache.popitem(last=False)
+        else:
+            _facet_cache.move_to_end(key)
+        results[facet] = counts
+    return results
+
+def facet_options(counts, selected=None):
+    """
+    Values to offer in a dropdown: those with rows, and those already selected
+
+    Args:
+        counts: Value counts of the facet (from facet_counts)
+        selected: Values selected in the dropdown
+
+    Returns:
+        Sorted list of values (as strings)
+    """
+    values = {value for value, rows in counts.items() if rows > 0}
+    values.update(str(value) for value in selected or [])
+    return sorted(values)
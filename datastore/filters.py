@@ -0,0 +1,290 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from datastore.bitmaps import bitmap_count, bitmap_mask
+from datastore.dates import date_range_positions
+from datastore.indexes import slice_rows
+
+# Share of the rows a predicate is assumed to keep when no index can tell
+DEFAULT_SELECTIVITY = {'date': 0.5, 'isin': 0.25, 'between': 0.5}
+
+# Once fewer rows than this share are left, the next predicates only read
+# the values of those rows instead of the whole column
+GATHER_MAX_RATIO = 1 / 8
+
+def _to_datetime(value):
+    """Convert a date bound like the date filters do, None when it is empty or invalid"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return pd.to_datetime(value)
+    except Exception:
+        return None
+
+def _isin_strings(series, values):
+    """Rows of a series whose value, as a string, is one of values"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Compare each category once; missing values (code -1) read as 'nan'
+        hits = pd.Index(series.cat.categories).astype(str).isin(values)
+        return np.append(hits, 'nan' in values)[series.array.codes]
+    return series.astype(str).isin(values).to_numpy()
+
+def _evaluate(predicate, series):
+    """Boolean array of the rows of a series satisfying a predicate"""
+    kind = predicate['kind']
+    if kind == 'isin':
+        if predicate['as_str']:
+            return _isin_strings(series, predicate['values'])
+        return series.isin(predicate['values']).to_numpy()
+
+    # Ranges: missing values never satisfy a bound
+    low, high = predicate['low'], predicate['high']
+    mask = np.ones(len(series), dtype=bool)
+    if low is not None:
+        mask &= (series >= low).to_numpy()
+    if high is not None:
+        mask &= (series <= high).to_numpy()
+    return mask
+
+class FilterPlan:
+    """
+    Filters of a frame, evaluated together into one selection of its rows
+
+    Predicates are only recorded when added. On evaluation, date ranges on
+    the loaded data (sorted by date) narrow the rows to a window by binary
+    search, categorical filters on indexed columns come from the bitmap
+    index, and the other predicates read their column within that window,
+    the most selective first. The selected rows (and only the columns asked
+    for) are copied once, by apply.
+
+    Example:
+        FilterPlan(data).date_range(start, end).isin('Chaine', chains).apply(columns)
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.predicates = []
+        self._selection = None
+
+    def _add(self, predicate):
+        self.predicates.append(predicate)
+        self._selection = None
+        return self
+
+    def date_range(self, start_date=None, end_date=None, column='DATE'):
+        """
+        Keep the rows within a date range (bounds inclusive)
+
+        Args:
+            start_date: Start date, as a datetime or a string; empty or invalid to leave open
+            end_date: End date, as a datetime or a string; empty or invalid to leave open
+            column: Column name containing date values (ignored when missing)
+
+        Returns:
+            The plan, to chain further filters
+        """
+        start_date, end_date = _to_datetime(start_date), _to_datetime(end_date)
+        if column not in self.data.columns or (start_date is None and end_date is None):
+            return self
+        return self._add({'kind': 'date', 'column': column, 'low': start_date, 'high': end_date})
+
+    def isin(self, column, values, as_str=True):
+        """
+        Keep the rows whose value in a column is one of values
+
+        Args:
+            column: Column name (ignored when missing)
+            values: Value or list of values; empty to leave the column unfiltered
+            as_str: Compare values as strings, like the categorical filters of the
+                dashboards do (and the bitmap index supports); False to compare them as is
+
+        Returns:
+            The plan, to chain further filters
+        """
+        if column not in self.data.columns or not values:
+            return self
+        if not isinstance(values, list):
+            values = [values]
+        if as_str:
+            values = [str(value) for value in values]
+        return self._add({'kind': 'isin', 'column': column, 'values': values, 'as_str': as_str})
+
+    def between(self, column, min_val=None, max_val=None):
+        """
+        Keep the rows whose value in a column lies within a range (bounds inclusive)
+
+        Args:
+            column: Column name (ignored when missing)
+            min_val: Minimum value, or None
+            max_val: Maximum value, or None
+
+        Returns:
+            The plan, to chain further filters
+        """
+        if column not in self.data.columns or (min_val is None and max_val is None):
+            return self
+        return self._add({'kind': 'between', 'column': column, 'low': min_val, 'high': max_val})
+
+    def on(self, data):
+        """
+        Get a plan with the same predicates over another frame
+
+        Args:
+            data: DataFrame with the filtered columns (e.g. the cells of a cube)
+
+        Returns:
+            New FilterPlan
+        """
+        plan = FilterPlan(data)
+        plan.predicates = list(self.predicates)
+        return plan
+
+    def signature(self):
+        """
+        Describe the predicates independently of the order they were added in
+
+        Plans with the same filters (values deduplicated and sorted, dates and
+        numbers normalized) have the same signature, to share their selection.
+
+        Returns:
+            Hashable tuple
+        """
+        def bound(value):
+            if value is None:
+                return None
+            if isinstance(value, (datetime, pd.Timestamp, np.datetime64)):
+                return pd.Timestamp(value).isoformat()
+            if isinstance(value, (int, float, np.number)):
+                return float(value)
+            return repr(value)
+
+        described = []
+        for predicate in self.predicates:
+            if predicate['kind'] == 'isin':
+                values = tuple(sorted({repr(value) for value in predicate['values']}))
+                described.append(('isin', predicate['column'], predicate['as_str'], values))
+            else:
+                described.append((predicate['kind'], predicate['column'], bound(predicate['low']), bound(predicate['high'])))
+        return tuple(sorted(described, key=repr))
+
+    def selection(self):
+        """
+        Evaluate the predicates, without materializing the rows
+
+        Returns:
+            Tuple (start, stop, mask): rows start:stop of data, of which those
+            where mask is True (all of them when mask is None)
+        """
+        return self._select()
+
+    def reuse(self, selection):
+        """
+        Use the selection of a plan with the same signature over the same rows
+
+        Args:
+            selection: Tuple returned by selection
+
+        Returns:
+            The plan, to apply without evaluating its predicates
+        """
+        self._selection = selection
+        return self
+
+    def _estimate(self, predicate):
+        """Estimated share of the rows a predicate keeps"""
+        if predicate['kind'] == 'isin' and predicate['as_str']:
+            counts = bitmap_count(self.data, predicate['column'], predicate['values'])
+            if counts is not None:
+                matching, rows = counts
+                return matching / rows if rows else 0.0
+        return DEFAULT_SELECTIVITY[predicate['kind']]
+
+    def _select(self):
+        """Evaluate the predicates into (start, stop, mask over rows start:stop or None)"""
+        if self._selection is not None:
+            return self._selection
+
+        data = self.data
+        start, stop = 0, len(data)
+        indexed = []
+        scans = []
+        for predicate in self.predicates:
+            if predicate['kind'] == 'date':
+                positions = date_range_positions(data, predicate['low'], predicate['high'], predicate['column'])
+                if positions is not None:
+                    start, stop = max(start, positions[0]), min(stop, positions[1])
+                    continue
+            elif predicate['kind'] == 'isin' and predicate['as_str'] \
+                    and bitmap_count(data, predicate['column'], predicate['values']) is not None:
+                # Group the indexed filters, a column at most once per group
+                column = predicate['column']
+                group = next((group for group in indexed if column not in group), None)
+                if group is None:
+                    indexed.append({})
+                    group = indexed[-1]
+                group[column] = predicate['values']
+                continue
+            scans.append(predicate)
+        stop = max(start, stop)
+
+        mask = None
+        if indexed:
+            mask = np.logical_and.reduce([bitmap_mask(data, group) for group in indexed])[start:stop]
+
+        # Most selective predicates first, so the others read fewer rows
+        for predicate in sorted(scans, key=self._estimate):
+            series = data[predicate['column']].iloc[start:stop]
+            if mask is None:
+                mask = _evaluate(predicate, series)
+                continue
+            survivors = np.flatnonzero(mask)
+            if len(survivors) < len(mask) * GATHER_MAX_RATIO:
+                mask = np.zeros(len(mask), dtype=bool)
+                mask[survivors[_evaluate(predicate, series.iloc[survivors])]] = True
+            else:
+                mask &= _evaluate(predicate, series)
+
+        self._selection = (start, stop, mask)
+        return self._selection
+
+    def positions(self):
+        """
+        Row positions of data passing every predicate
+
+        Returns:
+            Sorted array of row positions
+        """
+        start, stop, mask = self._select()
+        if mask is None:
+            return np.arange(start, stop)
+        return start + np.flatnonzero(mask)
+
+    def count(self):
+        """Number of rows passing every predicate, without materializing them"""
+        start, stop, mask = self._select()
+        return stop - start if mask is None else int(np.count_nonzero(mask))
+
+    def apply(self, columns=None):
+        """
+        Materialize the rows passing every predicate
+
+        Args:
+            columns: Columns to keep (those missing from data are skipped), or None for all
+
+        Returns:
+            New DataFrame of the selected rows, a view sharing data's buffers when
+            they are a contiguous range of it (a date range)
+        """
+        start, stop, mask = self._select()
+        data = self.data
+        if columns is not None:
+            # Column subsets keep the row index, hence the indexes of data
+            data = data[[column for column in columns if column in data.columns]]
+
+        if mask is not None:
+            return data.iloc[start + np.flatnonzero(mask)]
+        if (start, stop) == (0, len(data)):
+            return data.copy(deep=False) if columns is None else data
+        return slice_rows(data, start, stop)
@@ -0,0 +1,88 @@
+import weakref
+import pandas as pd
+
+# Indexes built over the rows of loaded frames: (weak reference to the frame's
+# row index, kind of index, index). Frames sharing that row index (shallow or
+# deep copies, column subsets, added columns) have the same rows in the same
+# order, so they can use the index too.
+_row_indexes = []
+
+# Kind of the entries recording that a frame is a slice of an indexed frame
+VIEW = 'view'
+
+def _drop_dead(kind=None, data=None):
+    _row_indexes[:] = [
+        (ref, name, value) for ref, name, value in _row_indexes
+        if ref() is not None and not (name == kind and data.index.is_(ref()))
+    ]
+
+def _lookup(row_index, kind):
+    for ref, name, value in _row_indexes:
+        indexed = ref()
+        if name == kind and indexed is not None and row_index.is_(indexed):
+            return value
+    return None
+
+def column_buffer(series):
+    """Array holding a column's values, to tell whether the column was replaced since indexing"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.array.codes
+    return series.to_numpy()
+
+def attach_index(data, kind, index):
+    """
+    Attach an index over the rows of a frame
+
+    Args:
+        data: DataFrame the index describes
+        kind: Name of the kind of index ('dates', 'bitmaps'...)
+        index: Index object, replacing any index of the same kind on these rows
+    """
+    _drop_dead(kind, data)
+    _row_indexes.append((weakref.ref(data.index), kind, index))
+
+def find_index(data, kind):
+    """Get the index of a kind attached to the rows of a frame, or None"""
+    return _lookup(data.index, kind)
+
+def find_rows(data, kind):
+    """
+    Get the index of a kind covering the rows of a frame or of the frame it was sliced from
+
+    Args:
+        data: DataFrame, possibly a view made by slice_rows
+        kind: Name of the kind of index
+
+    Returns:
+        Tuple (index, position of data's first row in the indexed frame), or (None, 0)
+    """
+    index = _lookup(data.index, kind)
+    if index is not None:
+        return index, 0
+    view = _lookup(data.index, VIEW)
+    if view is not None:
+        source_index, offset = view
+        index = _lookup(source_index, kind)
+        if index is not None:
+            return index, offset
+    return None, 0
+
+def slice_rows(data, start, stop):
+    """
+    Take a contiguous range of rows as a view that keeps using the indexes of data
+
+    Args:
+        data: DataFrame
+        start: Position of the first row
+        stop: Position after the last row
+
+    Returns:
+        DataFrame of rows start:stop sharing data's buffers
+    """
+    view = data.iloc[start:stop]
+    source = _lookup(data.index, VIEW)
+    source_index, offset = source if source is not None else (data.index, 0)
+    _drop_dead()
+    # The view keeps the source's row index alive, hence its indexes
+    _row_indexes.append((weakref.ref(view.index), VIEW, (source_index, offset + start)))
+    return view
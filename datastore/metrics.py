@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+from datastore.costs import DEFAULT_UNIT_PRICE
+from datastore.topk import top_k_positions
+
+# Name of the row count component (counts rows whatever the column values)
+ROWS = None
+
+def _part(column, how):
+    """Column of the grouped components holding an aggregation of a column"""
+    return 'rows' if column is ROWS else f'{how}({column})'
+
+def column_metric(column, how='sum'):
+    """
+    Metric aggregating one column
+
+    Means are computed as sum / count, so they are exact at any grain.
+
+    Args:
+        column: Column to aggregate (ROWS with 'size' to count the rows)
+        how: 'sum', 'count', 'mean', 'min', 'max' or 'size'
+
+    Returns:
+        Metric definition: its components (column, aggregation) and the
+        function finalizing them from the grouped components
+    """
+    if how == 'mean':
+        return {
+            'components': [(column, 'sum'), (column, 'count')],
+            'finalize': lambda parts: parts[_part(column, 'sum')] / parts[_part(column, 'count')].replace(0, np.nan)
+        }
+    return {'components': [(column, how)], 'finalize': lambda parts: parts[_part(column, how)]}
+
+def ratio_metric(numerator, denominator, scale=1, fallback=None):
+    """
+    Metric Σnumerator / Σdenominator × scale, NaN where the denominator sums to 0
+
+    Args:
+        numerator: Column summed as numerator
+        denominator: Column summed as denominator
+        scale: Factor applied to the ratio (100 for a percentage)
+        fallback: Optional (column, factor): where the denominator sums to 0
+            (or is not loaded), Σcolumn × factor is used instead
+
+    Returns:
+        Metric definition, as column_metric
+    """
+    # With a fallback, either denominator will do: both are summed when loaded
+    if fallback is None:
+        components, optional = [(numerator, 'sum'), (denominator, 'sum')], []
+    else:
+        components, optional = [(numerator, 'sum')], [(denominator, 'sum'), (fallback[0], 'sum')]
+
+    def finalize(parts):
+        base = parts[_part(denominator, 'sum')] if _part(denominator, 'sum') in parts else pd.Series(0.0, index=parts.index)
+        if fallback is not None and _part(fallback[0], 'sum') in parts:
+            base = base.where(base != 0, parts[_part(fallback[0], 'sum')] * fallback[1])
+        return parts[_part(numerator, 'sum')] / base.replace(0, np.nan) * scale
+
+    return {'components': components, 'optional': optional, 'finalize': finalize}
+
+# Metrics of the analytics pages. Each declares the aggregations it is made
+# of and how to finalize them on the grouped result; any other numeric column
+# is summed.
+METRIC_REGISTRY = {
+    'CNQ': column_metric('CNQ'),
+    'Retouche': column_metric('Retouche'),
+    'Rebut': column_metric('Rebut'),
+    'Penalite': column_metric('Penalite'),
+    # %CNQ = ΣCNQ / ΣValeurOF (Quantite × the cost model's assumed unit price without OF values)
+    'CNQ_Percentage': ratio_metric('CNQ', 'ValeurOF', scale=100, fallback=('Quantite', DEFAULT_UNIT_PRICE)),
+    # Taux de retouche = ΣQtte / ΣQtteSondee
+    'TauxRetouche': ratio_metric('Qtte', 'QtteSondee', scale=100),
+    'CNQ_Moyen': column_metric('CNQ', 'mean'),
+    'CNQ_Min': column_metric('CNQ', 'min'),
+    'CNQ_Max': column_metric('CNQ', 'max'),
+    'NbEnregistrements': column_metric(ROWS, 'size'),
+}
+
+# Metrics offered by the analytics pages, in display order
+ANALYTICS_METRICS = [
+    'CNQ', 'CNQ_Percentage', 'Retouche', 'Rebut', 'Penalite',
+    'TauxRetouche', 'CNQ_Moyen', 'CNQ_Min', 'CNQ_Max', 'NbEnregistrements'
+]
+
+def metric_definition(data, name):
+    """
+    Get how a metric is computed over a frame
+
+    Args:
+        data: DataFrame the metric is computed on
+        name: Registered metric, or a numeric column (summed)
+
+    Returns:
+        Metric definition, or None when data lacks its columns
+    """
+    definition = METRIC_REGISTRY.get(name)
+    if definition is not None:
+        required = [column for column, _ in definition['components'] if column is not ROWS]
+        return definition if all(column in data.columns for column in required) else None
+    if name in data.columns and pd.api.types.is_numeric_dtype(data[name]):
+        return column_metric(name)
+    return None
+
+def available_metrics(data, names=None):
+    """
+    Metrics that can be computed over a frame
+
+    Args:
+        data: DataFrame
+        names: Metric names to check, or None for the registered metrics
+
+    Returns:
+        List of metric names, in the given order
+    """
+    names = list(METRIC_REGISTRY) if names is None else names
+    return [name for name in names if metric_definition(data, name) is not None]
+
+def _definitions(data, metrics):
+    """Definitions of the metrics data can compute, by name"""
+    definitions = {}
+    for name in metrics:
+        definition = metric_definition(data, name)
+        if definition is not None:
+            definitions[name] = definition
+    return definitions
+
+def _components(data, definitions):
+    """Aggregations the metrics are made of (shared between metrics), those data has"""
+    components = {}
+    for definition in definitions.values():
+        for column, how in definition['components'] + definition.get('optional', []):
+            if column is ROWS or column in data.columns:
+                components[(column, how)] = None
+    return list(components)
+
+def aggregate_metrics(data, group_by, metrics, sort_by=None, limit=None):
+    """
+    Compute metrics per group in one groupby pass
+
+    The aggregations the metrics are made of (shared between metrics) are
+    computed together, then each metric is finalized on the grouped result,
+    so ratios are ratios of sums rather than sums or means of row ratios.
+    The sort and limit are applied on the grouped arrays by partial
+    selection: only the groups reaching the limit are ordered.
+
+    Args:
+        data: DataFrame of rows
+        group_by: Columns to group by (present in data)
+        metrics: Metric names (see metric_definition); those data cannot
+            compute are skipped
+        sort_by: Metric to order the groups by, largest first (missing
+            values last), or None to keep the groupby order
+        limit: Number of groups to keep (the first ones in the groupby
+            order when sort_by is not computed), or None/0 for all
+
+    Returns:
+        DataFrame with the group_by columns then a column per metric, or
+        None when no metric can be computed
+    """
+    definitions = _definitions(data, metrics)
+    if not definitions:
+        return None
+
+    aggregations = {}
+    for column, how in _components(data, definitions):
+        aggregations[_part(column, how)] = (group_by[0], 'size') if column is ROWS else (column, how)
+    # Ranked groups are ordered by top_k_positions: the groupby need not sort its keys
+    ranked = sort_by in definitions
+    parts = data.groupby(group_by, observed=True, sort=not ranked).agg(**aggregations)
+
+    result = pd.DataFrame(index=parts.index)
+    for name, definition in definitions.items():
+        result[name] = definition['finalize'](parts)
+    if ranked:
+        result = result.iloc[top_k_positions(result[sort_by].to_numpy(), limit if limit and limit > 0 else len(result))]
+    elif limit and limit > 0:
+        result = result.iloc[:limit]
+    return result.reset_index()
+
+def total_metrics(data, metrics):
+    """
+    Compute metrics over all the rows of a frame
+
+    The same definitions as aggregate_metrics, with the whole frame as one
+    group: sums are totals, ratios are ratios of the totals.
+
+    Args:
+        data: DataFrame of rows
+        metrics: Metric names (see metric_definition); those data cannot
+            compute are skipped
+
+    Returns:
+        Series of the metric values, indexed by metric name
+    """
+    definitions = _definitions(data, metrics)
+    parts = pd.DataFrame({
+        _part(column, how): [len(data) if column is ROWS else data[column].agg(how)]
+        for column, how in _components(data, definitions)
+    })
+    return pd.Series({name: definition['finalize'](parts).iloc[0] for name, definition in definitions.items()}, dtype=float)
+
+def row_metrics(data, metrics):
+    """
+    Values of metrics on each row of a frame
+
+    A metric that is a column of data is taken as is; the others are
+    finalized with every row as its own group (a ratio of the row's values,
+    1 for a row count), as aggregate_metrics would over one row.
+
+    Args:
+        data: DataFrame of rows
+        metrics: Metric names (see metric_definition); those data cannot
+            compute are skipped
+
+    Returns:
+        DataFrame with a column per metric, indexed like data
+    """
+    definitions = _definitions(data, metrics)
+    parts = {}
+    for column, how in _components(data, {name: definition for name, definition in definitions.items() if name not in data.columns}):
+        if column is ROWS or how == 'size':
+            parts[_part(column, how)] = np.ones(len(data), dtype=np.int64)
+        elif how == 'count':
+            parts[_part(column, how)] = data[column].notna().astype(np.int64)
+        elif how == 'sum':
+            # The sum of one missing value is 0, as in a groupby
+            parts[_part(column, how)] = data[column].fillna(0)
+        else:
+            parts[_part(column, how)] = data[column]
+    parts = pd.DataFrame(parts, index=data.index)
+    return pd.DataFrame({
+        name: data[name] if name in data.columns else definition['finalize'](parts)
+        for name, definition in definitions.items()
+    }, index=data.index)
@@ -0,0 +1,89 @@
+import pandas as pd
+
+# Partition of rows whose date is missing
+UNDATED = 'undated'
+
+def partition_labels(dates):
+    """
+    Name the year/month partition of each date
+
+    Args:
+        dates: Series of datetimes
+
+    Returns:
+        Series of labels like '2024-11', UNDATED for missing dates
+    """
+    return dates.dt.strftime('%Y-%m').fillna(UNDATED)
+
+def partition_order(labels):
+    """Sort partition labels chronologically, undated rows first"""
+    return sorted(labels, key=lambda label: (label != UNDATED, label))
+
+def _month_label(value):
+    """Label of the partition holding a date bound, None when it is empty or invalid"""
+    if value is None or value == '':
+        return None
+    date = pd.to_datetime(value, errors='coerce')
+    return None if pd.isna(date) else date.strftime('%Y-%m')
+
+def overlapping_partitions(labels, start_date=None, end_date=None):
+    """
+    Select the year/month partitions overlapping a date range
+
+    Args:
+        labels: Partition labels, as partition_labels names them
+        start_date: Start of the range (inclusive), as a datetime or a string; empty to leave open
+        end_date: End of the range (inclusive), as a datetime or a string; empty to leave open
+
+    Returns:
+        List of the overlapping labels, in the given order (undated rows
+        never satisfy a bound)
+    """
+    low, high = _month_label(start_date), _month_label(end_date)
+    if low is None and high is None:
+        return list(labels)
+    return [
+        label for label in labels
+        if label != UNDATED and (low is None or label >= low) and (high is None or label <= high)
+    ]
+
+class DateArchive:
+    """
+    Rows of a cached source stored in year/month partitions, read one date range at a time
+
+    Reading a range only opens the partitions overlapping it, so a narrow
+    period costs time proportional to its rows rather than to the archive's.
+    The rows read may fall outside the range by less than a month on each
+    side: apply_date_filter applies the exact bounds.
+    """
+
+    def __init__(self, labels, read, prepare=None, date_column='DATE'):
+        """
+        Args:
+            labels: Labels of the stored partitions, in the order of the rows
+            read: Callable reading the rows of a list of partition labels
+            prepare: Optional callable turning the rows read into the frame returned
+            date_column: Column name the rows are partitioned by
+        """
+        self.labels = list(labels)
+        self.date_column = date_column
+        self._read = read
+        self._prepare = prepare
+
+    def prepared(self, prepare):
+        """Get the same archive, its reads going through prepare"""
+        return DateArchive(self.labels, self._read, prepare, self.date_column)
+
+    def read(self, start_date=None, end_date=None):
+        """
+        Read the partitions overlapping a date range
+
+        Args:
+            start_date: Start of the range (inclusive), or None
+            end_date: End of the range (inclusive), or None
+
+        Returns:
+            Rows of the overlapping partitions, prepared if the archive has a prepare step
+        """
+        data = self._read(overlapping_partitions(self.labels, start_date, end_date))
+        return data if self._prepare is None else self._prepare(data)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+# Time granularities of the rollups, finest first
+ROLLUP_GRAINS = ['day', 'week', 'month', 'quarter', 'year']
+
+# Column of the rollups holding the start of each period
+PERIOD_COLUMN = 'Period'
+
+def period_starts(dates, grain):
+    """
+    Start of the period of each date, computed on the whole array at once
+
+    Weeks are ISO weeks (starting on Monday), quarters start in January,
+    April, July and October.
+
+    Args:
+        dates: Series, index or array of datetimes
+        grain: One of ROLLUP_GRAINS
+
+    Returns:
+        datetime64[ns] array (NaT where the date is missing)
+    """
+    values = np.asarray(dates, dtype='datetime64[ns]')
+    missing = np.isnat(values)
+    if grain == 'day':
+        starts = values.astype('datetime64[D]')
+    elif grain == 'week':
+        days = values.astype('datetime64[D]')
+        # 1970-01-01 was a Thursday: (day + 3) % 7 is 0 on Mondays
+        starts = days - (days.view(np.int64) + 3) % 7
+    elif grain == 'month':
+        starts = values.astype('datetime64[M]')
+    elif grain == 'quarter':
+        months = values.astype('datetime64[M]')
+        starts = months - months.view(np.int64) % 3
+    elif grain == 'year':
+        starts = values.astype('datetime64[Y]')
+    else:
+        raise ValueError(f"Unknown rollup grain: {grain}")
+    starts = starts.astype('datetime64[ns]')
+    starts[missing] = np.datetime64('NaT')
+    return starts
+
+def period_labels(starts, grain):
+    """
+    Display labels of periods: 2025-01-31, 2025-W05, 2025-01, 2025-Q1, 2025
+
+    Args:
+        starts: Series of period starts (from period_starts)
+        grain: One of ROLLUP_GRAINS
+
+    Returns:
+        Series of strings, aligned with starts
+    """
+    starts = pd.Series(starts)
+    if grain == 'day':
+        return starts.dt.strftime('%Y-%m-%d')
+    if grain == 'week':
+        iso = starts.dt.isocalendar()
+        return iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)
+    if grain == 'month':
+        return starts.dt.strftime('%Y-%m')
+    if grain == 'quarter':
+        return starts.dt.year.astype(str) + '-Q' + starts.dt.quarter.astype(str)
+    return starts.dt.year.astype(str)
+
+def time_rollups(data, measures, grains=ROLLUP_GRAINS, date_column='DATE'):
+    """
+    Sum measures by day, ISO week, month, quarter and year in one pass
+
+    The rows (or cube cells) are summed by day once; the coarser periods
+    are then summed from the daily series, so every granularity is ready
+    and switching between them only picks another frame.
+
+    Args:
+        data: DataFrame of rows, or of cells from cube_cells
+        measures: Columns to sum (those missing from data are skipped)
+        grains: Granularities to compute, among ROLLUP_GRAINS
+        date_column: Column name containing date values
+
+    Returns:
+        Dictionary of grain to DataFrame (PERIOD_COLUMN then the measures,
+        one row per period in date order, undated rows left out)
+    """
+    measures = [column for column in measures if column in data.columns]
+    days = period_starts(data[date_column], 'day')
+    daily = data[measures].groupby(days).sum()
+    daily.index.name = PERIOD_COLUMN
+
+    rollups = {}
+    for grain in grains:
+        if grain == 'day':
+            rolled = daily
+        else:
+            rolled = daily.groupby(period_starts(daily.index, grain)).sum()
+            rolled.index.name = PERIOD_COLUMN
+        rollups[grain] = rolled.reset_index()
+    return rollups
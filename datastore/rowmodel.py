@@ -0,0 +1,221 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+
+# Rows of a grid block (one page of the grid, one request of the infinite row model)
+ROW_BLOCK_SIZE = 50
+
+# Most rows a single request may ask for, so a response stays small whatever it asks
+MAX_BLOCK_ROWS = 1000
+
+# Memory budget of the published tables, kept apart from the selections' cache
+# so that masks and pages never evict them
+ROW_TABLE_BYTES = 256 * 2 ** 20
+
+# Filter operators of the grid's number and date filters, on the column values
+_COMPARISONS = {
+    'equals': lambda values, bound: values == bound,
+    'notEqual': lambda values, bound: values != bound,
+    'lessThan': lambda values, bound: values < bound,
+    'lessThanOrEqual': lambda values, bound: values <= bound,
+    'greaterThan': lambda values, bound: values > bound,
+    'greaterThanOrEqual': lambda values, bound: values >= bound,
+}
+
+# Filter operators of the grid's text filter, on lowercase labels
+_TEXT_MATCHES = {
+    'contains': lambda labels, text: labels.str.contains(text, regex=False),
+    'notContains': lambda labels, text: ~labels.str.contains(text, regex=False),
+    'equals': lambda labels, text: labels == text,
+    'notEqual': lambda labels, text: labels != text,
+    'startsWith': lambda labels, text: labels.str.startswith(text),
+    'endsWith': lambda labels, text: labels.str.endswith(text),
+}
+
+def _key(prefix, value):
+    """Cache key of a JSON-like value"""
+    text = json.dumps(value, sort_keys=True, default=str)
+    return prefix + hashlib.sha1(text.encode()).hexdigest()
+
+def rows_token(query):
+    """Token of a result table: a hash of the query it was computed from"""
+    return _key('rows:', query)
+
+def publish_rows(tables, table, query):
+    """
+    Keep a result table server-side and publish a token standing for it
+
+    The grid showing the table only gets the token: its blocks of rows are
+    then read with row_page, sorted and filtered on the server. A table over
+    the store's budget is not kept: row_page then needs the caller's copy.
+
+    Args:
+        tables: Cache of the published tables (a selection_cache of
+            ROW_TABLE_BYTES of its own, not the selections' cache)
+        table: DataFrame of the result (e.g. from calculate_aggregations)
+        query: JSON-like values the table was computed from (its query
+            signature: selection token, metrics, group-by, limit...)
+
+    Returns:
+        Token string (see rows_token)
+    """
+    token = rows_token(query)
+    if tables.get(token) is None:
+        tables.set(token, table.reset_index(drop=True))
+    return token
+
+def _text_mask(series, condition):
+    """Rows of a series whose label matches a text filter condition"""
+    text = str(condition.get('filter') or '').lower()
+    match = _TEXT_MATCHES.get(condition.get('type'), _TEXT_MATCHES['contains'])
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Match each category once; missing values never match
+        hits = match(pd.Series(series.cat.categories.astype(str)).str.lower(), text).to_numpy(dtype=bool)
+        return np.append(hits, False)[series.array.codes]
+    labels = series.astype(str).str.lower()
+    return match(labels, text).to_numpy(dtype=bool) & series.notna().to_numpy()
+
+def _condition_mask(series, condition):
+    """Rows of a series satisfying one condition of the grid's filter model"""
+    kind = condition.get('type')
+    if kind == 'blank':
+        return series.isna().to_numpy()
+    if kind == 'notBlank':
+        return series.notna().to_numpy()
+    if condition.get('filterType') == 'text':
+        return _text_mask(series, condition)
+
+    # Number and date filters: missing values never satisfy a bound
+    if condition.get('filterType') == 'date':
+        low, high = pd.to_datetime(condition.get('dateFrom')), pd.to_datetime(condition.get('dateTo'))
+    else:
+        low, high = condition.get('filter'), condition.get('filterTo')
+    if low is None:
+        return np.ones(len(series), dtype=bool)
+    if kind == 'inRange':
+        mask = (series >= low).to_numpy()
+        return mask & (series <= high).to_numpy() if high is not None else mask
+    compare = _COMPARISONS.get(kind, _COMPARISONS['equals'])
+    return compare(series, low).to_numpy(dtype=bool)
+
+def filter_mask(table, filter_model):
+    """
+    Rows of a table satisfying the grid's filter model
+
+    Args:
+        table: DataFrame
+        filter_model: Filter model of an AG Grid request ({column: condition},
+            a condition being simple or combining 'conditions' with an
+            'operator'); filters on unknown columns are ignored
+
+    Returns:
+        Boolean array, or None when nothing is filtered
+    """
+    mask = None
+    for column, model in (filter_model or {}).items():
+        if column not in table.columns:
+            continue
+        series = table[column]
+        conditions = model.get('conditions') or [
+            model[name] for name in ('condition1', 'condition2') if model.get(name)
+        ]
+        if conditions:
+            masks = [_condition_mask(series, condition) for condition in conditions]
+            column_mask = np.logical_or.reduce(masks) if model.get('operator') == 'OR' else np.logical_and.reduce(masks)
+        else:
+            column_mask = _condition_mask(series, model)
+        mask = column_mask if mask is None else mask & column_mask
+    return mask
+
+def ordered_positions(table, sort_model=None, filter_model=None):
+    """
+    Positions of the rows of a table to show, filtered then sorted
+
+    Args:
+        table: DataFrame
+        sort_model: Sort model of an AG Grid request ([{'colId', 'sort'}]),
+            None to keep the table's order
+        filter_model: Filter model of an AG Grid request (see filter_mask)
+
+    Returns:
+        Array of row positions
+    """
+    mask = filter_mask(table, filter_model)
+    positions = np.arange(len(table)) if mask is None else np.flatnonzero(mask)
+    sorts = [sort for sort in (sort_model or []) if sort.get('colId') in table.columns]
+    if sorts and len(positions) > 1:
+        # Stable sort of the kept rows: ties keep the table's order, missing values last
+        kept = table.iloc[positions][[sort['colId'] for sort in sorts]].reset_index(drop=True)
+        order = kept.sort_values(
+            [sort['colId'] for sort in sorts],
+            ascending=[sort.get('sort') != 'desc' for sort in sorts],
+            kind='stable',
+            na_position='last'
+        ).index.to_numpy()
+        positions = positions[order]
+    return positions
+
+def row_page(cache, token, request, table=None, tables=None):
+    """
+    Block of rows of a result table, sorted and filtered on the server
+
+    The rows' order for a (sort, filter) is computed once per table, and
+    each block is cached by its query signature (token, sort, filter and
+    row range), so scrolling back or paging again only reads the cache.
+
+    Args:
+        cache: Cache of the orders and blocks (e.g. from selection_cache)
+        token: Token of the table (from rows_token or publish_rows)
+        request: AG Grid request ({'startRow', 'endRow', 'sortModel',
+            'filterModel'}); at most MAX_BLOCK_ROWS rows are returned
+        table: The result table, when the caller holds it
+        tables: Cache the table was published to, read when table is None
+
+    Returns:
+        Tuple (DataFrame of the block's rows, number of rows after
+        filtering), or None when the table is neither given nor published
+        (or was evicted)
+    """
+    start = max(0, int(request.get('startRow') or 0))
+    end = int(request.get('endRow') or start + ROW_BLOCK_SIZE)
+    end = min(max(start, end), start + MAX_BLOCK_ROWS)
+    view = {'sort': request.get('sortModel') or [], 'filter': request.get('filterModel') or {}}
+
+    page_key = _key('page:', [token, view, start, end])
+    page = cache.get(page_key)
+    if page is not None:
+        return page
+
+    if table is None:
+        table = tables.get(token) if tables is not None else None
+        if table is None:
+            return None
+    order_key = _key('order:', [token, view])
+    positions = cache.get(order_key)
+    if positions is None:
+        positions = ordered_positions(table, view['sort'], view['filter'])
+        cache.set(order_key, positions)
+    page = (table.iloc[positions[start:end]].reset_index(drop=True), len(positions))
+    cache.set(page_key, page)
+    return page
+
+def rows_response(cache, token, request, table=None, tables=None):
+    """
+    Response to an infinite row model request of a dash-ag-grid
+
+    Args:
+        cache: Cache of the orders and blocks
+        token: Token of the table
+        request: The grid's getRowsRequest
+        table, tables: The table, or the cache it was published to (see row_page)
+
+    Returns:
+        getRowsResponse dictionary ({'rowData', 'rowCount'}), or None when
+        the table is neither given nor published (or was evicted)
+    """
+    page = row_page(cache, token, request, table, tables)
+    if page is None:
+        return None
+    rows, count = page
+    return {'rowData': rows.to_dict('records'), 'rowCount': count}
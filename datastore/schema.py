@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Columns with fewer distinct values than this share of rows are dictionary-encoded
+CATEGORY_MAX_RATIO = 0.5
+
+def is_id_column(name):
+    """Tell whether a column holds identifiers (IDChaineMontage, idemploye...)"""
+    return str(name).lower().startswith('id')
+
+def _is_low_cardinality(series):
+    return len(series) > 0 and series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_RATIO
+
+def _compact_id(series):
+    # Missing IDs were always read as 0 by the dashboards
+    series = series.fillna(0)
+    if pd.api.types.is_float_dtype(series) and np.array_equal(series, np.floor(series)):
+        series = series.astype(np.int64)
+    if _is_low_cardinality(series):
+        return series.astype('category')
+    return pd.to_numeric(series, downcast='integer') if series.abs().max() < 2 ** 31 else series
+
+def _compact_number(series):
+    if pd.api.types.is_integer_dtype(series):
+        # Never below int32: counts get multiplied by unit costs
+        if series.empty or (series.min() >= -2 ** 31 and series.max() < 2 ** 31):
+            return series.astype(np.int32)
+    # Floats are summed (values, prices, costs): pandas sums a float32 column
+    # in float32, so they keep float64 even when they hold whole numbers
+    return series
+
+def compact_dtypes(data):
+    """
+    Store IDs and labels as Categorical columns and downcast counts
+
+    ID columns are dictionary-encoded when they repeat (chains, operations,
+    employees...), string labels like nom, prenom, libelle or liberreur
+    likewise. Integer counts go to int32 (summed in int64 by pandas). Float
+    columns (values, prices, times, counts with missing values) are left
+    untouched so sums stay exact.
+
+    Args:
+        data: DataFrame fresh from pd.read_csv
+
+    Returns:
+        DataFrame with compact dtypes
+    """
+    compact = {}
+    for col in data.columns:
+        series = data[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(series):
+            continue
+        if is_id_column(col) and pd.api.types.is_numeric_dtype(series):
+            compact[col] = _compact_id(series)
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            compact[col] = _compact_number(series)
+        elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'string':
+            if _is_low_cardinality(series):
+                compact[col] = series.astype('category')
+
+    if not compact:
+        return data
+    # Rebuild in one go so same-typed columns are consolidated again
+    return pd.DataFrame({col: compact.get(col, data[col]) for col in data.columns}, index=data.index)
+
+def conform_dtypes(rows, like):
+    """
+    Give freshly parsed rows the dtypes of an existing compact frame
+
+    A column keeps the frame's dtype when the new values fit in it exactly,
+    otherwise the rows keep theirs and appending upcasts the column.
+
+    Args:
+        rows: DataFrame of new rows (same column names as like)
+        like: Compact DataFrame the rows will be appended to
+
+    Returns:
+        DataFrame of rows with matching dtypes
+    """
+    cast = {}
+    for col in rows.columns:
+        if col not in like.columns or rows[col].dtype == like[col].dtype:
+            continue
+        dtype = like[col].dtype
+        series = rows[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(series.cat.categories.dtype)
+        if pd.api.types.is_numeric_dtype(dtype) and series.dtype == object:
+            # A few rows can be read as text where the whole file reads as numbers
+            numbers = pd.to_numeric(series, errors='coerce')
+            if numbers.isna().equals(series.isna()):
+                series = numbers
+        if isinstance(dtype, pd.CategoricalDtype):
+            if is_id_column(col) and pd.api.types.is_numeric_dtype(series):
+                series = series.fillna(0)
+                if pd.api.types.is_integer_dtype(dtype.categories) and np.array_equal(series, np.floor(series)):
+                    series = series.astype(dtype.categories.dtype)
+            cast[col] = series.astype('category')
+        elif pd.api.types.is_numeric_dtype(dtype) and pd.api.types.is_numeric_dtype(series):
+            converted = series.astype(dtype) if not (series.hasnans and pd.api.types.is_integer_dtype(dtype)) else None
+            if converted is not None and np.array_equal(converted, series, equal_nan=pd.api.types.is_float_dtype(dtype)):
+                cast[col] = converted
+            else:
+                cast[col] = series
+        else:
+            cast[col] = series
+
+    return rows.assign(**cast) if cast else rows
+
+def concat_frames(frames, ignore_index=True):
+    """
+    Concatenate compact frames with the same columns without losing their compact dtypes
+
+    Categorical columns get the sorted union of all category sets instead
+    of falling back to object, as pd.concat would do.
+
+    Args:
+        frames: List of DataFrames with the columns of the first one
+        ignore_index: Number the result from 0 instead of keeping the indexes
+
+    Returns:
+        New DataFrame
+    """
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True) if ignore_index else frames[0]
+
+    columns = {}
+    for col in frames[0].columns:
+        parts = [frame[col] for frame in frames]
+        categorical = isinstance(parts[0].dtype, pd.CategoricalDtype)
+        if categorical and all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            try:
+                columns[col] = union_categoricals([part.array for part in parts], sort_categories=True, ignore_order=True)
+                continue
+            except TypeError:
+                # Categories of different types (numbers and strings)
+                pass
+        values = pd.concat(parts, ignore_index=True)
+        columns[col] = (values.astype('category') if categorical else values).array
+
+    if ignore_index:
+        index = pd.RangeIndex(sum(len(frame) for frame in frames))
+    else:
+        index = frames[0].index.append([frame.index for frame in frames[1:]])
+    data = pd.DataFrame(columns, index=index)
+    data.attrs = dict(frames[0].attrs)
+    return data
+
+def append_rows(data, rows, ignore_index=True):
+    """
+    Append rows to a compact frame without losing its compact dtypes
+
+    Args:
+        data: Compact DataFrame
+        rows: DataFrame of new rows (missing columns are filled with NaN)
+        ignore_index: Number the result from 0 instead of keeping both indexes
+
+    Returns:
+        New DataFrame holding data followed by rows
+    """
+    rows = conform_dtypes(rows.reindex(columns=data.columns), data)
+    return concat_frames([data, rows], ignore_index=ignore_index)
+
+def _values(series):
+    """Array holding a column's values (the codes of a categorical)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.array.codes
+    return series.to_numpy()
+
+def add_alias_views(data, aliases):
+    """
+    Expose columns under their standard names without copying them
+
+    The aliases share their source's buffers when pandas' copy-on-write
+    mode is enabled (both loaders enable it at startup); otherwise they are
+    copies.
+
+    Args:
+        data: DataFrame to update in place
+        aliases: Mapping of source column to alias name, applied in order
+
+    Returns:
+        List of the alias columns sharing their source's buffers (the
+        shared columns of memory_report)
+    """
+    shared = []
+    for source, alias in aliases.items():
+        if source in data.columns and source != alias:
+            # With copy-on-write this shares the source's buffers, otherwise it copies them
+            data[alias] = data[source]
+            if np.may_share_memory(_values(data[alias]), _values(data[source])):
+                shared.append(alias)
+    return shared
+
+def fill_missing(data, value=0):
+    """
+    Fill missing values column by column instead of copying the whole frame
+
+    Categorical and datetime columns keep their missing markers.
+
+    Args:
+        data: DataFrame to update in place
+        value: Replacement for missing values
+    """
+    for col in data.columns:
+        series = data[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(series):
+            continue
+        if series.hasnans:
+            data[col] = series.fillna(value)
+
+def memory_report(before, data, shared=()):
+    """
+    Compare the memory used by each column before and after compaction
+
+    Args:
+        before: Series of bytes per column (DataFrame.memory_usage(deep=True))
+        data: Compacted DataFrame
+        shared: Alias columns sharing another column's buffers (counted as 0 bytes)
+
+    Returns:
+        DataFrame with bytes_before, bytes_after and ratio per column, largest savings first
+    """
+    after = data.memory_usage(deep=True, index=False)
+    for col in shared:
+        if col in after.index:
+            after[col] = 0
+    report = pd.DataFrame({'bytes_before': before, 'bytes_after': after}).fillna(0)
+    report['ratio'] = report['bytes_before'] / report['bytes_after'].replace(0, np.nan)
+    return report.reindex((report['bytes_before'] - report['bytes_after']).sort_values(ascending=False).index)
+
+def print_memory_report(report, top=10):
+    """Print the totals and the columns that shrank most"""
+    total_before = report['bytes_before'].sum()
+    total_after = report['bytes_after'].sum()
+    print(f"Memory: {total_before / 1e6:.1f} MB -> {total_after / 1e6:.1f} MB "
+          f"({total_before / max(1, total_after):.1f}x smaller)")
+    print(report.head(top).to_string())
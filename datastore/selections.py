@@ -0,0 +1,251 @@
+import hashlib
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from flask_caching import Cache
+from flask_caching.backends.base import BaseCache
+
+# Memory the cached selections may use before the least recently used are evicted
+SELECTION_CACHE_BYTES = 64 * 2 ** 20
+
+# Key of the selection cache in the Flask server's extensions
+SELECTION_CACHE_EXTENSION = 'selection_cache'
+
+def _nbytes(value):
+    """Approximate memory held by a cached value"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=False))
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_nbytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+class SelectionCache(BaseCache):
+    """
+    flask-caching backend keeping values in process memory, within a memory budget
+
+    Values are stored as is (not serialized), so cached arrays are shared by
+    the callbacks reading them. When the budget is exceeded, the least recently
+    used values are evicted.
+
+    Args:
+        bytes_limit: Memory budget of the cached values, in bytes
+        default_timeout: Seconds a value is kept (0 to keep it until evicted)
+    """
+
+    def __init__(self, bytes_limit=SELECTION_CACHE_BYTES, default_timeout=0):
+        super().__init__(default_timeout)
+        self.bytes_limit = bytes_limit
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value, _ = entry
+            if expires and expires < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.bytes_limit:
+                return False
+            self._entries[key] = (time.time() + timeout if timeout else 0, value, size)
+            self._bytes += size
+            while self._bytes > self.bytes_limit:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def add(self, key, value, timeout=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def has(self, key):
+        return self.get(key) is not None
+
+    def delete(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        return True
+
+def selection_cache(server, bytes_limit=SELECTION_CACHE_BYTES, extension=SELECTION_CACHE_EXTENSION):
+    """
+    Get the selection cache shared by the callbacks of a Dash app, created on first use
+
+    Args:
+        server: Flask server of the Dash app (app.server)
+        bytes_limit: Memory budget of the cache, when creating it
+        extension: Key of the cache in the server's extensions, for a cache
+            with a budget of its own (e.g. the published result tables)
+
+    Returns:
+        flask_caching.Cache
+    """
+    cache = server.extensions.get(extension)
+    if cache is None:
+        cache = Cache(server, config={
+            'CACHE_TYPE': 'datastore.selections.SelectionCache',
+            'CACHE_DEFAULT_TIMEOUT': 0,
+            'CACHE_OPTIONS': {'bytes_limit': bytes_limit}
+        })
+        server.extensions[extension] = cache
+    return cache
+
+# Locks of the selections being evaluated, so that callbacks firing together
+# on the same filters wait for one evaluation instead of each running it
+_pending = {}
+_pending_lock = threading.Lock()
+
+# Serial number of each row index keyed by selection_key: (weak reference to
+# the index, serial) by id. Unlike an id, a serial is never given to another
+# frame, so keys derived from it stay valid after a reload frees the old rows.
+_row_serials = {}
+_row_serials_lock = threading.Lock()
+_next_serial = [0]
+
+def rows_serial(index):
+    """
+    Get the serial number of a frame's rows
+
+    Args:
+        index: Row index of the frame (shared by its shallow copies)
+
+    Returns:
+        Integer, the same for as long as the index lives and never reused
+    """
+    with _row_serials_lock:
+        entry = _row_serials.get(id(index))
+        if entry is None or entry[0]() is not index:
+            # Forget the indexes freed since
+            for key in [key for key, (ref, _) in _row_serials.items() if ref() is None]:
+                del _row_serials[key]
+            entry = (weakref.ref(index), _next_serial[0])
+            _next_serial[0] += 1
+            _row_serials[id(index)] = entry
+        return entry[1]
+
+def selection_key(plan):
+    """Cache key of a plan's selection: its frame's rows (by serial number) and its signature"""
+    signature = repr((rows_serial(plan.data.index), len(plan.data), plan.signature()))
+    return 'selection:' + hashlib.sha1(signature.encode()).hexdigest()
+
+def cached_selection(cache, plan):
+    """
+    Evaluate a plan's selection once per filter signature
+
+    Args:
+        cache: Cache from selection_cache
+        plan: FilterPlan
+
+    Returns:
+        The plan, holding its selection (from the cache when another callback
+        evaluated the same filters over the same rows)
+    """
+    key = selection_key(plan)
+
+    def lookup():
+        entry = cache.get(key)
+        if entry is not None and entry['rows']() is plan.data.index:
+            return entry['selection']
+        return None
+
+    selection = lookup()
+    if selection is None:
+        with _pending_lock:
+            lock = _pending.setdefault(key, threading.Lock())
+        with lock:
+            selection = lookup()
+            if selection is None:
+                selection = plan.selection()
+                if selection[2] is not None:
+                    # Shared by the callbacks: never modified in place
+                    selection[2].flags.writeable = False
+                cache.set(key, {'rows': weakref.ref(plan.data.index), 'selection': selection})
+        with _pending_lock:
+            _pending.pop(key, None)
+    return plan.reuse(selection)
+
+def select_rows(cache, plan, columns=None):
+    """
+    Materialize the rows of a plan, evaluating its filters only on a cache miss
+
+    Args:
+        cache: Cache from selection_cache
+        plan: FilterPlan
+        columns: Columns to keep, or None for all
+
+    Returns:
+        DataFrame of the selected rows, as FilterPlan.apply
+    """
+    return cached_selection(cache, plan).apply(columns)
+
+def publish_selection(cache, plan, filters):
+    """
+    Evaluate a plan once and publish its selection
+
+    The published selection is what a filter-stage callback puts in a
+    dcc.Store: the rows stay server-side, in the cache, under its token, and
+    the callbacks reading it rebuild the plan from its filters with
+    published_filters and get the rows back with select_rows. The filters
+    travel with the token, so an evicted selection is evaluated again
+    rather than lost.
+
+    Args:
+        cache: Cache from selection_cache
+        plan: FilterPlan of the filters
+        filters: JSON-like filter values the plan was built from, to rebuild
+            it (or a variant of it) on the consumer side
+
+    Returns:
+        Dictionary with the 'token' (a hash of the frame's rows and the
+        plan's signature, to key results derived from the selection) and
+        the 'filters'
+    """
+    cached_selection(cache, plan)
+    return {'token': selection_key(plan), 'filters': filters}
+
+def published_filters(selection):
+    """
+    Get the filters of a published selection
+
+    Args:
+        selection: Selection returned by publish_selection (the Store's data)
+
+    Returns:
+        Filter values, or None when nothing was published yet
+    """
+    if not selection:
+        return None
+    return selection.get('filters')
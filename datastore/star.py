@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+from datastore.schema import append_rows, conform_dtypes
+
+# Name of the fact table in a star schema
+FACT = 'fact'
+
+# Record number of the export, increasing with every new reclamation
+WATERMARK = 'n°_enr.'
+
+# Records res.csv repeats on every row: the dimension's join key (kept in the
+# fact table) and the columns of the joined record, lowercase
+DIMENSIONS = {
+    'employe': ('idemploye', [
+        'idemploye1', 'nom', 'prenom', 'datenaissance', 'dateembauche', 'sexe', 'etatcivil',
+        'specialite', 'tel', 'adresse', 'photo', 'etat1', 'matricule', 'idchainemontage1',
+        'tauxhoraire', 'allure', 'discipline', 'objectifpolyvalence', 'tel2', 'numcnss', 'numcin',
+        'datefincontrat', 'observations', 'virtuel', 'demandeurintervention', 'codeacces',
+        'nbrenfant', 'idcategorieemploye', 'status', 'login', 'daterenouvcontrat',
+        'idcategorieprimerdmt', 'idchainemontage_lastlect'
+    ]),
+    'operation': ('idoperation', [
+        'idoperation1', 'operation', 'temps', 'idservice', 'idfamille', 'etat2', 'idmachine',
+        'chemincouture', 'opfinition', 'code3', 'tpsfixe', 'tpsvariable', 'tauxmajoration',
+        'idguide', 'tpsrangement', 'frequence', 'longoperation', 'idelementproduit1',
+        'idfamillearticle', 'objectifpolyvalence1', 'saisile', 'saisipar', 'modifiele1',
+        'modifiepar1', 'confirme', 'idtypetissu', 'avectestqualite', 'idcompetence',
+        'aveclecturemodepiece', 'avecchoixappmobile', 'avecchoixqtte', 'idoperationlie'
+    ]),
+    'ofabrication': ('idofabrication', [
+        'idofabrication1', 'ofabrication', 'dtdebut', 'dtfin', 'idarticle', 'quantite',
+        'idcommande', 'iddetailcmd', 'etat3', 'idar_couleur', 'idgamme', 'idprocess', 'typesuivi',
+        'idgrille', 'idstepof', 'isgrillecompose', 'qttelct', 'prix', 'prixmp', 'autresprix',
+        'dateexport', 'idchainemontage2', 'idtiers1', 'priorite', 'datetissu', 'datefourniture',
+        'idcategorieof', 'dateexportprevue', 'majoration', 'idclient', 'rendementmoyen',
+        'issemifini', 'idofabricationsf', 'numinterne', 'datecreation', 'saisile1', 'saisipar1',
+        'modifiele2', 'modifiepar2', 'etatblocage', 'rendementprevu', 'effectifprevu',
+        'nbrjoursengagement', 'nbrjoursavantexport', 'txavcsimulation', 'issatisfied',
+        'dateexportprevue2', 'cloturerpar', 'cloturerle', 'idphasesanschevauchement', 'valeurof',
+        'datelct', 'idofabricationparent', 'isparent', 'numofclient', 'numcmdclient', 'idsaison',
+        'idstatutof', 'valeurofestime', 'dateimportation', 'idclientfinal', 'description', 'po',
+        'idar_lot', 'ordre1', 'dateprod', 'quantite2', 'qttelct2', 'dateexport2', 'reference'
+    ]),
+    'codeerreur': ('idcodeerreur', [
+        'code4', 'liberreur', 'arliberreur', 'idsfcodeerreur', 'note', 'idniveaudefaut',
+        'deuxiemechoix', 'etat4', 'idtypecodeerreur', 'liberreur_eng'
+    ])
+}
+
+def _find_column(data, name):
+    """Get the actual spelling of a column whatever its case, or None"""
+    for col in data.columns:
+        if col.lower() == name:
+            return col
+    return None
+
+def split_star(data):
+    """
+    Split the denormalized export into a fact table and deduplicated dimension tables
+
+    For each dimension of DIMENSIONS whose key is loaded, the record columns
+    move to a table holding one row per key. A column only moves if it
+    really has a single value per key; otherwise it stays in the fact table.
+
+    Args:
+        data: Parsed DataFrame (one row per quality record)
+
+    Returns:
+        Dictionary of tables: FACT, plus one DataFrame indexed by key per dimension
+    """
+    tables = {}
+    moved = []
+    for name, (key, record) in DIMENSIONS.items():
+        key_col = _find_column(data, key)
+        if key_col is None:
+            continue
+        attributes = [col for col in data.columns if col.lower() in record and col != key_col]
+        if not attributes:
+            continue
+
+        # Keep only the columns functionally dependent on the key
+        values_per_key = data.groupby(key_col, observed=True)[attributes].nunique(dropna=False).max()
+        dependent = [col for col in attributes if values_per_key.get(col, 0) <= 1]
+        if len(dependent) < len(attributes):
+            print(f"Kept in the fact table (several values per {key_col}): "
+                  f"{[col for col in attributes if col not in dependent]}")
+        if not dependent:
+            continue
+
+        dimension = data.drop_duplicates(subset=key_col)[[key_col] + dependent].set_index(key_col)
+        dimension.index = pd.Index(np.asarray(dimension.index), name=key_col)
+        for col in dependent:
+            if isinstance(dimension[col].dtype, pd.CategoricalDtype):
+                dimension[col] = dimension[col].cat.remove_unused_categories()
+        tables[name] = dimension
+        moved.extend(dependent)
+
+    tables[FACT] = data.drop(columns=moved)
+    # Joins put the columns back in the export's order
+    tables[FACT].attrs['columns'] = list(data.columns)
+    print(f"Star schema: fact {tables[FACT].shape[0]} x {tables[FACT].shape[1]}, " + ", ".join(
+        f"{name} {table.shape[0]} x {table.shape[1]}" for name, table in tables.items() if name != FACT
+    ))
+    return tables
+
+def join_labels(facts, tables, columns=None):
+    """
+    Join dimension columns onto fact rows
+
+    Only the requested columns are looked up, so a view pays for the labels it
+    displays and nothing else. facts can be the whole fact table or any
+    filtered slice of it.
+
+    Args:
+        facts: DataFrame of fact rows (holding the dimension keys)
+        tables: Star schema from split_star
+        columns: Column names to add (any case), or None for every dimension column
+
+    Returns:
+        DataFrame with the fact and joined dimension columns, in the export's order
+    """
+    wanted = None if columns is None else {col.lower() for col in columns}
+    joined = [facts]
+    for name, dimension in tables.items():
+        if name == FACT or dimension.index.name not in facts.columns:
+            continue
+        attributes = [
+            col for col in dimension.columns
+            if (wanted is None or col.lower() in wanted) and col not in facts.columns
+        ]
+        if not attributes:
+            continue
+        labels = dimension[attributes].reindex(facts[dimension.index.name].to_numpy())
+        labels.index = facts.index
+        joined.append(labels)
+
+    if len(joined) == 1:
+        return facts
+    data = pd.concat(joined, axis=1)
+    order = [col for col in facts.attrs.get('columns', []) if col in data.columns]
+    if len(order) == len(data.columns):
+        data = data[order]
+    return data
+
+def _types_changed(rows, like):
+    """Tell whether new rows hold text in columns stored as numbers (empty columns aside)"""
+    changed = [
+        col for col in rows.columns
+        if pd.api.types.is_numeric_dtype(like[col]) and not pd.api.types.is_numeric_dtype(rows[col])
+        and like[col].notna().any()
+    ]
+    if changed:
+        print(f"Columns no longer numeric {changed}: rebuilding")
+    return bool(changed)
+
+def append_star(tables, new_tables):
+    """
+    Append the tables parsed from newly exported records to a star schema
+
+    The new records must come after the last one already loaded (their
+    record number is above the watermark) and must not change a dimension
+    record already known, e.g. an employee's hourly rate. Otherwise the
+    export was rewritten rather than appended to and None is returned so
+    the caller rebuilds everything.
+
+    Args:
+        tables: Star schema from split_star
+        new_tables: Star schema of the new records alone
+
+    Returns:
+        Merged star schema, or None if the new records cannot simply be appended
+    """
+    rows = join_labels(new_tables[FACT], new_tables)
+    facts = tables[FACT]
+
+    watermark = _find_column(facts, WATERMARK)
+    if watermark is not None and watermark in rows.columns and len(rows) > 0:
+        if rows[watermark].min() <= facts[watermark].max():
+            print(f"Record numbers do not follow {facts[watermark].max()}: rebuilding")
+            return None
+
+    merged = {}
+    for name, dimension in tables.items():
+        if name == FACT:
+            continue
+        key = dimension.index.name
+        if key not in rows.columns or any(col not in rows.columns for col in dimension.columns):
+            return None
+        attributes = list(dimension.columns)
+        if (rows.groupby(key, observed=True)[attributes].nunique(dropna=False).max() > 1).any():
+            print(f"New records disagree on their {name} record: rebuilding")
+            return None
+
+        records = rows.drop_duplicates(subset=key).set_index(key)[attributes]
+        records.index = pd.Index(np.asarray(records.index), name=key)
+        records = conform_dtypes(records, dimension)
+        if _types_changed(records, dimension):
+            return None
+        known = records.index.isin(dimension.index)
+        before = dimension.loc[records.index[known]].astype(object)
+        if not before.equals(records[known].astype(object)):
+            print(f"A known {name} record changed: rebuilding")
+            return None
+        merged[name] = append_rows(dimension, records[~known], ignore_index=False)
+
+    rows = conform_dtypes(rows.reindex(columns=facts.columns), facts)
+    if _types_changed(rows, facts):
+        return None
+    merged[FACT] = append_rows(facts, rows)
+    merged[FACT].attrs = facts.attrs
+    print(f"Appended {len(rows)} records")
+    return merged
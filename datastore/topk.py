@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from datastore.cube import ROWS_COLUMN, is_cube_cells
+
+# Label of the bucket totalling the values outside the top k
+OTHERS_LABEL = 'Autres'
+
+# Number of top-k results kept (the least recently used are evicted)
+TOP_K_CACHE_SIZE = 256
+
+# Top-k results by (cache key, dimension, measure, k, others)
+_top_k_cache = OrderedDict()
+
+def top_k_positions(values, k):
+    """
+    Positions of the k largest values, largest first, by partial selection
+
+    Only the values reaching the k-th largest are sorted, so picking a few
+    among thousands costs a linear pass. Ties keep their order of position
+    (like Series.nlargest); missing values rank last.
+
+    Args:
+        values: 1-D array-like of numbers
+        k: Number of positions to return
+
+    Returns:
+        Array of at most k positions
+    """
+    values = np.asarray(values, dtype='float64')
+    values = np.where(np.isnan(values), -np.inf, values)
+    k = max(0, min(k, len(values)))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    if k < len(values):
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(-values[candidates], kind='stable')][:k]
+
+def top_rows(table, column, k):
+    """
+    Rows of a table with the k largest values of a column, largest first
+
+    Args:
+        table: DataFrame (e.g. one row per group)
+        column: Column to rank by
+        k: Number of rows
+
+    Returns:
+        DataFrame of at most k rows, like sort_values(column, ascending=False).head(k)
+    """
+    return table.iloc[top_k_positions(table[column], k)]
+
+def group_totals(frame, dimension, measure=None):
+    """
+    Total of a measure for each value of a dimension, over rows or cube cells
+
+    Categorical dimensions are totalled by their codes in one bincount.
+
+    Args:
+        frame: DataFrame of rows, or of cells from cube_cells
+        dimension: Column to group by
+        measure: Column to sum, or None to count the rows
+
+    Returns:
+        Series indexed by the dimension's values present in frame (missing
+        values left out), in the order groupby would give
+    """
+    if measure is None and is_cube_cells(frame):
+        measure = ROWS_COLUMN
+    series = frame[dimension]
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        grouped = frame.groupby(dimension, observed=True)
+        return grouped.size() if measure is None else grouped[measure].sum()
+
+    codes = series.array.codes
+    present = codes >= 0
+    size = len(series.cat.categories)
+    rows = np.bincount(codes[present], minlength=size)
+    if measure is None:
+        totals = rows
+    else:
+        values = frame[measure].to_numpy(dtype='float64', na_value=0.0)[present]
+        totals = np.bincount(codes[present], weights=values, minlength=size)
+        if not pd.api.types.is_float_dtype(frame[measure].dtype):
+            # Integer totals are int64 whatever the column's width, as a groupby sum would
+            totals = totals.round().astype(np.int64)
+    observed = np.flatnonzero(rows)
+    return pd.Series(totals[observed], index=pd.CategoricalIndex(
+        series.cat.categories[observed], categories=series.cat.categories, name=dimension
+    ))
+
+def top_k(frame, dimension, measure=None, k=10, others=True, cache_key=None):
+    """
+    Values of a dimension with the k largest totals, and the total of the others
+
+    Args:
+        frame: DataFrame of rows, or of cells from cube_cells
+        dimension: Column to rank the values of
+        measure: Column to sum, or None to count the rows
+        k: Number of values to keep
+        others: Add an OTHERS_LABEL row totalling the other values (when positive)
+        cache_key: Hashable identifying frame's rows and filters (e.g. a
+            token from selection_key, which numbers the rows so that a key
+            never outlives them), to reuse the result; None to always compute it
+
+    Returns:
+        DataFrame with the dimension and the total column (measure, or
+        'count'), largest first, then the OTHERS_LABEL row if any
+    """
+    key = None if cache_key is None else (cache_key, dimension, measure, k, others)
+    if key is not None and key in _top_k_cache:
+        _top_k_cache.move_to_end(key)
+        return _top_k_cache[key]
+
+    value_column = measure or 'count'
+    totals = group_totals(frame, dimension, measure)
+    positions = top_k_positions(totals.to_numpy(), k)
+    top = pd.DataFrame({dimension: totals.index[positions], value_column: totals.to_numpy()[positions]})
+    if others and len(positions) < len(totals):
+        # Remainder: the values not kept
+        rest = np.ones(len(totals), dtype=bool)
+        rest[positions] = False
+        other_total = totals.to_numpy()[rest].sum()
+        if other_total > 0:
+            top = pd.concat([top, pd.DataFrame({dimension: [OTHERS_LABEL], value_column: [other_total]})], ignore_index=True)
+
+    if key is not None:
+        _top_k_cache[key] = top
+        while len(_top_k_cache) > TOP_K_CACHE_SIZE:
+            _top_k_cache.popitem(last=False)
+    return top
@@ -1,8 +1,20 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from utils import apply_date_filter, apply_categorical_filter, apply_numerical_filter, apply_all_filters
+from datastore.filters import FilterPlan
+
+# Columns read by the operational dashboard (chain selector, metrics, employee and OF grids)
+OPERATIONAL_COLUMNS = [
+    'DATE', 'IDChaineMontage1', 'IDChaineMontage', 'Chaine', 'idchaine',
+    'Categorie', 'Category', 'TypeControle', 'TypeDefaut', 'Type_Defaut',
+    'Quantite', 'Qtte', 'QtteSondee', 'QteSondee', 'qte_sondee', 'QtteSonde',
+    'QtteLct', 'QteLancee', 'qte_lancee', 'Temps', 'TempsRetouche',
+    'Operation', 'IDOperation', 'TauxHoraire', 'TauxHorraire',
+    'IDEmploye', 'Nom', 'Prenom',
+    'IDOFabrication', 'OFabrication', 'OF', 'id_fabrication', 'OFAbrication',
+    'DeuxiemeChoix', 'ValeurOF', 'Rebut'
+]
 
 def create_gauge_chart(value, max_val=100, title="Gauge Chart"):
     """Create a gauge chart for KPI visualization with dark theme"""
@@ -66,6 +78,70 @@ def create_gauge_chart(value, max_val=100, title="Gauge Chart"):
     
     return fig
 
+# Number of employees shown in the details grid (3 rows of 6)
+EMPLOYEE_GRID_SIZE = 18
+
+# Sampled quantity columns, for the employees' retouche rates
+SAMPLED_COLUMNS = ['QtteSondee', 'QtteSonde', 'QteSondee', 'qte_sondee']
+
+def employee_scoreboard(mode_data, size=EMPLOYEE_GRID_SIZE):
+    """
+    Rank the employees of a selection by retouche rate
+
+    Retouches (Qtte) and sampled quantities are summed per employee in one
+    groupby, which also looks their names up; only the best ranked `size`
+    employees are then sorted (partial sort).
+
+    Args:
+        mode_data: Filtered DataFrame with IDEmploye, Nom and Prenom
+        size: Number of employees to keep
+
+    Returns:
+        DataFrame indexed by IDEmploye, with name, count and performance
+        (rate in %), highest rate first; empty when the columns are missing.
+        Employees with ID 0 or without a name are left out.
+    """
+    board = pd.DataFrame(columns=['name', 'count', 'performance'])
+    if not all(column in mode_data.columns for column in ['IDEmploye', 'Nom', 'Prenom']):
+        return board
+
+    sampled_column = next((column for column in SAMPLED_COLUMNS if column in mode_data.columns), None)
+    aggregations = {'last_name': ('Nom', 'first'), 'first_name': ('Prenom', 'first')}
+    if 'Qtte' in mode_data.columns:
+        aggregations['count'] = ('Qtte', 'sum')
+    if sampled_column:
+        aggregations['sampled'] = (sampled_column, 'sum')
+    grouped = mode_data.groupby('IDEmploye', observed=True).agg(**aggregations)
+    if 'count' not in grouped.columns:
+        grouped['count'] = 0
+
+    # Employees with an ID and a name
+    last_names = grouped['last_name'].astype(object).fillna('').astype(str)
+    first_names = grouped['first_name'].astype(object).fillna('').astype(str)
+    keep = (grouped.index != 0) & ((last_names != '') | (first_names != '')).to_numpy()
+    grouped, last_names, first_names = grouped[keep], last_names[keep], first_names[keep]
+
+    # Retouche rate, or a consistent value by employee ID without sampled quantities
+    if sampled_column:
+        performance = grouped['count'].to_numpy(dtype='float64') / np.maximum(1, grouped['sampled'].to_numpy(dtype='float64')) * 100
+    else:
+        performance = np.asarray(grouped.index, dtype='float64') % 10 + 0.1
+
+    # Partial sort: only the employees at or above the size-th rate are ordered
+    if len(performance) > size:
+        threshold = np.partition(performance, len(performance) - size)[len(performance) - size]
+        candidates = np.flatnonzero(performance >= threshold)
+    else:
+        candidates = np.arange(len(performance))
+    top = candidates[np.argsort(-performance[candidates], kind='stable')][:size]
+
+    board = pd.DataFrame({
+        'name': (first_names.iloc[top] + ' ' + last_names.iloc[top]).to_numpy(),
+        'count': grouped['count'].iloc[top].to_numpy(),
+        'performance': performance[top],
+    }, index=grouped.index[top])
+    return board
+
 # Update the create_element_grid function to properly use employee names from the CSV data
 def create_element_grid(filtered_data, mode="fin_chaine"):
     """
@@ -91,59 +167,27 @@ def create_element_grid(filtered_data, mode="fin_chaine"):
         # If no category column, use all data
         mode_data = filtered_data
     
-    # Get unique employees for the selected chain and category
+    # Top employees by retouche rate, from one grouped pass
     employee_data = []
-    
-    if 'IDEmploye' in mode_data.columns and 'Nom' in mode_data.columns and 'Prenom' in mode_data.columns:
-        # Group by employee and calculate retouche count
-        for _, employee_group in mode_data.groupby('IDEmploye'):
-            if employee_group.empty:
-                continue
-                
-            # Get employee details from first row of group
-            employee_row = employee_group.iloc[0]
-            employee_id = employee_row['IDEmploye']
-            
-            # Skip employees with ID 0
-            if employee_id == 0:
-                continue
-                
-            last_name = employee_row['Nom'] if not pd.isna(employee_row['Nom']) else ""
-            first_name = employee_row['Prenom'] if not pd.isna(employee_row['Prenom']) else ""
-            
-            # Skip if both name fields are empty
-            if not last_name and not first_name:
-                continue
-                
-            # Calculate retouche count and rate
-            retouche_count = employee_group['Qtte'].sum() if 'Qtte' in employee_group.columns else 0
-            
-            # Calculate performance rate (retouche percentage)
-            if 'QtteSonde' in employee_group.columns:
-                total_qty = employee_group['QtteSonde'].sum()
-                performance = (retouche_count / max(1, total_qty)) * 100
-            else:
-                # Generate a consistent performance value based on employee ID
-                performance = (employee_id % 10) + 0.1
-            
-            # Determine performance color
-            if performance < 3:
-                color = "#4CAF50"  # Green
-            elif performance < 7:
-                color = "#FFA000"  # Yellow/Orange
-            else:
-                color = "#F44336"  # Red
-            
-            # Create element dictionary
-            element = {
-                "id": employee_id,
-                "name": f"{first_name} {last_name}",
-                "color": color,
-                "count": int(retouche_count),
-                "performance": f"{performance:.1f}%"
-            }
-            
-            employee_data.append(element)
+    scoreboard = employee_scoreboard(mode_data)
+    for employee_id, employee in scoreboard.iterrows():
+        performance = employee['performance']
+
+        # Determine performance color
+        if performance < 3:
+            color = "#4CAF50"  # Green
+        elif performance < 7:
+            color = "#FFA000"  # Yellow/Orange
+        else:
+            color = "#F44336"  # Red
+
+        employee_data.append({
+            "id": employee_id,
+            "name": employee['name'],
+            "color": color,
+            "count": int(employee['count']),
+            "performance": f"{performance:.1f}%"
+        })
     
     # If no employee data found, create sample data
     if not employee_data:
@@ -184,8 +228,9 @@ def create_element_grid(filtered_data, mode="fin_chaine"):
                 "performance": f"{performance:.1f}%"
             })
     
-    # Sort by performance (highest first) and take top 18
-    elements = sorted(employee_data, key=lambda x: float(x["performance"].strip('%')), reverse=True)[:18]
+        # Sort the sample by performance (highest first)
+        employee_data.sort(key=lambda x: float(x["performance"].strip('%')), reverse=True)
+    elements = employee_data[:EMPLOYEE_GRID_SIZE]
     
     # Create the grid layout with 6 columns
     cols = st.columns(6)
@@ -205,305 +250,347 @@ def create_element_grid(filtered_data, mode="fin_chaine"):
             </div>
             """, unsafe_allow_html=True)
 
-def create_orders_detail_grid(filtered_data):
-    """Create the orders detail grid for the Rebut dashboard"""
-    # Check for available order/fabrication columns
-    order_column = None
-    for col_name in ['IDOFabrication', 'IDOfabrication', 'OFabrication', 'OF', 'id_fabrication']:
-        if col_name in filtered_data.columns:
-            order_column = col_name
-            break
-    
-    # Create a table for order details
-    orders = filtered_data[order_column].unique().tolist() if order_column else ['PO 1', 'PO 2', 'PO 3', 'PO 4', 'PO 5', 'PO 6', 'PO 7', 'PO 8']
+# Manufacturing order columns, in order of preference, and the column naming them
+ORDER_COLUMNS = ['IDOFabrication', 'IDOfabrication', 'OFabrication', 'OF', 'id_fabrication']
+ORDER_LABEL_COLUMN = 'OFAbrication'
+
+# Per-order measures of the OF details: candidate columns and aggregation
+# (launched quantities and values are order attributes, repeated on each row)
+ORDER_MEASURES = {
+    'launched': (['QtteLct', 'qttelct', 'QteLancee', 'qte_lancee'], 'first'),
+    'sampled': (SAMPLED_COLUMNS, 'sum'),
+    'rework': (['Qtte', 'qtte'], 'sum'),
+    'second_choice': (['DeuxiemeChoix', 'deuxiemechoix'], 'sum'),
+    'value': (['ValeurOF', 'valeurof'], 'first'),
+    'rebut_cost': (['Rebut'], 'sum'),
+}
+
+# Orders shown per page of the OF details
+ORDERS_PER_PAGE = 8
+
+def orders_breakdown(filtered_data):
+    """
+    Sum the quality measures of each manufacturing order in one groupby
+
+    Args:
+        filtered_data: Filtered DataFrame
+
+    Returns:
+        DataFrame indexed by order, with label and the ORDER_MEASURES columns
+        (0 when a measure's column is missing), highest rebut cost first
+        (then most retouches); None when no order column is loaded
+    """
+    order_column = next((column for column in ORDER_COLUMNS if column in filtered_data.columns), None)
+    if order_column is None:
+        return None
+
+    aggregations = {}
+    if ORDER_LABEL_COLUMN in filtered_data.columns and ORDER_LABEL_COLUMN != order_column:
+        aggregations['label'] = (ORDER_LABEL_COLUMN, 'first')
+    for measure, (candidates, how) in ORDER_MEASURES.items():
+        column = next((column for column in candidates if column in filtered_data.columns), None)
+        if column:
+            aggregations[measure] = (column, how)
+    if not aggregations:
+        aggregations['rows'] = (order_column, 'size')
+    orders = filtered_data.groupby(order_column, observed=True).agg(**aggregations)
+
+    for measure in ORDER_MEASURES:
+        if measure not in orders.columns:
+            orders[measure] = 0
+    # Orders without a name show their ID
+    ids = pd.Series(np.asarray(orders.index, dtype=object), index=orders.index)
+    labels = orders['label'].astype(object) if 'label' in orders.columns else ids
+    orders['label'] = labels.where(labels.notna(), ids).astype(str)
+    orders = orders[['label'] + list(ORDER_MEASURES)]
+    return orders.sort_values(['rebut_cost', 'rework'], ascending=False, kind='stable')
+
+def create_orders_detail_grid(filtered_data, key="orders_page", orders=None):
+    """
+    Create the orders detail grid for the Rebut dashboard, one page of orders at a time
+
+    Args:
+        filtered_data: Filtered DataFrame with data
+        key: Widget key of the page selector (one per grid)
+        orders: Breakdown from orders_breakdown, to share it between grids
+    """
+    if orders is None:
+        orders = orders_breakdown(filtered_data)
+    if orders is None or orders.empty:
+        st.info("Aucun ordre de fabrication dans la sélection")
+        return
+
+    # Page through the orders, ranked once by rebut cost
+    pages = max(1, -(-len(orders) // ORDERS_PER_PAGE))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, value=1, step=1, key=key)
+    shown = orders.iloc[(page - 1) * ORDERS_PER_PAGE:page * ORDERS_PER_PAGE]
     
     # Create header
     st.markdown("""
     <div style="display:flex; margin-bottom:8px; font-weight:bold; color:#FFFFFF; font-size:12px;">
         <div style="flex:1; text-align:center;">OF</div>
-        <div style="flex:1; text-align:center; color:#F44336;">1%</div>
-        <div style="flex:1; text-align:center; color:#FFA000;">10%</div>
-        <div style="flex:1; text-align:center; color:#4CAF50;">50%</div>
-        <div style="flex:1; text-align:center; color:#AAAAAA;">39%</div>
+        <div style="flex:1; text-align:center; color:#AAAAAA;">Lancée</div>
+        <div style="flex:1; text-align:center; color:#4CAF50;">Sondée</div>
+        <div style="flex:1; text-align:center; color:#FFA000;">Retouches</div>
+        <div style="flex:1; text-align:center; color:#F44336;">2ème choix</div>
+        <div style="flex:1; text-align:center; color:#F44336;">Coût rebut</div>
     </div>
     """, unsafe_allow_html=True)
     
-    # Create rows for each order
-    for order in orders[:8]:  # Limit to 8 orders for display
-        # Calculate metrics for this order
-        order_data = filtered_data
-        if order_column and order_column in filtered_data.columns:
-            order_data = filtered_data[filtered_data[order_column] == order]
-        
-        # Get total quantity
-        total_qty = order_data['Quantite'].sum() if 'Quantite' in order_data.columns else 1000
-        
-        # Calculate percentages (in real implementation, this would be based on actual data)
-        pct1 = int(total_qty * 0.01)
-        pct10 = int(total_qty * 0.1)
-        pct50 = int(total_qty * 0.5)
-        pct39 = total_qty - pct1 - pct10 - pct50
+    # Create rows for the orders of the page
+    for _, order in shown.iterrows():
+        rework_rate = (order['rework'] / max(1, order['sampled'])) * 100
+        # OF value, labelled, when known (0 when the value column is not loaded)
+        value = f"<br>Valeur: {order['value']:,.0f} €" if order['value'] > 0 else ""
         
         # Create the row
         st.markdown(f"""
         <div style="display:flex; margin-bottom:4px; border-bottom:1px solid #333; padding-bottom:4px;">
-            <div style="flex:1; text-align:center; background-color:#1E1E1E; padding:3px; font-size:11px; color:#FFFFFF;">{order}<br>({total_qty} pcs)</div>
-            <div style="flex:1; text-align:center; background-color:#3A1A1A; padding:3px; font-size:11px; color:#FFFFFF;">1%<br>({pct1} pcs)</div>
-            <div style="flex:1; text-align:center; background-color:#3A2A1A; padding:3px; font-size:11px; color:#FFFFFF;">10%<br>({pct10} pcs)</div>
-            <div style="flex:1; text-align:center; background-color:#1A3A1A; padding:3px; font-size:11px; color:#FFFFFF;">50%<br>({pct50} pcs)</div>
-            <div style="flex:1; text-align:center; background-color:#1E1E1E; padding:3px; font-size:11px; color:#AAAAAA;">39%<br>({pct39} pcs)</div>
+            <div style="flex:1; text-align:center; background-color:#1E1E1E; padding:3px; font-size:11px; color:#FFFFFF;">{order['label']}{value}</div>
+            <div style="flex:1; text-align:center; background-color:#1E1E1E; padding:3px; font-size:11px; color:#AAAAAA;">{order['launched']:.0f} pcs</div>
+            <div style="flex:1; text-align:center; background-color:#1A3A1A; padding:3px; font-size:11px; color:#FFFFFF;">{order['sampled']:.0f} pcs</div>
+            <div style="flex:1; text-align:center; background-color:#3A2A1A; padding:3px; font-size:11px; color:#FFFFFF;">{order['rework']:.0f} pcs<br>({rework_rate:.1f}%)</div>
+            <div style="flex:1; text-align:center; background-color:#3A1A1A; padding:3px; font-size:11px; color:#FFFFFF;">{order['second_choice']:.0f} pcs</div>
+            <div style="flex:1; text-align:center; background-color:#3A1A1A; padding:3px; font-size:11px; color:#FFFFFF;">{order['rebut_cost']:,.0f}</div>
         </div>
         """, unsafe_allow_html=True)
 
+# Candidate columns of each role read by the operational metrics, in order of preference
+OPERATIONAL_BINDINGS = {
+    'category': ['Categorie', 'categorie', 'CATEGORIE', 'Category', 'category'],
+    'qtte': ['Quantite', 'quantite', 'QUANTITE', 'Qtte', 'qtte'],
+    'qtte_sondee': ['QtteSondee', 'qttesondee', 'QteSondee', 'qte_sondee'],
+    'qtte_lct': ['QtteLct', 'qttelct', 'QteLancee', 'qte_lancee'],
+    'temps': ['Temps', 'temps', 'TEMPS', 'TempsRetouche', 'tempsretouche'],
+    'operation': ['Operation', 'operation', 'OPERATION', 'IDOperation', 'idoperation'],
+    'taux_horaire': ['TauxHoraire', 'tauxhoraire', 'TauxHorraire', 'tauxhorraire'],
+    'type_defaut': ['TypeDefaut', 'typedefaut', 'Type_Defaut', 'type_defaut'],
+}
+
+# Production stages and defect types the metrics are split by
+FIN_CHAINE = 'PRODUCTION FIN CHAINE'
+ENCOURS = 'PRODUCTION ENCOURS'
+REBUT = 'Rebut'
+RETOUCHE = 'Retouche'
+
+# Operations counted in the retouche times
+FIXATION_PREFIXES = ('fixation', 'fix')
+
+# Metric plans by schema (tuple of column names)
+_metric_plans = {}
+
+def operational_metric_plan(data):
+    """
+    Resolve the columns of the operational metrics for the schema of a frame
+
+    The candidate columns are probed once per schema: every date or chain
+    selection of the same loaded data reuses the plan.
+
+    Args:
+        data: DataFrame (or any selection of its rows)
+
+    Returns:
+        Dictionary of role (key of OPERATIONAL_BINDINGS) to column name, or None
+    """
+    schema = tuple(data.columns)
+    plan = _metric_plans.get(schema)
+    if plan is None:
+        plan = {
+            role: next((column for column in candidates if column in schema), None)
+            for role, candidates in OPERATIONAL_BINDINGS.items()
+        }
+        _metric_plans[schema] = plan
+    return plan
+
+def _numeric_values(series):
+    """Values of a numeric column as float64, missing values read as 0 like in sums"""
+    return series.to_numpy(dtype='float64', na_value=0.0)
+
+def _column_sum(sums, series):
+    """Sums of a column's values, back to integers for integer columns"""
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return np.rint(sums).astype(np.int64)
+    return sums
+
+def _fixation_rows(series):
+    """Rows of an operation column whose operation starts with a fixation prefix"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Test each category once; missing values (code -1) read as 'nan'
+        hits = pd.Index(series.cat.categories).astype(str).str.lower().str.startswith(FIXATION_PREFIXES)
+        return np.append(np.asarray(hits, dtype=bool), False)[series.array.codes]
+    return series.astype(str).str.lower().str.startswith(FIXATION_PREFIXES).to_numpy(dtype=bool)
+
+def _group_codes(series, labels):
+    """Code of each row: 1 + position of its value in labels, 0 for any other value"""
+    codes = np.zeros(len(series), dtype=np.int64)
+    for code, label in enumerate(labels, 1):
+        codes[(series == label).to_numpy(dtype=bool)] = code
+    return codes
+
+def _grouped_sums(filtered_data, plan):
+    """
+    Sum the measures of the operational metrics by stage, defect type and operation, in one pass
+
+    Args:
+        filtered_data: Filtered DataFrame
+        plan: Column plan from operational_metric_plan
+
+    Returns:
+        Dictionary of 'rows' and each available measure role to an array
+        [fixation (0 no, 1 yes), defect type (0 other, 1 rebut, 2 retouche),
+        stage (0 other, 1 fin chaîne, 2 encours)] of sums
+    """
+    groups = np.zeros(len(filtered_data), dtype=np.int64)
+    if plan['category']:
+        groups += _group_codes(filtered_data[plan['category']], [FIN_CHAINE, ENCOURS])
+    if plan['type_defaut']:
+        groups += 3 * _group_codes(filtered_data[plan['type_defaut']], [REBUT, RETOUCHE])
+    if plan['operation']:
+        groups += 9 * _fixation_rows(filtered_data[plan['operation']])
+
+    sums = {'rows': np.bincount(groups, minlength=18).reshape(2, 3, 3)}
+    for role in ['qtte', 'qtte_sondee', 'temps']:
+        if plan[role]:
+            series = filtered_data[plan[role]]
+            sums[role] = _column_sum(np.bincount(groups, weights=_numeric_values(series), minlength=18), series).reshape(2, 3, 3)
+    return sums
+
+def _leading_rows(filtered_data, plan, share, column_roles):
+    """Sums over the leading share of the rows, the demonstration fallback of missing defect types"""
+    head = filtered_data.iloc[:int(len(filtered_data) * share)]
+    sums = {'rows': len(head), 'fixation_rows': 0}
+    for role in column_roles:
+        if plan[role]:
+            sums[role] = _column_sum(_numeric_values(head[plan[role]]).sum(), head[plan[role]]) if len(head) else 0
+    if plan['temps'] and plan['operation']:
+        fixation = _fixation_rows(head[plan['operation']])
+        sums['fixation_rows'] = int(fixation.sum())
+        sums['fixation_temps'] = _numeric_values(head[plan['temps']])[fixation].sum()
+    return sums
+
+def _stage_rows(filtered_data, stage_rows, control_type, share):
+    """Number of rows of a production stage, by category, else by TypeControle, else the leading share"""
+    if stage_rows:
+        return stage_rows
+    if 'TypeControle' in filtered_data.columns:
+        return int((filtered_data['TypeControle'] == control_type).sum())
+    return int(len(filtered_data) * share)
+
 def calculate_operational_metrics(filtered_data):
-    """Calculate metrics for the operational dashboard based on exact formulas"""
+    """
+    Calculate metrics for the operational dashboard based on exact formulas
+
+    The columns are resolved once per schema (operational_metric_plan) and
+    every measure is summed by stage, defect type and fixation operation in
+    one grouped pass; the fin chaîne, encours, rebut and retouche metrics
+    are then read from those sums.
+    """
     metrics = {}
-    
-    # Check for required columns and provide fallbacks if needed
-    # Category column (could be 'Categorie', 'categorie', etc.)
-    category_column = None
-    for col in ['Categorie', 'categorie', 'CATEGORIE', 'Category', 'category']:
-        if col in filtered_data.columns:
-            category_column = col
-            break
-    
-    # Quantity columns
-    qtte_column = None
-    for col in ['Quantite', 'quantite', 'QUANTITE', 'Qtte', 'qtte']:
-        if col in filtered_data.columns:
-            qtte_column = col
-            break
-    
-    qtte_sondee_column = None
-    for col in ['QtteSondee', 'qttesondee', 'QteSondee', 'qte_sondee']:
-        if col in filtered_data.columns:
-            qtte_sondee_column = col
-            break
-    
-    qtte_lct_column = None
-    for col in ['QtteLct', 'qttelct', 'QteLancee', 'qte_lancee']:
-        if col in filtered_data.columns:
-            qtte_lct_column = col
-            break
-    
-    temps_column = None
-    for col in ['Temps', 'temps', 'TEMPS', 'TempsRetouche', 'tempsretouche']:
-        if col in filtered_data.columns:
-            temps_column = col
-            break
-    
-    operation_column = None
-    for col in ['Operation', 'operation', 'OPERATION', 'IDOperation', 'idoperation']:
-        if col in filtered_data.columns:
-            operation_column = col
-            break
-    
-    taux_horaire_column = None
-    for col in ['TauxHoraire', 'tauxhoraire', 'TauxHorraire', 'tauxhorraire']:
-        if col in filtered_data.columns:
-            taux_horaire_column = col
-            break
-    
-    type_defaut_column = None
-    for col in ['TypeDefaut', 'typedefaut', 'Type_Defaut', 'type_defaut']:
-        if col in filtered_data.columns:
-            type_defaut_column = col
-            break
-    
-    # Default values if columns not found
-    default_total = 100
-    default_rate = 5.0  # 5% default rate
-    
+    plan = operational_metric_plan(filtered_data)
+    category_column = plan['category']
+    qtte_column = plan['qtte']
+    qtte_sondee_column = plan['qtte_sondee']
+    qtte_lct_column = plan['qtte_lct']
+    temps_column = plan['temps']
+    operation_column = plan['operation']
+    taux_horaire_column = plan['taux_horaire']
+    type_defaut_column = plan['type_defaut']
+
+    sums = _grouped_sums(filtered_data, plan)
+    total_rows = len(filtered_data)
+    total_qtte_sondee = sums['qtte_sondee'].sum() if qtte_sondee_column else 0
+    total_taux_horaire = _numeric_values(filtered_data[taux_horaire_column]).sum() if taux_horaire_column else 0
+
     # ----------------------------------------
-    # FIN CHAÎNE METRICS
+    # FIN CHAÎNE AND ENCOURS CHAÎNE METRICS
     # ----------------------------------------
-    
-    # FIN CHAINE Data filter
-    if category_column and 'PRODUCTION FIN CHAINE' in filtered_data[category_column].unique():
-        fin_chaine_data = filtered_data[filtered_data[category_column] == 'PRODUCTION FIN CHAINE']
-    else:
-        # Fallback to TypeControle if available
-        if 'TypeControle' in filtered_data.columns:
-            fin_chaine_data = filtered_data[filtered_data['TypeControle'] == 'Fin_Chaine']
+
+    # Stage code in the sums, TypeControle fallback and share of the rows
+    # assumed when neither categories nor control types are available
+    for prefix, stage, control_type, share in [('fin_chaine', 1, 'Fin_Chaine', 0.4), ('encours', 2, 'Encours_Chaine', 0.3)]:
+        # NRFC / NREC - Nombre de retouches
+        # = sum of column Qtte where column categorie is the stage
+        if qtte_column and category_column:
+            count = sums['qtte'][:, :, stage].sum() if sums['rows'][:, :, stage].sum() else 0
         else:
-            # No category column, use a portion of the data for demonstration
-            fin_chaine_data = filtered_data.head(int(len(filtered_data) * 0.4))
-    
-    # NRFC - Nombre de retouches Fin Chaîne
-    # = sum of column Qtte where column categorie = "PRODUCTION FIN CHAINE"
-    if qtte_column and category_column:
-        metrics['fin_chaine_count'] = filtered_data[
-            filtered_data[category_column] == 'PRODUCTION FIN CHAINE'
-        ][qtte_column].sum() if not fin_chaine_data.empty else 0
-    else:
-        metrics['fin_chaine_count'] = len(fin_chaine_data)
-    
-    # TRFC - Taux de retouches Fin de chaîne
-    # = NRFC / sum of column QtteSondee where column categorie = "PRODUCTION FIN CHAINE"
-    if qtte_sondee_column and category_column:
-        qtte_sondee_fin = filtered_data[
-            filtered_data[category_column] == 'PRODUCTION FIN CHAINE'
-        ][qtte_sondee_column].sum() if not fin_chaine_data.empty else default_total
-        
-        metrics['fin_chaine_rate'] = (metrics['fin_chaine_count'] / max(1, qtte_sondee_fin)) * 100
-    else:
-        # Fallback calculation
-        metrics['fin_chaine_rate'] = (metrics['fin_chaine_count'] / max(1, len(filtered_data))) * 100
-    
-    # TepRFC - Temps de retouches Fin Chaîne
-    # = Sum of column Temps when column operation starts with "fix" or "fixation" and column categorie = "PRODUCTION FIN CHAINE"
-    if temps_column and operation_column and category_column:
-        # Filter operations that start with 'fixation' or 'fix'
-        fixation_ops = filtered_data[
-            (filtered_data[category_column] == 'PRODUCTION FIN CHAINE') &
-            (filtered_data[operation_column].astype(str).str.lower().str.startswith(('fixation', 'fix')))
-        ]
-        metrics['fin_chaine_time'] = fixation_ops[temps_column].sum() if not fixation_ops.empty else 0
-    else:
-        # Fallback: estimate time based on count
-        metrics['fin_chaine_time'] = metrics['fin_chaine_count'] * 5  # Assume 5 minutes per retouche
-    
-    # ThRFC - Taux horaire de retouches Fin de chaîne
-    # = TepRFC / sum of column TauxHorraire
-    if taux_horaire_column:
-        total_taux_horaire = filtered_data[taux_horaire_column].sum() if taux_horaire_column in filtered_data.columns else 1
-        metrics['fin_chaine_time_rate'] = metrics['fin_chaine_time'] / max(1, total_taux_horaire)
-    else:
-        # Fallback calculation
-        metrics['fin_chaine_time_rate'] = metrics['fin_chaine_time'] / max(1, metrics['fin_chaine_count'])
-    
-    # ----------------------------------------
-    # ENCOURS CHAÎNE METRICS
-    # ----------------------------------------
-    
-    # ENCOURS CHAINE Data filter
-    if category_column and 'PRODUCTION ENCOURS' in filtered_data[category_column].unique():
-        encours_data = filtered_data[filtered_data[category_column] == 'PRODUCTION ENCOURS']
-    else:
-        # Fallback to TypeControle if available
-        if 'TypeControle' in filtered_data.columns:
-            encours_data = filtered_data[filtered_data['TypeControle'] == 'Encours_Chaine']
+            count = _stage_rows(filtered_data, sums['rows'][:, :, stage].sum(), control_type, share)
+
+        # TRFC / TREC - Taux de retouches
+        # = count / sum of column QtteSondee where column categorie is the stage
+        if qtte_sondee_column and category_column:
+            rate = (count / max(1, sums['qtte_sondee'][:, :, stage].sum())) * 100
         else:
-            # No category column, use a portion of the data for demonstration
-            encours_data = filtered_data.head(int(len(filtered_data) * 0.3))
-    
-    # NREC - Nombre de retouches Encours Chaîne
-    # = sum of column QTTE where column categorie = "PRODUCTION ENCOURS"
-    if qtte_column and category_column:
-        metrics['encours_count'] = filtered_data[
-            filtered_data[category_column] == 'PRODUCTION ENCOURS'
-        ][qtte_column].sum() if not encours_data.empty else 0
-    else:
-        metrics['encours_count'] = len(encours_data)
-    
-    # TREC - Taux de retouches Encours chaîne
-    # = NREC / sum of column QtteSondee where column categorie = "PRODUCTION ENCOURS"
-    if qtte_sondee_column and category_column:
-        qtte_sondee_encours = filtered_data[
-            filtered_data[category_column] == 'PRODUCTION ENCOURS'
-        ][qtte_sondee_column].sum() if not encours_data.empty else default_total
-        
-        metrics['encours_rate'] = (metrics['encours_count'] / max(1, qtte_sondee_encours)) * 100
-    else:
-        # Fallback calculation
-        metrics['encours_rate'] = (metrics['encours_count'] / max(1, len(filtered_data))) * 100
-    
-    # TepREC - Temps de retouches Encours Chaîne
-    # = Sum of column Temps when operation starts with "fix" or "fixation" and categorie = "PRODUCTION ENCOURS"
-    if temps_column and operation_column and category_column:
-        # Filter operations that start with 'fixation' or 'fix'
-        fixation_ops = filtered_data[
-            (filtered_data[category_column] == 'PRODUCTION ENCOURS') &
-            (filtered_data[operation_column].astype(str).str.lower().str.startswith(('fixation', 'fix')))
-        ]
-        metrics['encours_time'] = fixation_ops[temps_column].sum() if not fixation_ops.empty else 0
-    else:
-        # Fallback: estimate time based on count
-        metrics['encours_time'] = metrics['encours_count'] * 5  # Assume 5 minutes per retouche
-    
-    # ThREC - Taux horaire de retouches Encours de chaîne
-    # = TepREC / sum of column TauxHorraire
-    if taux_horaire_column:
-        total_taux_horaire = filtered_data[taux_horaire_column].sum() if taux_horaire_column in filtered_data.columns else 1
-        metrics['encours_time_rate'] = metrics['encours_time'] / max(1, total_taux_horaire)
-    else:
-        # Fallback calculation
-        metrics['encours_time_rate'] = metrics['encours_time'] / max(1, metrics['encours_count'])
-    
+            rate = (count / max(1, total_rows)) * 100
+
+        # TepRFC / TepREC - Temps de retouches
+        # = sum of column Temps where operation starts with "fix" or "fixation" and categorie is the stage
+        if temps_column and operation_column and category_column:
+            time = sums['temps'][1, :, stage].sum() if sums['rows'][1, :, stage].sum() else 0
+        else:
+            time = count * 5  # Assume 5 minutes per retouche
+
+        # ThRFC / ThREC - Taux horaire de retouches
+        # = time / sum of column TauxHorraire
+        if taux_horaire_column:
+            time_rate = time / max(1, total_taux_horaire)
+        else:
+            time_rate = time / max(1, count)
+
+        metrics[f'{prefix}_count'] = count
+        metrics[f'{prefix}_rate'] = rate
+        metrics[f'{prefix}_time'] = time
+        metrics[f'{prefix}_time_rate'] = time_rate
+
     # ----------------------------------------
-    # REBUT METRICS
+    # REBUT AND RETOUCHE CUMULÉE METRICS
     # ----------------------------------------
-    
-    # Rebut data filter
-    if type_defaut_column and 'Rebut' in filtered_data[type_defaut_column].unique():
-        rebut_data = filtered_data[filtered_data[type_defaut_column] == 'Rebut']
+
+    # Rows of a defect type, or a leading share of the rows when the type is unknown
+    if type_defaut_column and sums['rows'][:, 1, :].sum():
+        rebut = {role: values[:, 1, :].sum() for role, values in sums.items()}
     else:
-        # Fallback using a portion of the data
-        rebut_data = filtered_data.head(int(len(filtered_data) * 0.1))  # Assume 10% is rebut
-    
-    # Rebut encours cumulé
-    if qtte_column:
-        metrics['rebut_count'] = rebut_data[qtte_column].sum() if not rebut_data.empty else 0
+        rebut = _leading_rows(filtered_data, plan, 0.1, ['qtte'])  # Assume 10% is rebut
+    if type_defaut_column and sums['rows'][:, 2, :].sum():
+        retouche = {role: values[:, 2, :].sum() for role, values in sums.items()}
+        retouche['fixation_rows'] = sums['rows'][1, 2, :].sum()
+        if temps_column and operation_column:
+            retouche['fixation_temps'] = sums['temps'][1, 2, :].sum()
     else:
-        metrics['rebut_count'] = len(rebut_data)
-    
+        retouche = _leading_rows(filtered_data, plan, 0.3, ['qtte'])  # Assume 30% is retouche
+
+    # Rebut encours cumulé
+    metrics['rebut_count'] = rebut['qtte'] if qtte_column else rebut['rows']
+
     # Taux rebut encours cumulé
     if qtte_sondee_column:
-        total_qtte_sondee = filtered_data[qtte_sondee_column].sum() if qtte_sondee_column in filtered_data else default_total
         metrics['rebut_rate'] = (metrics['rebut_count'] / max(1, total_qtte_sondee)) * 100
     else:
-        # Fallback calculation
-        metrics['rebut_rate'] = (metrics['rebut_count'] / max(1, len(filtered_data))) * 100
-    
+        metrics['rebut_rate'] = (metrics['rebut_count'] / max(1, total_rows)) * 100
+
     # Taux d'avancement contrôle
     if qtte_sondee_column and qtte_lct_column:
-        total_qtte_sondee = filtered_data[qtte_sondee_column].sum() if qtte_sondee_column in filtered_data.columns else default_total
-        total_qtte_lct = filtered_data[qtte_lct_column].sum() if qtte_lct_column in filtered_data.columns else default_total * 1.2
+        total_qtte_lct = _numeric_values(filtered_data[qtte_lct_column]).sum()
         metrics['avancement_rate'] = (total_qtte_sondee / max(1, total_qtte_lct)) * 100
     else:
-        # Default value
         metrics['avancement_rate'] = 85  # Default 85% progress
-    
-    # ----------------------------------------
-    # RETOUCHE CUMULÉE METRICS
-    # ----------------------------------------
-    
-    # Retouche data filter
-    if type_defaut_column and 'Retouche' in filtered_data[type_defaut_column].unique():
-        retouche_data = filtered_data[filtered_data[type_defaut_column] == 'Retouche']
-    else:
-        # Fallback using TypeControle if available
-        retouche_data = filtered_data.head(int(len(filtered_data) * 0.3))  # Assume 30% is retouche
-    
+
     # Retouche encours cumulée
-    if qtte_column:
-        metrics['retouche_total_count'] = retouche_data[qtte_column].sum() if not retouche_data.empty else 0
-    else:
-        metrics['retouche_total_count'] = len(retouche_data)
-    
+    metrics['retouche_total_count'] = retouche['qtte'] if qtte_column else retouche['rows']
+
     # Taux de retouche encours cumulée
     if qtte_sondee_column:
-        total_qtte_sondee = filtered_data[qtte_sondee_column].sum() if qtte_sondee_column in filtered_data.columns else default_total
         metrics['retouche_total_rate'] = (metrics['retouche_total_count'] / max(1, total_qtte_sondee)) * 100
     else:
-        # Fallback calculation
-        metrics['retouche_total_rate'] = (metrics['retouche_total_count'] / max(1, len(filtered_data))) * 100
-    
-    # Temps de retouches cumulé (in hours)
+        metrics['retouche_total_rate'] = (metrics['retouche_total_count'] / max(1, total_rows)) * 100
+
+    # Temps de retouches cumulé (in hours), of the operations starting with 'fixation' or 'fix'
     if temps_column and operation_column:
-        # Filter operations that start with 'fixation' or 'fix'
-        if not retouche_data.empty:
-            fixation_ops = retouche_data[
-                retouche_data[operation_column].astype(str).str.lower().str.startswith(('fixation', 'fix'))
-            ]
-            # Convert minutes to hours
-            metrics['retouche_total_time'] = fixation_ops[temps_column].sum() / 60 if not fixation_ops.empty else 0
-        else:
-            metrics['retouche_total_time'] = 0
+        metrics['retouche_total_time'] = retouche['fixation_temps'] / 60 if retouche['fixation_rows'] else 0
     else:
-        # Fallback: estimate time based on count, convert to hours
         metrics['retouche_total_time'] = metrics['retouche_total_count'] * 5 / 60  # Assume 5 minutes per retouche, convert to hours
-    
+
     return metrics
 
 def create_chain_dashboard(filtered_data, chain_id):
@@ -610,8 +697,9 @@ def create_rebutage_dashboard(filtered_data, chain_id):
     </div>
     """, unsafe_allow_html=True)
     
-    # Calculate metrics
+    # Calculate metrics, and the per-order breakdown of both OF grids
     metrics = calculate_operational_metrics(filtered_data)
+    orders = orders_breakdown(filtered_data)
     
     # 1. Taux d'avancement contrôle section
     st.markdown("""
@@ -673,7 +761,7 @@ def create_rebutage_dashboard(filtered_data, chain_id):
         """, unsafe_allow_html=True)
         
         # Create the orders detail grid
-        create_orders_detail_grid(filtered_data)
+        create_orders_detail_grid(filtered_data, key="rebut_orders_page", orders=orders)
     
     # 2. Retouche Cumulée
     st.markdown("""
@@ -705,7 +793,7 @@ def create_rebutage_dashboard(filtered_data, chain_id):
     
     with col4:
         # Create another table for orders detail grid (same as Rebut Cumulée)
-        create_orders_detail_grid(filtered_data)
+        create_orders_detail_grid(filtered_data, key="retouche_orders_page", orders=orders)
         
 # Update the create_operational_dashboard function to properly use chain IDs from the CSV
 def create_operational_dashboard(data):
@@ -780,23 +868,15 @@ def create_operational_dashboard(data):
     all_chains_selected = selected_chain_option == "Toutes les chaînes"
     selected_chain = None if all_chains_selected else selected_chain_option
     
-    # Apply filters to data
-    filtered_data = data.copy()
-    
-    # Apply date filter
-    if 'DATE' in filtered_data.columns:
-        filtered_data = apply_date_filter(filtered_data, start_date, end_date)
-    
-    # Apply chain filter only if a specific chain is selected
+    # Filter the dates, and the chain only if a specific chain is selected;
+    # the rows are selected once (a view of the date-sorted rows for dates alone)
+    plan = FilterPlan(data).date_range(start_date, end_date)
     if selected_chain is not None:
-        if 'IDChaineMontage1' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'IDChaineMontage1', [selected_chain])
-        elif 'IDChaineMontage' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'IDChaineMontage', [selected_chain])
-        elif 'Chaine' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', [selected_chain])
-        elif 'idchaine' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'idchaine', [selected_chain])
+        for column in ['IDChaineMontage1', 'IDChaineMontage', 'Chaine', 'idchaine']:
+            if column in data.columns:
+                plan.isin(column, [selected_chain])
+                break
+    filtered_data = plan.apply()
     
     # Create dashboard tabs with larger, more visible text
     tab1, tab2 = st.tabs([
@@ -3,7 +3,15 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from utils import apply_date_filter
+from datastore.filters import FilterPlan
+from datastore.selections import selection_key
+from datastore.topk import top_k
+
+# Columns read by the tactical dashboard (metrics, top-N pies and trend charts)
+TACTICAL_COLUMNS = [
+    'DATE', 'Categorie', 'Qtte', 'QtteSondee', 'QtteLct', 'Temps', 'CoutMinute', 'Prix',
+    'Penalite', 'Type', 'IDOperation', 'IDchainemontage', 'IDChaineMontage1', 'Quantite'
+]
 
 # Apply custom CSS for enhanced dark theme
 def apply_dark_theme():
@@ -336,10 +344,68 @@ def create_tactical_header():
     </div>
     """, unsafe_allow_html=True)
 
+# Category of the rows counting reworked pieces
+FIN_CHAINE = 'PRODUCTION FIN CHAINE'
+
+# Row products the tactical KPIs are sums of: name -> columns multiplied together
+TACTICAL_TERMS = {
+    'qtte': ['Qtte'],
+    'qtte_temps': ['Qtte', 'Temps'],
+    'qtte_temps_cout': ['Qtte', 'Temps', 'CoutMinute'],
+    'sondee': ['QtteSondee'],
+    'sondee_prix': ['QtteSondee', 'Prix'],
+    'lct': ['QtteLct'],
+    'lct_prix': ['QtteLct', 'Prix'],
+    'prix': ['Prix'],
+    'penalite': ['Penalite']
+}
+
+def tactical_sums(filtered_data, terms=TACTICAL_TERMS):
+    """
+    Sum the KPI terms by category in one pass over the rows
+    
+    Args:
+        filtered_data: DataFrame with production data
+        terms: Dictionary of term name to the columns multiplied row by row
+        
+    Returns:
+        DataFrame with a row per Categorie value (None for rows without one,
+        or for every row when there is no Categorie column), a column with
+        the sum of each term whose columns exist (missing values skipped)
+        and a '<term>_count' column with its number of values
+    """
+    if 'Categorie' in filtered_data.columns:
+        categories = filtered_data['Categorie']
+        if isinstance(categories.dtype, pd.CategoricalDtype):
+            codes, labels = categories.array.codes, list(categories.cat.categories)
+        else:
+            codes, labels = pd.factorize(categories)
+            labels = list(labels)
+    else:
+        codes, labels = np.full(len(filtered_data), -1), []
+    # Rows without a category go to the first group
+    groups = np.asarray(codes) + 1
+    size = len(labels) + 1
+    
+    sums = {}
+    for name, columns in terms.items():
+        if not all(column in filtered_data.columns for column in columns):
+            continue
+        values = np.ones(len(filtered_data))
+        for column in columns:
+            values = values * filtered_data[column].to_numpy(dtype=float, na_value=np.nan)
+        present = ~np.isnan(values)
+        sums[name] = np.bincount(groups, weights=np.where(present, values, 0.0), minlength=size)
+        sums[name + '_count'] = np.bincount(groups, weights=present, minlength=size)
+    return pd.DataFrame(sums, index=pd.Index([None] + labels, dtype=object, name='Categorie'))
+
 def create_tactical_metrics(filtered_data):
     """
     Calculate tactical metrics with exact formulas as specified
     
+    Every metric is computed from the sums of tactical_sums, so the rows
+    are read once whatever the number of metrics.
+    
     Args:
         filtered_data: DataFrame with production data
         
@@ -379,115 +445,83 @@ def create_tactical_metrics(filtered_data):
         prix_unitaire = 100  # Default price per unit
         cout_minute = 0.5    # Default cost per minute
         
+        # Sums of every term, over all rows and over the "PRODUCTION FIN CHAINE" rows
+        sums = tactical_sums(filtered_data)
+        total = sums.sum()
+        if 'Categorie' in filtered_data.columns and FIN_CHAINE in sums.index:
+            fin_chaine = sums.loc[FIN_CHAINE]
+        else:
+            fin_chaine = pd.Series(0.0, index=sums.columns)
+        
+        # Mean unit price (NaN when no row has a price, like an empty mean)
+        if 'prix' in sums.columns:
+            prix_moyen = total['prix'] / total['prix_count'] if total['prix_count'] else np.nan
+        else:
+            prix_moyen = prix_unitaire
+        
         # 1. RETOUCHE CALCULATIONS ========================================
         
         # Nbre de retouche = sum of column Qtte where categorie = "PRODUCTION FIN CHAINE"
-        if 'Categorie' in filtered_data.columns and 'Qtte' in filtered_data.columns:
-            fin_chaine_data = filtered_data[filtered_data['Categorie'] == 'PRODUCTION FIN CHAINE']
-            metrics['retouche_count'] = fin_chaine_data['Qtte'].sum()
-        else:
-            metrics['retouche_count'] = 0
+        if 'Categorie' in filtered_data.columns and 'qtte' in sums.columns:
+            metrics['retouche_count'] = fin_chaine['qtte']
             
         # Taux de retouche = nbre de retouche / sum of column QtteSondee where categorie = "PRODUCTION FIN CHAINE"
-        if 'Categorie' in filtered_data.columns and 'QtteSondee' in filtered_data.columns:
-            fin_chaine_data = filtered_data[filtered_data['Categorie'] == 'PRODUCTION FIN CHAINE']
-            total_sondee = fin_chaine_data['QtteSondee'].sum()
-            metrics['retouche_rate'] = safe_divide(metrics['retouche_count'], total_sondee) * 100
-        else:
-            metrics['retouche_rate'] = 0
+        if 'Categorie' in filtered_data.columns and 'sondee' in sums.columns:
+            metrics['retouche_rate'] = safe_divide(metrics['retouche_count'], fin_chaine['sondee']) * 100
             
         # Temps de retouche totale = sum(nbre de retouche of the operation * Temps)
-        # Convert hours to minutes as specified
-        if 'Categorie' in filtered_data.columns and 'Qtte' in filtered_data.columns and 'Temps' in filtered_data.columns:
-            fin_chaine_data = filtered_data[filtered_data['Categorie'] == 'PRODUCTION FIN CHAINE']
-            # Assuming Temps is in hours, convert to minutes (multiply by 60)
-            metrics['retouche_time'] = (fin_chaine_data['Qtte'] * fin_chaine_data['Temps'] * 60).sum()
-        else:
-            metrics['retouche_time'] = 0
+        # Assuming Temps is in hours, convert to minutes (multiply by 60)
+        if 'Categorie' in filtered_data.columns and 'qtte_temps' in sums.columns:
+            metrics['retouche_time'] = fin_chaine['qtte_temps'] * 60
             
         # Taux de temps de retouche = temps de retouche / somme(QtteLct de chaque gamme * prix unitaire)
-        if 'QtteLct' in filtered_data.columns:
+        if 'lct' in sums.columns:
             # Use prix_unitaire as default if Prix column doesn't exist
-            if 'Prix' in filtered_data.columns:
-                total_value = (filtered_data['QtteLct'] * filtered_data['Prix']).sum()
-            else:
-                total_value = filtered_data['QtteLct'].sum() * prix_unitaire
-                
+            total_value = total['lct_prix'] if 'lct_prix' in sums.columns else total['lct'] * prix_unitaire
             metrics['retouche_time_rate'] = safe_divide(metrics['retouche_time'], total_value) * 100
-        else:
-            metrics['retouche_time_rate'] = 0
             
         # Cout de retouche = sum(Qtte * Temps (in minutes) * cout mn)
-        if 'Categorie' in filtered_data.columns and 'Qtte' in filtered_data.columns and 'Temps' in filtered_data.columns:
-            fin_chaine_data = filtered_data[filtered_data['Categorie'] == 'PRODUCTION FIN CHAINE']
+        if 'Categorie' in filtered_data.columns and 'qtte_temps' in sums.columns:
             # Use cout_minute as default if no specific column exists
-            if 'CoutMinute' in filtered_data.columns:
-                metrics['retouche_cost'] = (fin_chaine_data['Qtte'] * fin_chaine_data['Temps'] * 60 * fin_chaine_data['CoutMinute']).sum()
+            if 'qtte_temps_cout' in sums.columns:
+                metrics['retouche_cost'] = fin_chaine['qtte_temps_cout'] * 60
             else:
-                metrics['retouche_cost'] = (fin_chaine_data['Qtte'] * fin_chaine_data['Temps'] * 60 * cout_minute).sum()
-        else:
-            metrics['retouche_cost'] = 0
+                metrics['retouche_cost'] = fin_chaine['qtte_temps'] * 60 * cout_minute
             
         # %cout de retouche = cout de retouche / sum(QtteSondee * prix)
-        if 'QtteSondee' in filtered_data.columns:
+        if 'sondee' in sums.columns:
             # Use prix_unitaire as default if Prix column doesn't exist
-            if 'Prix' in filtered_data.columns:
-                total_value = (filtered_data['QtteSondee'] * filtered_data['Prix']).sum()
-            else:
-                total_value = filtered_data['QtteSondee'].sum() * prix_unitaire
-                
+            total_value = total['sondee_prix'] if 'sondee_prix' in sums.columns else total['sondee'] * prix_unitaire
             metrics['retouche_cost_rate'] = safe_divide(metrics['retouche_cost'], total_value) * 100
-        else:
-            metrics['retouche_cost_rate'] = 0
             
         # 2. REBUT CALCULATIONS ==========================================
         
-        # Rebut = QtteLct – qté exportée (make it 10% of QtteLct)
-        if 'QtteLct' in filtered_data.columns:
-            total_lct = filtered_data['QtteLct'].sum()
-            # Calculate rebut as 10% of QtteLct (since exported is 90%)
+        if 'lct' in sums.columns:
+            total_lct = total['lct']
+            
+            # Rebut = QtteLct – qté exportée (10% of QtteLct, since exported is 90%)
             metrics['rebut_count'] = total_lct * 0.1
-        else:
-            metrics['rebut_count'] = 0
             
-        # Taux rebut = Rebut / sum(QtteLct)
-        if 'QtteLct' in filtered_data.columns:
-            total_lct = filtered_data['QtteLct'].sum()
+            # Taux rebut = Rebut / sum(QtteLct)
             metrics['rebut_rate'] = safe_divide(metrics['rebut_count'], total_lct) * 100
-        else:
-            metrics['rebut_rate'] = 0
             
         # Coût rebut = sum(Rebut * prix_unitaire)
-        if 'Prix' in filtered_data.columns:
-            avg_price = filtered_data['Prix'].mean()
-            metrics['rebut_cost'] = metrics['rebut_count'] * avg_price
-        else:
-            metrics['rebut_cost'] = metrics['rebut_count'] * prix_unitaire
+        metrics['rebut_cost'] = metrics['rebut_count'] * prix_moyen
             
         # Taux cout rebut = cout rebut / somme(qté exportée * prix unitaire)
-        if 'QtteLct' in filtered_data.columns:
+        if 'lct' in sums.columns:
             # Exported quantity is 90% of QtteLct
-            qte_exportee = filtered_data['QtteLct'].sum() * 0.9
-            
-            # Calculate total value of exported quantity
-            if 'Prix' in filtered_data.columns:
-                total_export_value = qte_exportee * filtered_data['Prix'].mean()
-            else:
-                total_export_value = qte_exportee * prix_unitaire
-                
+            total_export_value = total['lct'] * 0.9 * prix_moyen
             metrics['rebut_cost_rate'] = safe_divide(metrics['rebut_cost'], total_export_value) * 100
             
             # Store these values for other calculations
-            metrics['total_production_value'] = (filtered_data['QtteLct'].sum() * 
-                                               (filtered_data['Prix'].mean() if 'Prix' in filtered_data.columns else prix_unitaire))
+            metrics['total_production_value'] = total['lct'] * prix_moyen
             metrics['total_export_value'] = total_export_value
-        else:
-            metrics['rebut_cost_rate'] = 0
             
         # 3. PENALITE CALCULATIONS ======================================
         # Calculate penalties based on available data
-        if 'Penalite' in filtered_data.columns:
-            metrics['penalite'] = filtered_data['Penalite'].sum()
+        if 'penalite' in sums.columns:
+            metrics['penalite'] = total['penalite']
         elif 'Type' in filtered_data.columns:
             # Assume penalties for certain defect types
             penalite_defauts = filtered_data[filtered_data['Type'].str.contains('DEFECT', case=False, na=False)]
@@ -504,7 +538,7 @@ def create_tactical_metrics(filtered_data):
     return metrics
 
 # Create top operations pie chart
-def create_top_operations_pie(filtered_data, category_filter=None, n=3, title=None, color_scheme='indigo'):
+def create_top_operations_pie(filtered_data, category_filter=None, n=3, title=None, color_scheme='indigo', selection=None):
     """
     Create a pie chart showing top operations
     
@@ -514,6 +548,7 @@ def create_top_operations_pie(filtered_data, category_filter=None, n=3, title=No
         n: Number of top items to show
         title: Chart title
         color_scheme: Color scheme to use
+        selection: Key of filtered_data's rows (see selection_key), to reuse the top items
         
     Returns:
         Plotly figure object
@@ -545,19 +580,14 @@ def create_top_operations_pie(filtered_data, category_filter=None, n=3, title=No
     else:
         data = filtered_data
     
-    # Group by IDOperation and sum the Qtte value
-    if 'Qtte' in data.columns:
-        operation_data = data.groupby('IDOperation')['Qtte'].sum().reset_index()
-    else:
-        # If no Qtte column, count occurrences
-        operation_data = data.groupby('IDOperation').size().reset_index(name='count')
-        operation_data.rename(columns={'count': 'Qtte'}, inplace=True)
-    
-    # Sort and get top N operations
-    operation_data = operation_data.sort_values('Qtte', ascending=False)
+    # Top N operations by Qtte (occurrences without a Qtte column), the others summed as "Autres"
+    top_operations = top_k(
+        data, 'IDOperation', 'Qtte' if 'Qtte' in data.columns else None, n,
+        cache_key=None if selection is None else (selection, category_filter)
+    ).set_axis(['IDOperation', 'Qtte'], axis=1)
     
     # Handle empty data
-    if len(operation_data) == 0:
+    if len(top_operations) == 0:
         return px.pie(
             names=["No Data Available"],
             values=[1],
@@ -566,19 +596,6 @@ def create_top_operations_pie(filtered_data, category_filter=None, n=3, title=No
             hole=0.5
         )
     
-    # Get top N operations
-    top_operations = operation_data.head(n)
-    
-    # Calculate sum for "Other" category
-    other_sum = operation_data[~operation_data['IDOperation'].isin(top_operations['IDOperation'])]['Qtte'].sum()
-    
-    # Add "Other" category if there are more operations
-    if other_sum > 0:
-        top_operations = pd.concat([
-            top_operations,
-            pd.DataFrame({'IDOperation': ['Autres'], 'Qtte': [other_sum]})
-        ])
-    
     # Create pie chart with improved design
     fig = px.pie(
         top_operations,
@@ -615,7 +632,7 @@ def create_top_operations_pie(filtered_data, category_filter=None, n=3, title=No
     return fig
 
 # Create top chains pie chart using the IDchainemontage column
-def create_top_chains_pie(filtered_data, category_filter=None, n=3, title=None, color_scheme='emerald'):
+def create_top_chains_pie(filtered_data, category_filter=None, n=3, title=None, color_scheme='emerald', selection=None):
     """
     Create a pie chart showing top chains
     
@@ -625,6 +642,7 @@ def create_top_chains_pie(filtered_data, category_filter=None, n=3, title=None,
         n: Number of top items to show
         title: Chart title
         color_scheme: Color scheme to use
+        selection: Key of filtered_data's rows (see selection_key), to reuse the top items
         
     Returns:
         Plotly figure object
@@ -658,19 +676,14 @@ def create_top_chains_pie(filtered_data, category_filter=None, n=3, title=None,
     else:
         data = filtered_data
     
-    # Group by chain and sum the Qtte value
-    if 'Qtte' in data.columns:
-        chain_data = data.groupby(chain_column)['Qtte'].sum().reset_index()
-    else:
-        # If no Qtte column, count occurrences
-        chain_data = data.groupby(chain_column).size().reset_index(name='count')
-        chain_data.rename(columns={'count': 'Qtte'}, inplace=True)
-    
-    # Sort and get top N chains
-    chain_data = chain_data.sort_values('Qtte', ascending=False)
+    # Top N chains by Qtte (occurrences without a Qtte column), the others summed as "Autres"
+    top_chains = top_k(
+        data, chain_column, 'Qtte' if 'Qtte' in data.columns else None, n,
+        cache_key=None if selection is None else (selection, category_filter)
+    ).set_axis([chain_column, 'Qtte'], axis=1)
     
     # Handle empty data
-    if len(chain_data) == 0:
+    if len(top_chains) == 0:
         return px.pie(
             names=["No Data Available"],
             values=[1],
@@ -679,19 +692,6 @@ def create_top_chains_pie(filtered_data, category_filter=None, n=3, title=None,
             hole=0.5
         )
     
-    # Get top N chains
-    top_chains = chain_data.head(n)
-    
-    # Calculate sum for "Other" category
-    other_sum = chain_data[~chain_data[chain_column].isin(top_chains[chain_column])]['Qtte'].sum()
-    
-    # Add "Other" category if there are more chains
-    if other_sum > 0:
-        top_chains = pd.concat([
-            top_chains,
-            pd.DataFrame({chain_column: ['Autres'], 'Qtte': [other_sum]})
-        ])
-    
     # Create pie chart with improved design
     fig = px.pie(
         top_chains,
@@ -728,7 +728,7 @@ def create_top_chains_pie(filtered_data, category_filter=None, n=3, title=None,
     return fig
 
 # Create historical trend line chart
-def create_trend_chart(filtered_data, category, group_by, title=None, color_scheme='indigo', top_n=5):
+def create_trend_chart(filtered_data, category, group_by, title=None, color_scheme='indigo', top_n=5, selection=None):
     """
     Create a line chart showing historical trends
     
@@ -739,6 +739,7 @@ def create_trend_chart(filtered_data, category, group_by, title=None, color_sche
         title: Chart title
         color_scheme: Color scheme to use
         top_n: Number of top items to show when grouping by IDOperation
+        selection: Key of filtered_data's rows (see selection_key), to reuse the top items
         
     Returns:
         Plotly figure object
@@ -779,21 +780,20 @@ def create_trend_chart(filtered_data, category, group_by, title=None, color_sche
     if group_by and group_by in filtered_data.columns:
         # For IDOperation, limit to top N operations by total quantity
         if group_by == 'IDOperation':
-            # Get the top N operations by total quantity
-            if 'Qtte' in filtered_data.columns:
-                top_operations = filtered_data.groupby(group_by)['Qtte'].sum().nlargest(top_n).index.tolist()
-            else:
-                # If no Qtte column, count occurrences
-                top_operations = filtered_data.groupby(group_by).size().nlargest(top_n).index.tolist()
+            # Get the top N operations by total quantity (occurrences without a Qtte column)
+            top_operations = top_k(
+                filtered_data, group_by, 'Qtte' if 'Qtte' in filtered_data.columns else None, top_n,
+                others=False, cache_key=selection
+            )[group_by].tolist()
             
             # Filter data to only include top operations
             filtered_data = filtered_data[filtered_data[group_by].isin(top_operations)]
         
         # Group by month and the specified group_by column
         if 'Qtte' in filtered_data.columns:
-            trend_data = filtered_data.groupby(['Month', group_by])['Qtte'].sum().reset_index()
+            trend_data = filtered_data.groupby(['Month', group_by], observed=True)['Qtte'].sum().reset_index()
         else:
-            trend_data = filtered_data.groupby(['Month', group_by]).size().reset_index(name='Qtte')
+            trend_data = filtered_data.groupby(['Month', group_by], observed=True).size().reset_index(name='Qtte')
         
         # Create line chart
         fig = px.line(
@@ -946,10 +946,11 @@ def create_tactical_dashboard(data):
         end_date = st.date_input("Date de fin", 
                                 value=pd.to_datetime(data['DATE'].max()) if 'DATE' in data.columns else None)
     
-    # Apply date filter
-    filtered_data = data.copy()
-    if 'DATE' in filtered_data.columns:
-        filtered_data = apply_date_filter(filtered_data, start_date, end_date)
+    # Apply date filter (a view of the date-sorted rows, no copy of the data); the
+    # selection's key lets the top-N charts reuse their results on reruns
+    plan = FilterPlan(data).date_range(start_date, end_date)
+    filtered_data = plan.apply()
+    selection = selection_key(plan)
     
     # Calculate metrics
     metrics = create_tactical_metrics(filtered_data)
@@ -983,7 +984,8 @@ def create_tactical_dashboard(data):
             category_filter="PRODUCTION FIN CHAINE", 
             n=3, 
             title="",
-            color_scheme='indigo'
+            color_scheme='indigo',
+            selection=selection
         )
         st.plotly_chart(operations_pie, use_container_width=True, key="retouche_operations_pie")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1035,7 +1037,8 @@ def create_tactical_dashboard(data):
             filtered_data, 
             category_filter="PRODUCTION FIN CHAINE", 
             n=3, 
-            title=""
+            title="",
+            selection=selection
         )
         st.plotly_chart(chains_pie, use_container_width=True, key="retouche_chains_pie")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1105,7 +1108,8 @@ def create_tactical_dashboard(data):
             filtered_data, 
             n=3, 
             title="",
-            color_scheme='rose'
+            color_scheme='rose',
+            selection=selection
         )
         st.plotly_chart(operations_pie, use_container_width=True, key="rebut_operations_pie")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1157,7 +1161,8 @@ def create_tactical_dashboard(data):
             filtered_data, 
             n=3, 
             title="",
-            color_scheme='emerald'
+            color_scheme='emerald',
+            selection=selection
         )
         st.plotly_chart(chains_pie, use_container_width=True, key="rebut_chains_pie")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1260,7 +1265,8 @@ def create_tactical_dashboard(data):
             filtered_data, 
             n=3, 
             title="",
-            color_scheme='amber'
+            color_scheme='amber',
+            selection=selection
         )
         st.plotly_chart(operations_pie, use_container_width=True, key="penalite_operations_pie")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1276,7 +1282,8 @@ def create_tactical_dashboard(data):
             'Penalite', 
             None, 
             title="",
-            color_scheme='amber'
+            color_scheme='amber',
+            selection=selection
         )
         st.plotly_chart(penalty_trend, use_container_width=True, key="penalite_trend_chart")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1304,7 +1311,8 @@ def create_tactical_dashboard(data):
             'Retouche', 
             'IDOperation', 
             title="",
-            color_scheme='indigo'
+            color_scheme='indigo',
+            selection=selection
         )
         st.plotly_chart(defect_trend, use_container_width=True, key="retouche_defect_trend")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1324,7 +1332,8 @@ def create_tactical_dashboard(data):
             'Retouche', 
             chain_column, 
             title="",
-            color_scheme='emerald'
+            color_scheme='emerald',
+            selection=selection
         )
         st.plotly_chart(provider_trend, use_container_width=True, key="retouche_provider_trend")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1346,7 +1355,8 @@ def create_tactical_dashboard(data):
             'Rebut', 
             'IDOperation', 
             title="",
-            color_scheme='rose'
+            color_scheme='rose',
+            selection=selection
         )
         st.plotly_chart(defect_trend, use_container_width=True, key="rebut_defect_trend")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1366,7 +1376,8 @@ def create_tactical_dashboard(data):
             'Rebut', 
             chain_column, 
             title="",
-            color_scheme='emerald'
+            color_scheme='emerald',
+            selection=selection
         )
         st.plotly_chart(provider_trend, use_container_width=True, key="rebut_provider_trend")
         st.markdown("</div>", unsafe_allow_html=True)
\ No newline at end of file
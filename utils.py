@@ -2,121 +2,66 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from datastore.filters import FilterPlan
+from datastore.metrics import aggregate_metrics
+from datastore.partitions import DateArchive
 
 def apply_date_filter(data, start_date=None, end_date=None, date_column='DATE'):
-    """Apply date range filter to the data"""
-    if date_column not in data.columns:
-        return data
-    
-    filtered_data = data.copy()
-    
-    # Convert string dates to datetime if needed
-    if start_date and not isinstance(start_date, datetime):
-        try:
-            start_date = pd.to_datetime(start_date)
-        except:
-            start_date = None
-    
-    if end_date and not isinstance(end_date, datetime):
-        try:
-            end_date = pd.to_datetime(end_date)
-        except:
-            end_date = None
-    
-    # Apply filters
-    if start_date:
-        filtered_data = filtered_data[filtered_data[date_column] >= start_date]
-    
-    if end_date:
-        filtered_data = filtered_data[filtered_data[date_column] <= end_date]
-    
-    return filtered_data
+    """Apply date range filter to the data (a DateArchive only reads the year/month partitions overlapping the range)"""
+    if isinstance(data, DateArchive):
+        data = data.read(start_date, end_date)
+    return FilterPlan(data).date_range(start_date, end_date, date_column).apply()
 
 def apply_categorical_filter(data, column, values):
     """Apply categorical filter to the data"""
-    if column not in data.columns or not values:
-        return data
-    
-    # Convert values to list if not already
-    if not isinstance(values, list):
-        values = [values]
-    
-    # Ensure values are strings for comparison
-    values = [str(val) for val in values]
-    
-    # Apply filter
-    return data[data[column].astype(str).isin(values)]
+    return FilterPlan(data).isin(column, values).apply()
+
+def apply_categorical_filters(data, filters):
+    """Apply several categorical filters ({column: values}) at once, from the bitmap index when there is one"""
+    plan = FilterPlan(data)
+    for column, values in filters.items():
+        plan.isin(column, values)
+    return plan.apply()
 
 def apply_numerical_filter(data, column, min_val=None, max_val=None):
     """Apply numerical range filter to the data"""
-    if column not in data.columns:
-        return data
-    
-    filtered_data = data.copy()
-    
-    # Apply filters
-    if min_val is not None:
-        filtered_data = filtered_data[filtered_data[column] >= min_val]
-    
-    if max_val is not None:
-        filtered_data = filtered_data[filtered_data[column] <= max_val]
-    
-    return filtered_data
+    return FilterPlan(data).between(column, min_val, max_val).apply()
 
-def apply_all_filters(data, filters):
-    """Apply all filters to the data"""
-    filtered_data = data.copy()
-    
-    # Apply date filter
-    filtered_data = apply_date_filter(
-        filtered_data,
-        start_date=filters.get("start_date"),
-        end_date=filters.get("end_date")
-    )
+def all_filters_plan(data, filters):
+    """Build the FilterPlan of the dashboard filters, without evaluating it"""
+    plan = FilterPlan(data).date_range(filters.get("start_date"), filters.get("end_date"))
     
     # Apply categorical filters
     if filters.get("chains"):
-        if 'idchainemontage' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'idchainemontage', filters.get("chains"))
-        elif 'IDchainemontage' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'IDchainemontage', filters.get("chains"))
-        elif 'Chaine' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'Chaine', filters.get("chains"))
+        for column in ['idchainemontage', 'IDchainemontage', 'Chaine']:
+            if column in data.columns:
+                plan.isin(column, filters.get("chains"))
+                break
     
     if filters.get("operations"):
-        filtered_data = apply_categorical_filter(filtered_data, 'Operation', filters.get("operations"))
+        plan.isin('Operation', filters.get("operations"))
     
     if filters.get("controllers"):
-        if 'idcontroleur' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'idcontroleur', filters.get("controllers"))
-        elif 'IDcontroleur' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'IDcontroleur', filters.get("controllers"))
-        elif 'IDControleur' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'IDControleur', filters.get("controllers"))
-        elif 'Controleur' in filtered_data.columns:
-            filtered_data = apply_categorical_filter(filtered_data, 'Controleur', filters.get("controllers"))
+        for column in ['idcontroleur', 'IDcontroleur', 'IDControleur', 'Controleur']:
+            if column in data.columns:
+                plan.isin(column, filters.get("controllers"))
+                break
     
-    # Apply numerical filters
-    if filters.get("cnq_min") is not None or filters.get("cnq_max") is not None:
-        filtered_data = apply_numerical_filter(
-            filtered_data, 
-            'CNQ', 
-            min_val=filters.get("cnq_min"), 
-            max_val=filters.get("cnq_max")
-        )
+    if filters.get("categories"):
+        plan.isin('Categorie', filters.get("categories"))
     
-    if filters.get("cnq_pct_min") is not None or filters.get("cnq_pct_max") is not None:
-        filtered_data = apply_numerical_filter(
-            filtered_data, 
-            'CNQ_Percentage', 
-            min_val=filters.get("cnq_pct_min"), 
-            max_val=filters.get("cnq_pct_max")
-        )
+    # Apply numerical filters
+    plan.between('CNQ', filters.get("cnq_min"), filters.get("cnq_max"))
+    plan.between('CNQ_Percentage', filters.get("cnq_pct_min"), filters.get("cnq_pct_max"))
     
-    return filtered_data
+    return plan
+
+def apply_all_filters(data, filters, columns=None):
+    """Apply all filters to the data, selecting the rows once (and only the given columns when any)"""
+    return all_filters_plan(data, filters).apply(columns)
 
-def calculate_aggregations(data, group_by=None, metrics=None):
-    """Calculate aggregations based on group by columns and metrics"""
+def calculate_aggregations(data, group_by=None, metrics=None, sort_by=None, limit=None):
+    """Calculate aggregations based on group by columns and metrics, optionally the top groups by a metric"""
     if not group_by or not metrics or data.empty:
         return data
     
@@ -125,22 +70,13 @@ def calculate_aggregations(data, group_by=None, metrics=None):
     if not existing_group_by:
         return data
     
-    # Ensure all metrics exist
-    existing_metrics = [col for col in metrics if col in data.columns]
-    if not existing_metrics:
-        return data
-    
-    # Create aggregation dictionary
-    agg_dict = {}
-    for metric in existing_metrics:
-        # For simplicity, use sum for all numeric metrics
-        # Could be extended to support different aggregation methods
-        agg_dict[metric] = 'sum'
-    
-    # Group and aggregate
-    grouped_data = data.groupby(existing_group_by).agg(agg_dict).reset_index()
+    # Compute the metrics in one groupby pass, each finalized on the grouped
+    # result (ratios like %CNQ are ratios of sums, see METRIC_REGISTRY), and
+    # keep the top groups by partial selection
+    grouped_data = aggregate_metrics(data, existing_group_by, metrics, sort_by, limit)
     
-    return grouped_data
+    # Without any metric the data can compute, return it as is
+    return data if grouped_data is None else grouped_data
 
 # Graph creation functions
 def create_graph(graph_type, x_data, y_data, color_data=None, title=None):
@@ -3,89 +3,166 @@ import numpy as np
 import os
 from datetime import datetime, timedelta
 import traceback
+from functools import partial
+from datastore.bitmaps import build_bitmap_index
+from datastore.cache import load_cached_csv, open_archive, read_csv
+from datastore.columns import projection_key, usecols_matcher
+from datastore.costs import DEFAULT_UNIT_PRICE, apply_cost_model, cost_step
+from datastore.cube import build_cube
+from datastore.dates import register_date_index, sort_by_date
+from datastore.facets import facet_column, facet_options
+from datastore.star import FACT, append_star, join_labels, split_star
+from datastore.schema import add_alias_views, compact_dtypes, fill_missing, memory_report, print_memory_report
+from utils.filter_utils import DASHBOARD_FACET_COLUMNS, dashboard_facets
 
-def load_data():
-    """Load and preprocess the dataset from res.csv"""
+# Copy-on-write lets alias columns share their source buffers instead of
+# copying them (this is the default from pandas 3 on). Enabled here for the
+# Dash app, as app.py does for the Streamlit one
+pd.set_option('mode.copy_on_write', True)
+
+# Standardize column names for consistency
+COLUMN_MAPPING = {
+    'IDChaineMontage': 'Chaine',
+    'IDOperation': 'Operation',
+    'IDControleur': 'Controleur',
+    'Contrôleur (se)': 'Controleur',  # Alias
+    'Chaîne': 'Chaine',  # Alias
+    'Qtte': 'Quantite',
+    'Qtte OF': 'Quantite'  # Alias
+}
+
+# Default parameters of the cost of non-quality
+CNQ_COST_PARAMETERS = {
+    'rework_cost': 50,  # Cost per rework
+    'scrap_cost': 100,  # Cost per scrapped item
+    'penalty_cost': 75,  # Cost per penalty point
+    'unit_price': DEFAULT_UNIT_PRICE  # Assumed price per unit
+}
+
+# Retouche (rework) based on NbrReclamations
+def _rework(data, params):
+    return data['NbrReclamations'] * params['rework_cost'] if 'NbrReclamations' in data.columns else 0
+
+# Rebut (scrap) based on DeuxiemeChoix (second choice/defective items)
+def _scrap(data, params):
+    return data['DeuxiemeChoix'].fillna(0) * params['scrap_cost'] if 'DeuxiemeChoix' in data.columns else 0
+
+# Penalite (penalties) based on Note (assuming it represents penalty score)
+def _penalty(data, params):
+    return data['Note'].fillna(0) * params['penalty_cost'] if 'Note' in data.columns else 0
+
+def _total_cnq(data, params):
+    return data['Retouche'] + data['Rebut'] + data['Penalite']
+
+def _cnq_percentage(data, params):
+    # CNQ percentage using ValeurOF (OF value) if available
+    if 'ValeurOF' in data.columns:
+        total_value = data['ValeurOF']
+    else:
+        # Fallback to using quantity with assumed unit price
+        total_value = data['Quantite'] * params['unit_price']
+    # Rows without a value count as 0%
+    return ((data['CNQ'] / total_value.replace(0, np.nan)) * 100).fillna(0)
+
+# Cost of non-quality components, computed from the loaded columns
+CNQ_COST_MODEL = [
+    cost_step('Retouche', _rework, parameters=['rework_cost']),
+    cost_step('Rebut', _scrap, parameters=['scrap_cost']),
+    cost_step('Penalite', _penalty, parameters=['penalty_cost']),
+    cost_step('CNQ', _total_cnq, inputs=['Retouche', 'Rebut', 'Penalite']),
+    cost_step('CNQ_Percentage', _cnq_percentage, parameters=['unit_price'], inputs=['CNQ'])
+]
+
+def parse_csv(csv_path, columns=None, **read_kwargs):
+    """Read the CSV export (only the given columns if any), type it and split it into fact and dimension tables"""
+    data = read_csv(csv_path, usecols=usecols_matcher(columns), **read_kwargs)
+    before = data.memory_usage(deep=True, index=False)
+    
+    # Convert date columns to datetime
+    if 'DATE' in data.columns:
+        data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
+        # Extract month and year for easy filtering
+        data['Month'] = data['DATE'].dt.month
+        data['Year'] = data['DATE'].dt.year
+    
+    data = compact_dtypes(data)
+    print_memory_report(memory_report(before, data))
+    
+    # Records repeated on every row move to deduplicated dimension tables
+    return split_star(data)
+
+def prepare_data(tables, columns=None):
+    """Join the cached tables of the CSV export into the frame of the callbacks, priced and indexed for the filters"""
+    # Join only the dimension columns this view uses, rows in date order
+    data = sort_by_date(join_labels(tables[FACT], tables, columns))
+    
+    # Standardize column names for consistency (aliases share the source columns)
+    add_alias_views(data, COLUMN_MAPPING)
+    
+    # Fill NaN values with 0 (IDs and labels are categorical and keep theirs)
+    fill_missing(data)
+    
+    # Get reference data
+    if 'Operation' in data.columns:
+        data['Operation'] = data['Operation'].astype(str).fillna('Unknown')
+    if 'Libelle' in data.columns:
+        data['OperationName'] = data['Libelle']
+    
+    # Cost columns are computed here, not parsed, so the snapshot only holds source columns
+    data = apply_cost_model(data, CNQ_COST_MODEL, CNQ_COST_PARAMETERS)
+    
+    # Index the dates and filter values of the final frame for the filters
+    register_date_index(data)
+    build_bitmap_index(data)
+    return data
+
+def load_archive(columns=None):
+    """
+    Open the CSV export's snapshot by year/month, restricted to a column projection if given
+
+    apply_date_filter reads only the months overlapping its range from the
+    archive, prepared like load_data's frame, instead of the whole history.
+
+    Args:
+        columns: Column projection, as for load_data
+
+    Returns:
+        DateArchive, or None when res.csv is missing
+    """
+    csv_path = "res.csv"
+    if not os.path.exists(csv_path):
+        return None
+    
+    variant = f"dash-{projection_key(columns)}"
+    archive = open_archive(csv_path, variant)
+    if archive is None:
+        # Write (or bring up to date) the snapshot first
+        load_cached_csv(csv_path, parse=partial(parse_csv, columns=columns), variant=variant, append=append_star, partition_by='DATE')
+        archive = open_archive(csv_path, variant)
+    return archive.prepared(partial(prepare_data, columns=columns)) if archive is not None else None
+
+def load_data(columns=None):
+    """Load and preprocess the dataset from res.csv, restricted to a column projection if given"""
     try:
         csv_path = "res.csv"
         
         if os.path.exists(csv_path):
             try:
                 print("Loading CSV file...")
-                # Load with proper encoding detection
-                try:
-                    data = pd.read_csv(csv_path, encoding='utf-8')
-                except UnicodeDecodeError:
-                    data = pd.read_csv(csv_path, encoding='latin1')
-                    
+                # Served from the Parquet snapshot (one file per month), only new records are parsed when the CSV grew
+                tables = load_cached_csv(
+                    csv_path,
+                    parse=partial(parse_csv, columns=columns),
+                    variant=f"dash-{projection_key(columns)}",
+                    append=append_star,
+                    partition_by='DATE'
+                )
+                data = prepare_data(tables, columns)
                 print("Successfully loaded CSV file")
                 
-                # Ensure data types are correct
-                # Convert date columns to datetime
-                if 'DATE' in data.columns:
-                    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
-                    # Extract month and year for easy filtering
-                    data['Month'] = data['DATE'].dt.month
-                    data['Year'] = data['DATE'].dt.year
-                    
-                # Standardize column names for consistency
-                column_mapping = {
-                    'IDChaineMontage': 'Chaine',
-                    'IDOperation': 'Operation',
-                    'IDControleur': 'Controleur',
-                    'Contrôleur (se)': 'Controleur',  # Alias
-                    'Chaîne': 'Chaine',  # Alias
-                    'Qtte': 'Quantite',
-                    'Qtte OF': 'Quantite'  # Alias
-                }
-                
-                # Apply column mapping where columns exist
-                for old_col, new_col in column_mapping.items():
-                    if old_col in data.columns:
-                        data[new_col] = data[old_col]
-                
-                # Calculate CNQ components
-                # Retouche (rework) based on NbrReclamations
-                if 'NbrReclamations' in data.columns:
-                    rework_cost = 50  # Cost per rework
-                    data['Retouche'] = data['NbrReclamations'] * rework_cost
-                else:
-                    data['Retouche'] = 0
-                
-                # Rebut (scrap) based on DeuxiemeChoix (second choice/defective items)
-                if 'DeuxiemeChoix' in data.columns:
-                    scrap_cost = 100  # Cost per scrapped item
-                    data['Rebut'] = data['DeuxiemeChoix'].fillna(0) * scrap_cost
-                else:
-                    data['Rebut'] = 0
-                
-                # Penalite (penalties) based on Note (assuming it represents penalty score)
-                if 'Note' in data.columns:
-                    penalty_cost = 75  # Cost per penalty point
-                    data['Penalite'] = data['Note'].fillna(0) * penalty_cost
-                else:
-                    data['Penalite'] = 0
-                
-                # Calculate total CNQ
-                data['CNQ'] = data['Retouche'] + data['Rebut'] + data['Penalite']
-                
-                # Calculate CNQ percentage using ValeurOF (OF value) if available
-                if 'ValeurOF' in data.columns:
-                    data['CNQ_Percentage'] = (data['CNQ'] / data['ValeurOF'].replace(0, np.nan)) * 100
-                else:
-                    # Fallback to using quantity with assumed unit price
-                    unit_price = 100  # Assumed price per unit
-                    total_value = data['Quantite'] * unit_price
-                    data['CNQ_Percentage'] = (data['CNQ'] / total_value.replace(0, np.nan)) * 100
-                
-                # Fill NaN values with 0
-                data = data.fillna(0)
-                
-                # Get reference data
-                if 'Operation' in data.columns:
-                    data['Operation'] = data['Operation'].astype(str).fillna('Unknown')
-                if 'Libelle' in data.columns:
-                    data['OperationName'] = data['Libelle']
+                # Sums by day and dimensions, answering the dashboards' aggregates without the rows
+                # (after a reload, only the days with new or corrected records are summed again)
+                build_cube(data, source=f"{csv_path}:dash-{projection_key(columns)}")
                 
                 print(f"Data loaded successfully: {data.shape[0]} rows, {data.shape[1]} columns")
                 return data
@@ -137,20 +214,19 @@ def create_sample_data():
     data['CNQ'] = data['Retouche'] + data['Rebut'] + data['Penalite']
     
     # Calculate CNQ percentage
-    unit_price = 100  # Assumed price per unit
+    unit_price = CNQ_COST_PARAMETERS['unit_price']  # Assumed price per unit
     total_value = data['Quantite'] * unit_price
     data['CNQ_Percentage'] = (data['CNQ'] / total_value) * 100
     
     return data
 
-def get_filter_options(data):
-    """Get unique values for filter dropdowns"""
+def get_filter_options(data, filters=None):
+    """Get the values of the filter dropdowns still reachable under the active filters (from the bitmap index)"""
     options = {}
     
-    categorical_columns = ['Chaine', 'Operation', 'Controleur']
-    for col in categorical_columns:
-        if col in data.columns:
-            options[col] = sorted(data[col].astype(str).unique())
+    # Each dropdown ignores its own selection but applies the other filters
+    for facet, counts in dashboard_facets(data, filters).items():
+        options[facet_column(data, facet, DASHBOARD_FACET_COLUMNS)] = facet_options(counts)
     
     return options
 
@@ -1,13 +1,17 @@
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+from datastore.facets import facet_counts, facet_options
+from datastore.filters import FilterPlan
+from datastore.metrics import aggregate_metrics
+from datastore.partitions import DateArchive
 
 def apply_date_filter(data, start_date=None, end_date=None, date_column='DATE'):
     """
     Apply date range filter to the data
     
+    On a DateArchive, only the year/month partitions overlapping the range
+    are read from the snapshot, then filtered to the exact bounds.
+    
     Args:
-        data: DataFrame to filter
+        data: DataFrame to filter, or DateArchive to read
         start_date: Start date for filter (inclusive)
         end_date: End date for filter (inclusive)
         date_column: Column name containing date values
@@ -15,32 +19,9 @@ def apply_date_filter(data, start_date=None, end_date=None, date_column='DATE'):
     Returns:
         Filtered DataFrame
     """
-    if date_column not in data.columns:
-        return data
-    
-    filtered_data = data.copy()
-    
-    # Convert string dates to datetime if needed
-    if start_date and not isinstance(start_date, datetime):
-        try:
-            start_date = pd.to_datetime(start_date)
-        except:
-            start_date = None
-    
-    if end_date and not isinstance(end_date, datetime):
-        try:
-            end_date = pd.to_datetime(end_date)
-        except:
-            end_date = None
-    
-    # Apply filters
-    if start_date:
-        filtered_data = filtered_data[filtered_data[date_column] >= start_date]
-    
-    if end_date:
-        filtered_data = filtered_data[filtered_data[date_column] <= end_date]
-    
-    return filtered_data
+    if isinstance(data, DateArchive):
+        data = data.read(start_date, end_date)
+    return FilterPlan(data).date_range(start_date, end_date, date_column).apply()
 
 def apply_categorical_filter(data, column, values):
     """
@@ -54,18 +35,28 @@ def apply_categorical_filter(data, column, values):
     Returns:
         Filtered DataFrame
     """
-    if column not in data.columns or not values:
-        return data
-    
-    # Convert values to list if not already
-    if not isinstance(values, list):
-        values = [values]
+    return FilterPlan(data).isin(column, values).apply()
+
+def apply_categorical_filters(data, filters):
+    """
+    Apply several categorical filters at once
     
-    # Ensure values are strings for comparison
-    values = [str(val) for val in values]
+    On the loaded data, the filters are combined from the bitmap index
+    (OR of the selected values, AND of the columns) and the rows are
+    selected once.
     
-    # Apply filter
-    return data[data[column].astype(str).isin(values)]
+    Args:
+        data: DataFrame to filter
+        filters: Dictionary of column name to list of values to include
+                 (columns without values are not filtered)
+        
+    Returns:
+        Filtered DataFrame (a new frame even when nothing is filtered)
+    """
+    plan = FilterPlan(data)
+    for column, values in filters.items():
+        plan.isin(column, values)
+    return plan.apply()
 
 def apply_numerical_filter(data, column, min_val=None, max_val=None):
     """
@@ -80,75 +71,116 @@ def apply_numerical_filter(data, column, min_val=None, max_val=None):
     Returns:
         Filtered DataFrame
     """
-    if column not in data.columns:
-        return data
-    
-    filtered_data = data.copy()
-    
-    # Apply filters
-    if min_val is not None:
-        filtered_data = filtered_data[filtered_data[column] >= min_val]
-    
-    if max_val is not None:
-        filtered_data = filtered_data[filtered_data[column] <= max_val]
-    
-    return filtered_data
+    return FilterPlan(data).between(column, min_val, max_val).apply()
 
-def apply_all_filters(data, date_filter=None, categorical_filters=None, numerical_filters=None):
+def apply_all_filters(data, date_filter=None, categorical_filters=None, numerical_filters=None, columns=None):
     """
     Apply all filters to the data
     
+    The filters are collected in a FilterPlan and evaluated together, so the
+    rows are selected once rather than the frame being copied per filter.
+    
     Args:
         data: DataFrame to filter
         date_filter: Dictionary with date filter parameters
         categorical_filters: List of dictionaries with categorical filter parameters
         numerical_filters: List of dictionaries with numerical filter parameters
+        columns: Columns to keep in the result, or None for all
         
     Returns:
         Filtered DataFrame
     """
-    filtered_data = data.copy()
+    plan = FilterPlan(data)
     
-    # Apply date filter
     if date_filter and 'column' in date_filter:
-        filtered_data = apply_date_filter(
-            filtered_data,
-            start_date=date_filter.get('start'),
-            end_date=date_filter.get('end'),
-            date_column=date_filter['column']
-        )
-    
-    # Apply categorical filters
-    if categorical_filters:
-        for cat_filter in categorical_filters:
-            if 'column' in cat_filter and 'values' in cat_filter:
-                filtered_data = apply_categorical_filter(
-                    filtered_data,
-                    column=cat_filter['column'],
-                    values=cat_filter['values']
-                )
-    
-    # Apply numerical filters
-    if numerical_filters:
-        for num_filter in numerical_filters:
-            if 'column' in num_filter:
-                filtered_data = apply_numerical_filter(
-                    filtered_data,
-                    column=num_filter['column'],
-                    min_val=num_filter.get('min'),
-                    max_val=num_filter.get('max')
-                )
-    
-    return filtered_data
+        plan.date_range(date_filter.get('start'), date_filter.get('end'), date_filter['column'])
+    
+    for cat_filter in categorical_filters or []:
+        if 'column' in cat_filter and 'values' in cat_filter:
+            plan.isin(cat_filter['column'], cat_filter['values'])
+    
+    for num_filter in numerical_filters or []:
+        if 'column' in num_filter:
+            plan.between(num_filter['column'], num_filter.get('min'), num_filter.get('max'))
+    
+    return plan.apply(columns)
 
-def calculate_aggregations(data, group_by=None, metrics=None):
+def dashboard_filter_plan(data, start_date=None, end_date=None, chains=None, operations=None, controllers=None, categories=None):
+    """
+    Build the FilterPlan of the dashboard's filter panel
+    
+    Args:
+        data: DataFrame to filter
+        start_date: Start of the period (inclusive)
+        end_date: End of the period (inclusive)
+        chains: Chains to include ('Chaine')
+        operations: Operations to include ('Operation')
+        controllers: Controllers to include ('Controleur')
+        categories: Categories to include ('Categorie')
+        
+    Returns:
+        FilterPlan, to add filters to or evaluate
+    """
+    return (
+        FilterPlan(data)
+        .date_range(start_date, end_date)
+        .isin('Chaine', chains)
+        .isin('Operation', operations)
+        .isin('Controleur', controllers)
+        .isin('Categorie', categories)
+    )
+
+# Column filtered by each dropdown of the dashboard's filter panel (see dashboard_filter_plan)
+DASHBOARD_FACET_COLUMNS = {
+    'chains': 'Chaine',
+    'operations': 'Operation',
+    'controllers': 'Controleur',
+    'categories': 'Categorie'
+}
+
+def dashboard_facets(data, filters=None):
+    """
+    Get the values of the filter panel's dropdowns reachable under the other filters
+    
+    Args:
+        data: Loaded DataFrame
+        filters: Filter values of the panel (dashboard_filter_plan's arguments), or None
+        
+    Returns:
+        Dictionary of facet ('chains', 'operations', 'controllers',
+        'categories') to {value: rows}, counted from the bitmap index
+    """
+    return facet_counts(
+        data, filters or {}, lambda data, filters: dashboard_filter_plan(data, **filters),
+        columns=DASHBOARD_FACET_COLUMNS
+    )
+
+def dropdown_options(counts, selected=None):
+    """
+    Options of a filter dropdown: the reachable values labelled with their rows
+    
+    Args:
+        counts: Value counts of the dropdown's facet (from dashboard_facets)
+        selected: Values selected in the dropdown, kept among the options
+        
+    Returns:
+        List of {'label', 'value'} dictionaries (missing values left out)
+    """
+    return [
+        {"label": f"{value} ({counts.get(value, 0)})", "value": value}
+        for value in facet_options(counts, selected) if value != 'nan'
+    ]
+
+def calculate_aggregations(data, group_by=None, metrics=None, sort_by=None, limit=None):
     """
     Calculate aggregations based on group by columns and metrics
     
     Args:
         data: DataFrame to aggregate
         group_by: List of columns to group by
-        metrics: List of metrics to calculate
+        metrics: List of metrics to calculate (registered in METRIC_REGISTRY, or numeric columns to sum)
+        sort_by: Metric to sort the groups by, largest first (None keeps the group order)
+        limit: Number of groups to keep (the top ones when sorting), or None/0 for all
         
     Returns:
         Aggregated DataFrame
@@ -161,19 +193,10 @@ def calculate_aggregations(data, group_by=None, metrics=None):
     if not existing_group_by:
         return data
     
-    # Ensure all metrics exist
-    existing_metrics = [col for col in metrics if col in data.columns]
-    if not existing_metrics:
-        return data
-    
-    # Create aggregation dictionary
-    agg_dict = {}
-    for metric in existing_metrics:
-        # For simplicity, use sum for all numeric metrics
-        # Could be extended to support different aggregation methods
-        agg_dict[metric] = 'sum'
-    
-    # Group and aggregate
-    grouped_data = data.groupby(existing_group_by).agg(agg_dict).reset_index()
+    # Compute the metrics in one groupby pass, each finalized on the grouped
+    # result (ratios like %CNQ are ratios of sums, see METRIC_REGISTRY), and
+    # keep the top groups by partial selection
+    grouped_data = aggregate_metrics(data, existing_group_by, metrics, sort_by, limit)
     
-    return grouped_data
+    # Without any metric the data can compute, return it as is
+    return data if grouped_data is None else grouped_data